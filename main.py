@@ -1,13 +1,23 @@
 import argparse
+import json
 import logging
 import os
-import shutil
 import sys
 import time
 from datetime import timedelta
 
-from thyme.anafora import anafora_to_brat, brat_to_anafora
-from thyme.utils import ensure_dir
+from thyme.anafora import DEFAULT_PRECEDENCE, anafora_to_brat, brat_to_anafora
+from thyme.batch import batch_convert
+from thyme.brat import merge_brat_dirs
+from thyme.candidates import CANDIDATE_UNITS, generate_candidates
+from thyme.diff import INPUT_FORMATS, diff_dirs
+from thyme.equivalence import check_equivalence
+from thyme.server import serve
+from thyme.shard import merge_shards, parse_shard
+from thyme.stats import compute_corpus_stats, stats_to_json, write_stats_tsv
+from thyme.utils import create_staging_dir, staged_dir, swap_dir, wait_for_cleanup
+from thyme.validate import validate_anafora_dir
+from thyme.watch import watch_anafora_dir
 
 if __name__ == "__main__":
 
@@ -34,6 +44,26 @@ if __name__ == "__main__":
     parser_brat_conversion.add_argument("--overwrite",
                                         help="Overwrite existing documents",
                                         dest="overwrite", action="store_true")
+    parser_brat_conversion.add_argument("--precedence",
+                                        help="Comma-separated annotation file kinds, by decreasing priority, used when "
+                                             "several files are available for a document",
+                                        dest="precedence", type=str, default=",".join(DEFAULT_PRECEDENCE))
+    parser_brat_conversion.add_argument("--watch",
+                                        help="Keep watching the anafora directory and convert documents as soon as "
+                                             "their annotation is completed",
+                                        dest="watch", action="store_true")
+    parser_brat_conversion.add_argument("--watch-interval",
+                                        help="Delay between two anafora directory scans in watch mode (seconds)",
+                                        dest="watch_interval", type=float, default=0.5)
+    parser_brat_conversion.add_argument("--shard",
+                                        help="Only convert the documents of a shard, given as i/N with 0 <= i < N",
+                                        dest="shard", type=str, default=None)
+    parser_brat_conversion.add_argument("--balance-shards",
+                                        help="Balance shards by document size instead of using document ID hashes only",
+                                        dest="balance_shards", action="store_true")
+    parser_brat_conversion.add_argument("--link-text",
+                                        help="Hardlink text documents without corrections instead of copying them",
+                                        dest="link_text", action="store_true")
 
     parser_anafora_conversion = subparsers.add_parser('BRAT-TO-ANAFORA', help="Brat to anafora conversion")
 
@@ -43,9 +73,229 @@ if __name__ == "__main__":
     parser_anafora_conversion.add_argument("--output-dir",
                                            help="Output directory where anafora files will be stored",
                                            dest="output_dir", type=str, required=True)
+    parser_anafora_conversion.add_argument("--preproc-file",
+                                           help="Preprocessing json file, used to report spans against the original "
+                                                "text",
+                                           dest="preproc_file", type=str, required=True)
     parser_anafora_conversion.add_argument("--overwrite",
                                            help="Overwrite existing documents",
                                            dest="overwrite", action="store_true")
+    parser_anafora_conversion.add_argument("--shard",
+                                           help="Only convert the documents of a shard, given as i/N with 0 <= i < N",
+                                           dest="shard", type=str, default=None)
+    parser_anafora_conversion.add_argument("--balance-shards",
+                                           help="Balance shards by document size instead of using document ID hashes "
+                                                "only",
+                                           dest="balance_shards", action="store_true")
+
+    # Thyme corpus conversion of several parts with a shared pool of workers
+    parser_batch_conversion = subparsers.add_parser('BATCH', help="Anafora to brat conversion of several corpus parts")
+
+    parser_batch_conversion.add_argument("--manifest",
+                                         help="Json file listing the corpus parts to convert",
+                                         dest="manifest", type=str, required=True)
+    parser_batch_conversion.add_argument("--preproc-file",
+                                         help="Preprocessing json file",
+                                         dest="preproc_file", type=str, required=True)
+    parser_batch_conversion.add_argument("--precedence",
+                                         help="Comma-separated annotation file kinds, by decreasing priority, used "
+                                              "when several files are available for a document",
+                                         dest="precedence", type=str, default=",".join(DEFAULT_PRECEDENCE))
+    parser_batch_conversion.add_argument("--n-jobs",
+                                         help="Number of worker processes",
+                                         dest="n_jobs", type=int, default=os.cpu_count())
+    parser_batch_conversion.add_argument("--overwrite",
+                                         help="Overwrite existing documents",
+                                         dest="overwrite", action="store_true")
+
+    # Relation candidates for model training
+    parser_candidates = subparsers.add_parser('CANDIDATES', help="Generate labelled relation candidates")
+
+    parser_candidates.add_argument("--input-anafora",
+                                   help="Input anafora annotation directory",
+                                   dest="input_anafora", type=str, required=True)
+    parser_candidates.add_argument("--input-thyme",
+                                   help="Input THYME corpus (text version) directory",
+                                   dest="input_thyme", type=str, required=True)
+    parser_candidates.add_argument("--preproc-file",
+                                   help="Preprocessing json file",
+                                   dest="preproc_file", type=str, required=True)
+    parser_candidates.add_argument("--output-file",
+                                   help="Tsv file where candidates will be written",
+                                   dest="output_file", type=str, required=True)
+    parser_candidates.add_argument("--unit",
+                                   help="Window unit",
+                                   dest="unit", type=str, choices=CANDIDATE_UNITS, default="char")
+    parser_candidates.add_argument("--window",
+                                   help="Maximum distance between the entities of a candidate, in window units",
+                                   dest="window", type=int, default=100)
+    parser_candidates.add_argument("--recall-windows",
+                                   help="Comma-separated window sizes for which the recall of gold relations is "
+                                        "reported",
+                                   dest="recall_windows", type=str, default=None)
+    parser_candidates.add_argument("--kinds",
+                                   help="Comma-separated gold relation kinds",
+                                   dest="kinds", type=str, default="TLINK")
+    parser_candidates.add_argument("--precedence",
+                                   help="Comma-separated annotation file kinds, by decreasing priority, used when "
+                                        "several files are available for a document",
+                                   dest="precedence", type=str, default=",".join(DEFAULT_PRECEDENCE))
+    parser_candidates.add_argument("--n-jobs",
+                                   help="Number of worker processes",
+                                   dest="n_jobs", type=int, default=os.cpu_count())
+    parser_candidates.add_argument("--chunk-size",
+                                   help="Number of candidates written at once",
+                                   dest="chunk_size", type=int, default=10000)
+    parser_candidates.add_argument("--report",
+                                   help="Json file where the candidate report will be written",
+                                   dest="report", type=str, default=None)
+
+    # Comparing two annotation directories
+    parser_diff = subparsers.add_parser('DIFF', help="Compare two brat or anafora annotation directories")
+
+    parser_diff.add_argument("--input-a",
+                             help="First annotation directory",
+                             dest="input_a", type=str, required=True)
+    parser_diff.add_argument("--format-a",
+                             help="First annotation directory format",
+                             dest="format_a", type=str, choices=INPUT_FORMATS, default="brat")
+    parser_diff.add_argument("--input-b",
+                             help="Second annotation directory",
+                             dest="input_b", type=str, required=True)
+    parser_diff.add_argument("--format-b",
+                             help="Second annotation directory format",
+                             dest="format_b", type=str, choices=INPUT_FORMATS, default="brat")
+    parser_diff.add_argument("--input-thyme",
+                             help="Input THYME corpus (text version) directory, required to compare brat and anafora "
+                                  "directories",
+                             dest="input_thyme", type=str, default=None)
+    parser_diff.add_argument("--preproc-file",
+                             help="Preprocessing json file, required to compare brat and anafora directories",
+                             dest="preproc_file", type=str, default=None)
+    parser_diff.add_argument("--n-jobs",
+                             help="Number of worker processes",
+                             dest="n_jobs", type=int, default=os.cpu_count())
+    parser_diff.add_argument("--report",
+                             help="Json file where the differences will be written",
+                             dest="report", type=str, default=None)
+
+    # Checking optimised conversion functions against the reference implementation
+    parser_equivalence = subparsers.add_parser('EQUIVALENCE', help="Compare optimised conversion functions with the "
+                                                                   "reference implementation on random documents")
+
+    parser_equivalence.add_argument("--n-documents",
+                                    help="Number of random documents",
+                                    dest="n_documents", type=int, default=200)
+    parser_equivalence.add_argument("--seed",
+                                    help="Random generator seed",
+                                    dest="seed", type=int, default=0)
+    parser_equivalence.add_argument("--repeat",
+                                    help="Number of timed runs of each conversion path",
+                                    dest="repeat", type=int, default=5)
+    parser_equivalence.add_argument("--report",
+                                    help="Json file where the equivalence report will be written",
+                                    dest="report", type=str, default=None)
+
+    # Merging model predictions into existing brat documents
+    parser_merge = subparsers.add_parser('MERGE', help="Merge brat predictions into existing brat documents")
+
+    parser_merge.add_argument("--input-brat",
+                              help="Brat annotation directory where predictions will be merged",
+                              dest="input_brat", type=str, required=True)
+    parser_merge.add_argument("--predictions",
+                              help="Brat directories containing predictions",
+                              dest="predictions", type=str, nargs="+", required=True)
+
+    # Merging the outputs of a sharded conversion
+    parser_merge_shards = subparsers.add_parser('MERGE-SHARDS', help="Merge the outputs of a sharded conversion")
+
+    parser_merge_shards.add_argument("--input-shards",
+                                     help="Output directories of the shards",
+                                     dest="input_shards", type=str, nargs="+", required=True)
+    parser_merge_shards.add_argument("--output-dir",
+                                     help="Output directory where merged files will be stored",
+                                     dest="output_dir", type=str, required=True)
+    parser_merge_shards.add_argument("--overwrite",
+                                     help="Overwrite existing documents",
+                                     dest="overwrite", action="store_true")
+
+    # Conversion server, documents are converted on demand
+    parser_server = subparsers.add_parser('SERVE', help="Start a server converting documents on demand")
+
+    parser_server.add_argument("--input-anafora",
+                               help="Input anafora annotation directory, used for anafora to brat conversion",
+                               dest="input_anafora", type=str, default=None)
+    parser_server.add_argument("--input-thyme",
+                               help="Input THYME corpus (text version) directory, used for anafora to brat conversion",
+                               dest="input_thyme", type=str, default=None)
+    parser_server.add_argument("--preproc-file",
+                               help="Preprocessing json file",
+                               dest="preproc_file", type=str, required=True)
+    parser_server.add_argument("--input-brat",
+                               help="Input brat annotation directory, used for brat to anafora conversion",
+                               dest="input_brat", type=str, default=None)
+    parser_server.add_argument("--precedence",
+                               help="Comma-separated annotation file kinds, by decreasing priority, used when several "
+                                    "files are available for a document",
+                               dest="precedence", type=str, default=",".join(DEFAULT_PRECEDENCE))
+    parser_server.add_argument("--host",
+                               help="Listening address",
+                               dest="host", type=str, default="127.0.0.1")
+    parser_server.add_argument("--port",
+                               help="Listening port",
+                               dest="port", type=int, default=8001)
+    parser_server.add_argument("--cache-size",
+                               help="Maximum number of cached documents for each conversion direction",
+                               dest="cache_size", type=int, default=256)
+
+    # Corpus statistics
+    parser_stats = subparsers.add_parser('STATS', help="Compute the statistics of a brat or anafora corpus part")
+
+    parser_stats.add_argument("--input-dir",
+                              help="Input annotation directory",
+                              dest="input_dir", type=str, required=True)
+    parser_stats.add_argument("--format",
+                              help="Input annotation directory format",
+                              dest="format", type=str, choices=INPUT_FORMATS, default="anafora")
+    parser_stats.add_argument("--input-thyme",
+                              help="Input THYME corpus (text version) directory, used to count corrected spans of "
+                                   "anafora documents",
+                              dest="input_thyme", type=str, default=None)
+    parser_stats.add_argument("--preproc-file",
+                              help="Preprocessing json file",
+                              dest="preproc_file", type=str, default=None)
+    parser_stats.add_argument("--n-jobs",
+                              help="Number of worker processes",
+                              dest="n_jobs", type=int, default=os.cpu_count())
+    parser_stats.add_argument("--report",
+                              help="Json file where the statistics will be written",
+                              dest="report", type=str, default=None)
+    parser_stats.add_argument("--tsv",
+                              help="Tsv file where the statistics will be written",
+                              dest="tsv", type=str, default=None)
+
+    # Thyme corpus validation, without output
+    parser_validation = subparsers.add_parser('VALIDATE', help="Check that an anafora corpus part can be converted")
+
+    parser_validation.add_argument("--input-anafora",
+                                   help="Input anafora annotation directory",
+                                   dest="input_anafora", type=str, required=True)
+    parser_validation.add_argument("--input-thyme",
+                                   help="Input THYME corpus (text version) directory",
+                                   dest="input_thyme", type=str, required=True)
+    parser_validation.add_argument("--preproc-file",
+                                   help="Preprocessing json file",
+                                   dest="preproc_file", type=str, required=True)
+    parser_validation.add_argument("--precedence",
+                                   help="Comma-separated annotation file kinds, by decreasing priority, used when "
+                                        "several files are available for a document",
+                                   dest="precedence", type=str, default=",".join(DEFAULT_PRECEDENCE))
+    parser_validation.add_argument("--n-jobs",
+                                   help="Number of worker processes",
+                                   dest="n_jobs", type=int, default=os.cpu_count())
+    parser_validation.add_argument("--report",
+                                   help="Json file where the validation report will be written",
+                                   dest="report", type=str, default=None)
 
     args = parser.parse_args()
 
@@ -83,18 +333,42 @@ if __name__ == "__main__":
                 os.path.abspath(args.preproc_file)
             ))
 
-        if os.path.isdir(os.path.abspath(args.output_dir)):
-            shutil.rmtree(os.path.abspath(args.output_dir))
+        shard = parse_shard(args.shard) if args.shard is not None else None
 
-        ensure_dir(args.output_dir)
+        if args.watch and shard is not None:
+            raise Exception("Watch mode cannot be used with sharding")
 
-        # Starting conversion
-        anafora_to_brat(
-            os.path.abspath(args.input_anafora),
-            os.path.abspath(args.input_thyme),
-            os.path.abspath(args.output_dir),
-            os.path.abspath(args.preproc_file)
-        )
+        if args.watch:
+            # Documents are written as they are completed, starting from an empty output directory
+            swap_dir(create_staging_dir(args.output_dir), args.output_dir)
+
+            logging.info("Watching directory {} (press Ctrl+C to stop)".format(os.path.abspath(args.input_anafora)))
+
+            try:
+                watch_anafora_dir(
+                    os.path.abspath(args.input_anafora),
+                    os.path.abspath(args.input_thyme),
+                    os.path.abspath(args.output_dir),
+                    os.path.abspath(args.preproc_file),
+                    precedence=args.precedence.split(","),
+                    interval=args.watch_interval
+                )
+            except KeyboardInterrupt:
+                logging.info("Watch mode stopped")
+
+        else:
+            # Starting conversion in a staging directory which replaces the output directory once completed
+            with staged_dir(args.output_dir) as staging_dir:
+                anafora_to_brat(
+                    os.path.abspath(args.input_anafora),
+                    os.path.abspath(args.input_thyme),
+                    staging_dir,
+                    os.path.abspath(args.preproc_file),
+                    precedence=args.precedence.split(","),
+                    shard=shard,
+                    balance=args.balance_shards,
+                    link_text=args.link_text
+                )
 
     if args.subparser_name == "BRAT-TO-ANAFORA":
 
@@ -114,9 +388,388 @@ if __name__ == "__main__":
                     os.path.abspath(args.output_dir)
                 ))
 
-        brat_to_anafora(input_brat_dir=os.path.abspath(args.input_brat),
-                        output_anafora_dir=os.path.abspath(args.output_dir))
+        # Checking if preprocessing file exists
+        if not os.path.isfile(os.path.abspath(args.preproc_file)):
+            raise FileNotFoundError("The preprocessing file does not exists: {}".format(
+                os.path.abspath(args.preproc_file)
+            ))
+
+        # Starting conversion in a staging directory which replaces the output directory once completed
+        with staged_dir(args.output_dir) as staging_dir:
+            brat_to_anafora(input_brat_dir=os.path.abspath(args.input_brat),
+                            output_anafora_dir=staging_dir,
+                            preproc_file_path=os.path.abspath(args.preproc_file),
+                            shard=parse_shard(args.shard) if args.shard is not None else None,
+                            balance=args.balance_shards)
+
+    if args.subparser_name == "BATCH":
+
+        # Logging to stdout
+        logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(message)s')
+
+        # Checking if manifest file exists
+        if not os.path.isfile(os.path.abspath(args.manifest)):
+            raise FileNotFoundError("The manifest file does not exists: {}".format(
+                os.path.abspath(args.manifest)
+            ))
+
+        # Checking if preprocessing file exists
+        if not os.path.isfile(os.path.abspath(args.preproc_file)):
+            raise FileNotFoundError("The preprocessing file does not exists: {}".format(
+                os.path.abspath(args.preproc_file)
+            ))
+
+        batch_report = batch_convert(
+            json.load(open(os.path.abspath(args.manifest), "r", encoding="UTF-8")),
+            os.path.abspath(args.preproc_file),
+            n_jobs=args.n_jobs,
+            overwrite=args.overwrite,
+            precedence=args.precedence.split(",")
+        )
+
+        for split_name, split_report in batch_report.items():
+            logging.info("[{}] Documents: {}, skipped: {}, corrected entities: {}, worker time: {}, "
+                         "completed after: {}".format(
+                             split_name,
+                             split_report["documents"],
+                             split_report["skipped"],
+                             split_report["corrected_entities"],
+                             timedelta(seconds=round(split_report["worker_time"], 2)),
+                             timedelta(seconds=round(split_report["wall_time"], 2))
+                         ))
+
+        logging.info("[total] Documents: {}, skipped: {}, corrected entities: {}, worker time: {}".format(
+            sum(split_report["documents"] for split_report in batch_report.values()),
+            sum(split_report["skipped"] for split_report in batch_report.values()),
+            sum(split_report["corrected_entities"] for split_report in batch_report.values()),
+            timedelta(seconds=round(sum(split_report["worker_time"] for split_report in batch_report.values()), 2))
+        ))
+
+    if args.subparser_name == "CANDIDATES":
+
+        # Logging to stdout
+        logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(message)s')
+
+        # Checking if input directories exist
+        for input_dir in [args.input_anafora, args.input_thyme]:
+            if not os.path.isdir(os.path.abspath(input_dir)):
+                raise NotADirectoryError("The input directory does not exist: {}".format(
+                    os.path.abspath(input_dir)
+                ))
+
+        # Checking if preprocessing file exists
+        if not os.path.isfile(os.path.abspath(args.preproc_file)):
+            raise FileNotFoundError("The preprocessing file does not exists: {}".format(
+                os.path.abspath(args.preproc_file)
+            ))
+
+        candidate_report = generate_candidates(
+            os.path.abspath(args.input_anafora),
+            os.path.abspath(args.input_thyme),
+            os.path.abspath(args.preproc_file),
+            os.path.abspath(args.output_file),
+            unit=args.unit,
+            window=args.window,
+            recall_windows=[int(size) for size in args.recall_windows.split(",")] if args.recall_windows else None,
+            kinds=args.kinds.split(","),
+            precedence=args.precedence.split(","),
+            n_jobs=args.n_jobs,
+            chunk_size=args.chunk_size
+        )
+
+        logging.info("Documents: {}, skipped documents: {}, candidates: {}, positive candidates: {}".format(
+            candidate_report["documents"],
+            len(candidate_report["skipped"]),
+            candidate_report["candidates"],
+            candidate_report["positives"]
+        ))
+
+        for window_size, recall in candidate_report["recall_by_window"].items():
+            logging.info("Recall of gold relations within {} {} window: {}".format(
+                window_size, args.unit, "{:.3f}".format(recall) if recall is not None else "N/A"
+            ))
+
+        if args.report is not None:
+            with open(os.path.abspath(args.report), "w", encoding="UTF-8") as output_file:
+                json.dump(candidate_report, output_file, indent=2)
+
+    if args.subparser_name == "DIFF":
+
+        # Logging to stdout
+        logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(message)s')
+
+        # Checking if input directories exist
+        for input_dir in [args.input_a, args.input_b] + ([args.input_thyme] if args.input_thyme else []):
+            if not os.path.isdir(os.path.abspath(input_dir)):
+                raise NotADirectoryError("The input directory does not exist: {}".format(
+                    os.path.abspath(input_dir)
+                ))
+
+        # Checking if preprocessing file exists
+        if args.preproc_file is not None and not os.path.isfile(os.path.abspath(args.preproc_file)):
+            raise FileNotFoundError("The preprocessing file does not exists: {}".format(
+                os.path.abspath(args.preproc_file)
+            ))
+
+        diff_report = diff_dirs(os.path.abspath(args.input_a), args.format_a,
+                                os.path.abspath(args.input_b), args.format_b,
+                                input_thyme_path=args.input_thyme,
+                                preproc_file_path=args.preproc_file,
+                                n_jobs=args.n_jobs)
+
+        for document_id in diff_report["only_a"]:
+            logging.info("[{}] Document only found in the first directory".format(document_id))
+
+        for document_id in diff_report["only_b"]:
+            logging.info("[{}] Document only found in the second directory".format(document_id))
+
+        for document_id, differences in sorted(diff_report["differences"].items()):
+            for entity_type, spans in differences["entities_only_a"]:
+                logging.info("[{}] - entity {} {}".format(document_id, entity_type, spans))
+
+            for entity_type, spans in differences["entities_only_b"]:
+                logging.info("[{}] + entity {} {}".format(document_id, entity_type, spans))
+
+            for (entity_type, spans), attribute, value_a, value_b in differences["attributes"]:
+                logging.info("[{}] ~ attribute {} of entity {} {}: {} -> {}".format(
+                    document_id, attribute, entity_type, spans, value_a, value_b
+                ))
+
+            for relation_type, arg1, arg2 in differences["relations_only_a"]:
+                logging.info("[{}] - relation {} {} {}".format(document_id, relation_type, arg1, arg2))
+
+            for relation_type, arg1, arg2 in differences["relations_only_b"]:
+                logging.info("[{}] + relation {} {} {}".format(document_id, relation_type, arg1, arg2))
+
+        logging.info("Identical documents: {}, different documents: {}, missing documents: {}".format(
+            len(diff_report["identical"]),
+            len(diff_report["differences"]),
+            len(diff_report["only_a"]) + len(diff_report["only_b"])
+        ))
+
+        if args.report is not None:
+            with open(os.path.abspath(args.report), "w", encoding="UTF-8") as output_file:
+                json.dump(diff_report, output_file, indent=2)
+
+    if args.subparser_name == "EQUIVALENCE":
+
+        # Logging to stdout
+        logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(message)s')
+
+        equivalence_report = check_equivalence(n_documents=args.n_documents, seed=args.seed, repeat=args.repeat)
+
+        for path, path_report in equivalence_report.items():
+            for mismatch in path_report["mismatches"]:
+                logging.info("[{}] {}: {}".format(path, mismatch["document"], mismatch["reason"]))
+
+            logging.info("[{}] Documents: {}, failing in both implementations: {}, mismatches: {}, "
+                         "speed-up: {:.2f}".format(
+                             path,
+                             path_report["documents"],
+                             path_report["failing_documents"],
+                             len(path_report["mismatches"]),
+                             path_report["speedup"] or 0.0
+                         ))
+
+        if args.report is not None:
+            with open(os.path.abspath(args.report), "w", encoding="UTF-8") as output_file:
+                json.dump(equivalence_report, output_file, indent=2)
+
+    if args.subparser_name == "MERGE":
+
+        # Logging to stdout
+        logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(message)s')
+
+        # Checking if brat directories exist
+        for brat_dir in [args.input_brat] + args.predictions:
+            if not os.path.isdir(os.path.abspath(brat_dir)):
+                raise NotADirectoryError("The input brat directory does not exist: {}".format(
+                    os.path.abspath(brat_dir)
+                ))
+
+        merge_counts = merge_brat_dirs(os.path.abspath(args.input_brat),
+                                       [os.path.abspath(prediction_dir) for prediction_dir in args.predictions])
+
+        logging.info("Merged documents: {}, skipped documents: {}".format(
+            merge_counts["documents"], merge_counts["skipped"]
+        ))
+        logging.info("Added entities: {}, attributes: {}, relations: {}".format(
+            merge_counts["entities"], merge_counts["attributes"], merge_counts["relations"]
+        ))
+        logging.info("Skipped duplicates: {}, conflicts: {}".format(
+            merge_counts["duplicates"], merge_counts["conflicts"]
+        ))
+
+    if args.subparser_name == "MERGE-SHARDS":
+
+        # Logging to stdout
+        logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(message)s')
+
+        # Checking if shard directories exist
+        for shard_dir in args.input_shards:
+            if not os.path.isdir(os.path.abspath(shard_dir)):
+                raise NotADirectoryError("The shard directory does not exist: {}".format(
+                    os.path.abspath(shard_dir)
+                ))
+
+        if not args.overwrite:
+            if os.path.isdir(os.path.abspath(args.output_dir)):
+                logging.info("The output directory already exists, use the appropriate launcher flag to overwrite")
+                raise IsADirectoryError("The output directory already exists: {}".format(
+                    os.path.abspath(args.output_dir)
+                ))
+
+        # Merging in a staging directory which replaces the output directory once completed
+        with staged_dir(args.output_dir) as staging_dir:
+            merged_stats = merge_shards([os.path.abspath(shard_dir) for shard_dir in args.input_shards], staging_dir)
+
+        logging.info("Merged shards: {}, documents: {}, skipped documents: {}".format(
+            len(args.input_shards), len(merged_stats["documents"]), len(merged_stats["skipped"])
+        ))
+
+        if merged_stats["format"] == "brat":
+            logging.info("Number of corrected entities: {}".format(merged_stats["corrected_entities"]))
+
+    if args.subparser_name == "SERVE":
+
+        # Logging to stdout
+        logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(message)s')
+
+        # Checking that at least one conversion direction is enabled
+        if (args.input_anafora is None) != (args.input_thyme is None):
+            raise Exception("The options --input-anafora and --input-thyme must be given together")
+
+        if args.input_anafora is None and args.input_brat is None:
+            raise Exception("The server requires --input-anafora and --input-thyme, --input-brat, or both")
+
+        # Checking if input directories exist
+        for input_dir in [args.input_anafora, args.input_thyme, args.input_brat]:
+            if input_dir is None:
+                continue
+
+            if not os.path.isdir(os.path.abspath(input_dir)):
+                raise NotADirectoryError("The input directory does not exist: {}".format(
+                    os.path.abspath(input_dir)
+                ))
+
+        # Checking if preprocessing file exists
+        if not os.path.isfile(os.path.abspath(args.preproc_file)):
+            raise FileNotFoundError("The preprocessing file does not exists: {}".format(
+                os.path.abspath(args.preproc_file)
+            ))
+
+        try:
+            serve(
+                args.input_anafora,
+                args.input_thyme,
+                os.path.abspath(args.preproc_file),
+                input_brat_path=args.input_brat,
+                precedence=args.precedence.split(","),
+                host=args.host,
+                port=args.port,
+                cache_size=args.cache_size
+            )
+        except KeyboardInterrupt:
+            logging.info("Server stopped")
+
+    if args.subparser_name == "STATS":
+
+        # Logging to stdout
+        logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(message)s')
+
+        # Checking if input directories exist
+        for input_dir in [args.input_dir] + ([args.input_thyme] if args.input_thyme else []):
+            if not os.path.isdir(os.path.abspath(input_dir)):
+                raise NotADirectoryError("The input directory does not exist: {}".format(
+                    os.path.abspath(input_dir)
+                ))
+
+        # Checking if preprocessing file exists
+        if args.preproc_file is not None and not os.path.isfile(os.path.abspath(args.preproc_file)):
+            raise FileNotFoundError("The preprocessing file does not exists: {}".format(
+                os.path.abspath(args.preproc_file)
+            ))
+
+        corpus_stats = compute_corpus_stats(
+            os.path.abspath(args.input_dir),
+            args.format,
+            input_thyme_path=os.path.abspath(args.input_thyme) if args.input_thyme else None,
+            preproc_file_path=os.path.abspath(args.preproc_file) if args.preproc_file else None,
+            n_jobs=args.n_jobs
+        )
+
+        logging.info("Documents: {}, skipped documents: {}, entities: {}, relations: {}".format(
+            corpus_stats["documents"],
+            corpus_stats["skipped"],
+            sum(corpus_stats["counts"][entity_type] for entity_type in corpus_stats["span_lengths"]),
+            corpus_stats["counts"]["TLINK"] + corpus_stats["counts"]["ALINK"]
+        ))
+
+        if args.format == "anafora" and args.input_thyme is not None:
+            logging.info("Number of corrected spans: {}".format(corpus_stats["corrected_spans"]))
+
+        if args.report is not None:
+            with open(os.path.abspath(args.report), "w", encoding="UTF-8") as output_file:
+                json.dump(stats_to_json(corpus_stats), output_file, indent=2)
+
+        if args.tsv is not None:
+            write_stats_tsv(corpus_stats, os.path.abspath(args.tsv))
+
+    if args.subparser_name == "VALIDATE":
+
+        # Logging to stdout
+        logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(asctime)s %(message)s')
+
+        # Checking if input anafora directory exists
+        if not os.path.isdir(os.path.abspath(args.input_anafora)):
+            raise NotADirectoryError("The input anafora directory does not exist: {}".format(
+                os.path.abspath(args.input_anafora)
+            ))
+
+        # Checking if input THYME text directory exists
+        if not os.path.isdir(os.path.abspath(args.input_thyme)):
+            raise NotADirectoryError("The input text directory does not exist: {}".format(
+                os.path.abspath(args.input_thyme)
+            ))
+
+        # Checking if preprocessing file exists
+        if not os.path.isfile(os.path.abspath(args.preproc_file)):
+            raise FileNotFoundError("The preprocessing file does not exists: {}".format(
+                os.path.abspath(args.preproc_file)
+            ))
+
+        report = validate_anafora_dir(
+            os.path.abspath(args.input_anafora),
+            os.path.abspath(args.input_thyme),
+            os.path.abspath(args.preproc_file),
+            precedence=args.precedence.split(","),
+            n_jobs=args.n_jobs
+        )
+
+        for violation in report["violations"]:
+            logging.info("[{}] {}: {}".format(violation["check"], violation["file"], violation["message"]))
+
+        logging.info("Checked documents: {}, skipped documents: {}, violations: {}".format(
+            len(report["checked"]),
+            len(report["skipped"]),
+            len(report["violations"])
+        ))
+
+        if args.report is not None:
+            with open(os.path.abspath(args.report), "w", encoding="UTF-8") as output_file:
+                json.dump(report, output_file, indent=2)
+
+    # Previous output directories are deleted in background, the command is done once they are removed
+    wait_for_cleanup()
 
     end = time.time()
 
     logging.info("Done ! (Time elapsed: {})".format(timedelta(seconds=round(end - start))))
+
+    # Validation failure is reported through the exit status
+    if args.subparser_name == "VALIDATE" and len(report["violations"]) > 0:
+        sys.exit(1)
+
+    if args.subparser_name == "EQUIVALENCE" and any(path_report["mismatches"]
+                                                    for path_report in equivalence_report.values()):
+        sys.exit(1)
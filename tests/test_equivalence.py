@@ -0,0 +1,36 @@
+import pytest
+
+from thyme.equivalence import check_equivalence, compare_path
+
+
+@pytest.fixture(scope="module")
+def equivalence_report():
+    return check_equivalence(n_documents=100, seed=0, repeat=1)
+
+
+@pytest.mark.parametrize("path", ["parse_ann_file", "anafora_to_brat", "brat_to_anafora"])
+def test_optimised_paths_match_reference(equivalence_report, path):
+    path_report = equivalence_report[path]
+
+    assert path_report["documents"] == 100
+    assert path_report["mismatches"] == []
+
+    # Generated documents are mostly valid, only a few are malformed on purpose
+    assert path_report["failing_documents"] <= 10
+
+
+def test_different_exception_messages_are_mismatches(tmp_path):
+    documents = [("ID000_clinic_000", None, None, None), ("ID001_clinic_001", None, None, None)]
+
+    def reference_function(document, output_dir):
+        raise ValueError("reference message")
+
+    def optimised_function(document, output_dir):
+        if document[0] == "ID000_clinic_000":
+            raise ValueError("reference message")
+        raise ValueError("optimised message")
+
+    path_report = compare_path(documents, reference_function, optimised_function, None, str(tmp_path), 1)
+
+    assert path_report["failing_documents"] == 1
+    assert [mismatch["document"] for mismatch in path_report["mismatches"]] == ["ID001_clinic_001"]
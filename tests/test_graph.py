@@ -0,0 +1,127 @@
+import itertools
+import random
+
+import pytest
+
+from thyme.graph import RelationGraph
+from thyme.models import Relation
+
+
+def naive_closure(relations: list = None) -> (set, set):
+    """
+    Close CONTAINS and BEFORE relations by applying the inference rules until nothing changes
+
+    Args:
+        relations (list): (source, relation type, target) triples
+
+    Returns:
+        (set, set): closed CONTAINS and BEFORE pairs
+    """
+
+    contains = {(a, b) for a, relation_type, b in relations if relation_type == "CONTAINS"}
+    before = {(a, b) for a, relation_type, b in relations if relation_type == "BEFORE"}
+
+    changed = True
+    while changed:
+        changed = False
+
+        new_contains = {(a, d) for a, b in contains for c, d in contains if b == c} - contains
+
+        new_before = {(a, d) for a, b in before for c, d in before if b == c}
+        new_before |= {(x, y) for a, x in contains for b, y in before if a == b}
+        new_before |= {(x, y) for x, b in before for c, y in contains if b == c}
+        new_before -= before
+
+        if new_contains or new_before:
+            contains |= new_contains
+            before |= new_before
+            changed = True
+
+    return contains, before
+
+
+def is_consistent(relations: list = None) -> bool:
+    """
+    Check that closed relations contain no cycle, no BEFORE between nested entities and no BEFORE between
+    overlapping entities
+
+    Args:
+        relations (list): (source, relation type, target) triples
+
+    Returns:
+        bool: 'True' if the relations are consistent
+    """
+
+    contains, before = naive_closure(relations)
+    overlap = {(a, b) for a, relation_type, b in relations if relation_type == "OVERLAP"}
+
+    if any(a == b for a, b in contains | before):
+        return False
+
+    return not any((a, b) in contains or (b, a) in contains or (a, b) in overlap or (b, a) in overlap
+                   for a, b in before)
+
+
+def generate_relations(rng: random.Random = None,
+                       n_entities: int = None,
+                       n_relations: int = None) -> list:
+    """
+    Generate random TLINK relations between a few entities
+
+    Args:
+        rng (random.Random): random generator
+        n_entities (int): number of entities
+        n_relations (int): number of relations
+
+    Returns:
+        list: (source, relation type, target) triples
+    """
+
+    entities = ["E{}".format(i) for i in range(n_entities)]
+
+    return [
+        (rng.choice(entities), rng.choice(["CONTAINS", "CONTAINS", "BEFORE", "BEFORE", "OVERLAP"]), rng.choice(entities))
+        for _ in range(n_relations)
+    ]
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_closure_and_contradictions_match_naive_fixpoint(seed):
+    rng = random.Random(seed)
+    relations = generate_relations(rng, rng.randrange(2, 9), rng.randrange(1, 25))
+
+    graph = RelationGraph()
+    accepted = list()
+
+    for relation in relations:
+        expected = is_consistent(accepted + [relation])
+        assert graph.add_relation(*relation) == expected
+
+        if expected:
+            accepted.append(relation)
+
+    contains, before = naive_closure(accepted)
+
+    assert set(graph.get_closure()) == {(a, "CONTAINS", b) for a, b in contains} | {(a, "BEFORE", b) for a, b in before}
+    assert len(graph.contradictions) == len(relations) - len(accepted)
+
+    for a, b in itertools.product(graph.ids, repeat=2):
+        assert graph.has_relation(a, "CONTAINS", b) == ((a, b) in contains)
+        assert graph.has_relation(a, "BEFORE", b) == ((a, b) in before)
+
+
+def test_relation_records_and_dictionaries_build_the_same_graph():
+    relations = [
+        {"id": "1@r", "type": "TLINK", "properties": {"Source": "1@e", "Type": "CONTAINS", "Target": "2@e"}},
+        {"id": "2@r", "type": "TLINK", "properties": {"Source": "2@e", "Type": "BEFORE", "Target": "3@e"}},
+        {"id": "3@r", "type": "ALINK", "properties": {"Source": "3@e", "Type": "INITIATES", "Target": "1@e"}},
+        {"id": "4@r", "type": "TLINK", "properties": {"Source": "3@e", "Type": "CONTAINS", "Target": "2@e"}}
+    ]
+
+    from_dicts = RelationGraph.from_anafora_relations(relations)
+    from_records = RelationGraph.from_anafora_relations([Relation.from_dict(relation) for relation in relations])
+
+    assert set(from_records.get_closure()) == set(from_dicts.get_closure())
+    assert from_records.contradictions == from_dicts.contradictions
+    assert from_records.has_relation("3@e", "INITIATES", "1@e")
+    assert [reason for _, _, _, reason in from_records.contradictions] == ["nested entities ordered by BEFORE"]
@@ -0,0 +1,102 @@
+import random
+
+import pytest
+
+from thyme.intervals import SpanIndex
+
+
+def generate_entities(rng: random.Random = None,
+                      n_entities: int = None,
+                      length: int = 200) -> dict:
+    """
+    Generate random entities with nested, overlapping, split and zero-length spans
+
+    Args:
+        rng (random.Random): random generator
+        n_entities (int): number of entities
+        length (int): document length
+
+    Returns:
+        dict: span list by entity key
+    """
+
+    entities = dict()
+
+    for key in range(n_entities):
+        spans = list()
+        for _ in range(rng.choice([1, 1, 1, 2, 3])):
+            begin = rng.randrange(length)
+            spans.append((begin, min(length, begin + rng.choice([0, 1, 3, 8, 20, 60]))))
+        entities[key] = spans
+
+    return entities
+
+
+def brute_overlapping(entities, begin, end):
+    return {key for key, spans in entities.items() if any(b < end and e > begin for b, e in spans)}
+
+
+def brute_containing(entities, begin, end):
+    return {key for key, spans in entities.items() if any(b <= begin and e >= end for b, e in spans)}
+
+
+def brute_contained(entities, begin, end):
+    return {key for key, spans in entities.items() if spans and all(begin <= b and e <= end for b, e in spans)}
+
+
+def brute_nearest_distances(entities, begin, end, exclude):
+    ignored = brute_overlapping(entities, begin, end) | exclude
+    fragments = [(b, e) for key, spans in entities.items() if key not in ignored for b, e in spans]
+
+    left = [begin - e for b, e in fragments if e <= begin]
+    right = [b - end for b, e in fragments if b >= end]
+
+    return min(left) if left else None, min(right) if right else None
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_queries_match_brute_force(seed):
+    rng = random.Random(seed)
+    entities = generate_entities(rng, rng.randrange(0, 60))
+    index = SpanIndex(entities)
+
+    for _ in range(200):
+        begin = rng.randrange(210)
+        end = begin + rng.choice([0, 0, 1, 5, 20, 80])
+
+        assert index.overlapping(begin, end) == brute_overlapping(entities, begin, end)
+        assert index.containing(begin, end) == brute_containing(entities, begin, end)
+        assert index.contained(begin, end) == brute_contained(entities, begin, end)
+
+        exclude = set(rng.sample(sorted(entities), min(len(entities), rng.randrange(3))))
+        left, right = index.nearest(begin, end, exclude)
+        left_distance, right_distance = brute_nearest_distances(entities, begin, end, exclude)
+
+        assert (left[1] if left else None) == left_distance
+        assert (right[1] if right else None) == right_distance
+
+        if left:
+            assert any(e == begin - left[1] for _, e in entities[left[0]])
+        if right:
+            assert any(b == end + right[1] for b, _ in entities[right[0]])
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_overlapping_pairs_match_brute_force(seed):
+    rng = random.Random(seed)
+    entities = generate_entities(rng, rng.randrange(0, 60))
+
+    expected = {
+        tuple(sorted((a, b), key=str))
+        for a in entities for b in entities
+        if a != b and any(ba < eb and bb < ea for ba, ea in entities[a] for bb, eb in entities[b])
+    }
+
+    assert SpanIndex(entities).overlapping_pairs() == expected
+
+
+def test_contained_zero_length_fragment_at_span_end():
+    index = SpanIndex({"a": [(10, 10)], "b": [(4, 10)], "c": [(10, 12)]})
+
+    assert index.contained(4, 10) == {"a", "b"}
+    assert index.containing(10, 10) == {"a", "b", "c"}
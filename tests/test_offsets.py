@@ -0,0 +1,112 @@
+import random
+
+import pytest
+
+from thyme import offsets, reference
+from thyme.offsets import OffsetMap, apply_replacements
+
+
+def generate_replacements(rng: random.Random = None,
+                          length: int = None,
+                          order: str = None) -> list:
+    """
+    Generate sequential replacements sorted by position, changing the text length or not
+
+    Args:
+        rng (random.Random): random generator
+        length (int): original text length
+        order (str): 'ascending' or 'descending'
+
+    Returns:
+        list: (begin, end, replacement text) triples, offsets of each replacement referring to the text produced by
+            the previous ones
+    """
+
+    bounds = sorted(rng.sample(range(length + 1), 2 * rng.randrange(1, 6)))
+    regions = list(zip(bounds[::2], bounds[1::2]))
+    texts = [rng.choice(["", "X", "XXXXXXXX", "Y" * (end - begin)]) for begin, end in regions]
+
+    if order == "descending":
+        return [(begin, end, text) for (begin, end), text in reversed(list(zip(regions, texts)))]
+
+    replacements = list()
+    delta = 0
+    for (begin, end), text in zip(regions, texts):
+        replacements.append((begin + delta, end + delta, text))
+        delta += len(text) - (end - begin)
+
+    return replacements
+
+
+def generate_spans(rng: random.Random = None,
+                   length: int = None) -> list:
+    """
+    Generate random spans, zero-length ones included
+
+    Args:
+        rng (random.Random): random generator
+        length (int): text length
+
+    Returns:
+        list: (begin, end) tuples
+    """
+
+    spans = list()
+    for _ in range(rng.randrange(1, 40)):
+        begin = rng.randrange(length + 1)
+        spans.append((begin, rng.randrange(begin, length + 1)))
+
+    return spans
+
+
+@pytest.mark.parametrize("seed", range(50))
+@pytest.mark.parametrize("order", ["ascending", "descending"])
+def test_span_mapping_matches_sequential_replacements(seed, order):
+    rng = random.Random(seed)
+    content = "".join(rng.choice("ab \n") for _ in range(rng.randrange(10, 80)))
+    replacements = generate_replacements(rng, len(content), order)
+
+    offset_map = OffsetMap.from_replacements(replacements)
+    corrected = apply_replacements(content, replacements)
+
+    original_spans = generate_spans(rng, len(content))
+    corrected_spans = generate_spans(rng, len(corrected))
+
+    assert offset_map.spans_to_corrected(original_spans) == [
+        (reference.map_offset(begin, False, replacements), reference.map_offset(end, True, replacements))
+        for begin, end in original_spans
+    ]
+
+    assert offset_map.spans_to_original(corrected_spans) == [
+        (reference.map_offset(begin, False, replacements, to_original=True),
+         reference.map_offset(end, True, replacements, to_original=True))
+        for begin, end in corrected_spans
+    ]
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_vectorised_mapping_matches_merge_pass(seed):
+    pytest.importorskip("numpy")
+
+    rng = random.Random(seed)
+    length = rng.randrange(10, 80)
+
+    # Replacements in any order, merged into edits one by one
+    replacements = list()
+    current_length = length
+    for _ in range(rng.randrange(1, 8)):
+        begin = rng.randrange(current_length + 1)
+        end = rng.randrange(begin, min(current_length, begin + 10) + 1)
+        text = rng.choice(["", "X", "XXXXXXXX"])
+        replacements.append((begin, end, text))
+        current_length += len(text) - (end - begin)
+
+    offset_map = OffsetMap.from_replacements(replacements)
+
+    for spans, edits in [
+        (generate_spans(rng, length), (offset_map.original_begins, offset_map.original_ends,
+                                       offset_map.corrected_begins, offset_map.corrected_ends)),
+        (generate_spans(rng, current_length), (offset_map.corrected_begins, offset_map.corrected_ends,
+                                               offset_map.original_begins, offset_map.original_ends))
+    ]:
+        assert offsets.map_spans_numpy(spans, *edits) == offsets.map_spans_merge(spans, *edits)
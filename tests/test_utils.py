@@ -0,0 +1,169 @@
+import os
+import shutil
+
+import pytest
+
+from thyme.anafora import get_corrected_txt_content
+from thyme.utils import copy_file, staged_dir, wait_for_cleanup
+
+CONTENTS = [
+    b"",
+    b"tumor biopsy today\n",
+    b"no trailing line break",
+    b"carriage returns\r\nand\rlone ones\r\n",
+    b"\xef\xbb\xbfbyte order mark\n",
+    "naïve résection œdème 肿瘤 😀\n\n".encode("UTF-8"),
+    "colectomy x-ray\n".encode("UTF-8") * 100000
+]
+
+
+def write_previous(source_filepath: str = None,
+                   target_filepath: str = None) -> None:
+    """
+    Write a text document as the conversion did before copying files: decoded, then written back in text mode
+
+    Args:
+        source_filepath (str): source filepath
+        target_filepath (str): target filepath
+
+    Returns:
+        None
+    """
+
+    txt_content = get_corrected_txt_content(source_filepath, {"replace": dict(), "duplicates": list()})
+
+    with open(target_filepath, "w", encoding="UTF-8") as output_file:
+        output_file.write(txt_content)
+
+
+def read_bytes(filepath: str = None) -> bytes:
+    with open(filepath, "rb") as input_file:
+        return input_file.read()
+
+
+@pytest.mark.skipif(os.linesep != "\n", reason="text documents are only copied when line breaks are not translated")
+@pytest.mark.parametrize("content", CONTENTS)
+@pytest.mark.parametrize("link", [False, True])
+def test_copy_matches_previous_write(tmp_path, content, link):
+    source_filepath = str(tmp_path / "ID001_clinic_001")
+
+    with open(source_filepath, "wb") as output_file:
+        output_file.write(content)
+
+    write_previous(source_filepath, str(tmp_path / "previous.txt"))
+    copy_file(source_filepath, str(tmp_path / "copied.txt"), link=link)
+
+    assert read_bytes(str(tmp_path / "copied.txt")) == read_bytes(str(tmp_path / "previous.txt")) == content
+
+
+def test_copy_does_not_write_through_previous_link(tmp_path):
+    source_filepath = str(tmp_path / "source")
+    other_filepath = str(tmp_path / "other")
+    target_filepath = str(tmp_path / "target")
+
+    with open(source_filepath, "wb") as output_file:
+        output_file.write(b"source\n")
+    with open(other_filepath, "wb") as output_file:
+        output_file.write(b"other\n")
+
+    copy_file(source_filepath, target_filepath, link=True)
+    copy_file(other_filepath, target_filepath)
+
+    assert read_bytes(source_filepath) == b"source\n"
+    assert read_bytes(target_filepath) == b"other\n"
+
+
+@pytest.mark.skipif(not hasattr(os, "copy_file_range"), reason="copy_file_range is not available")
+def test_copy_falls_back_after_partial_copy(tmp_path, monkeypatch):
+    source_filepath = str(tmp_path / "source")
+    target_filepath = str(tmp_path / "target")
+    content = "colectomy x-ray\n".encode("UTF-8") * 1000
+
+    with open(source_filepath, "wb") as output_file:
+        output_file.write(content)
+
+    calls = list()
+
+    def failing_copy_file_range(src, dst, count, *args, **kwargs):
+        # Copying a first chunk, then failing as an unsupported file system would
+        if calls:
+            raise OSError("copy_file_range failed")
+        calls.append(count)
+        return os.write(dst, os.read(src, 100))
+
+    monkeypatch.setattr(os, "copy_file_range", failing_copy_file_range)
+
+    # The fallback must not start from the partial copy
+    target_exists = list()
+    copyfile = shutil.copyfile
+
+    def checking_copyfile(src, dst, *args, **kwargs):
+        target_exists.append(os.path.lexists(dst))
+        return copyfile(src, dst, *args, **kwargs)
+
+    monkeypatch.setattr(shutil, "copyfile", checking_copyfile)
+
+    copy_file(source_filepath, target_filepath)
+
+    assert target_exists == [False]
+    assert read_bytes(target_filepath) == content
+
+
+@pytest.mark.skipif(not hasattr(os, "copy_file_range"), reason="copy_file_range is not available")
+def test_failed_copy_leaves_no_target(tmp_path, monkeypatch):
+    source_filepath = str(tmp_path / "source")
+    target_filepath = str(tmp_path / "target")
+
+    with open(source_filepath, "wb") as output_file:
+        output_file.write(b"tumor biopsy today\n" * 100)
+
+    def failing_copy_file_range(src, dst, count, *args, **kwargs):
+        raise OSError("copy_file_range failed")
+
+    def failing_copyfile(src, dst, *args, **kwargs):
+        with open(dst, "wb") as output_file:
+            output_file.write(b"tumor")
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(os, "copy_file_range", failing_copy_file_range)
+    monkeypatch.setattr(shutil, "copyfile", failing_copyfile)
+
+    with pytest.raises(OSError):
+        copy_file(source_filepath, target_filepath)
+
+    assert not os.path.lexists(target_filepath)
+
+
+def test_staged_output_replaces_previous_one(tmp_path):
+    target_dir = str(tmp_path / "train")
+
+    for generation in ["first", "second", "third"]:
+        with staged_dir(target_dir) as staging_dir:
+            os.makedirs(os.path.join(staging_dir, "documents"))
+            with open(os.path.join(staging_dir, "generation"), "w", encoding="UTF-8") as output_file:
+                output_file.write(generation)
+
+        wait_for_cleanup()
+
+        # Only the new output is left once the command is completed
+        assert sorted(os.listdir(str(tmp_path))) == ["train"]
+        assert read_bytes(os.path.join(target_dir, "generation")) == generation.encode("UTF-8")
+
+
+def test_failed_staged_output_keeps_previous_one(tmp_path):
+    target_dir = str(tmp_path / "train")
+    os.makedirs(target_dir)
+
+    with open(os.path.join(target_dir, "generation"), "w", encoding="UTF-8") as output_file:
+        output_file.write("first")
+
+    with pytest.raises(ValueError):
+        with staged_dir(target_dir) as staging_dir:
+            with open(os.path.join(staging_dir, "generation"), "w", encoding="UTF-8") as output_file:
+                output_file.write("second")
+            raise ValueError("conversion failed")
+
+    wait_for_cleanup()
+
+    assert sorted(os.listdir(str(tmp_path))) == ["train"]
+    assert read_bytes(os.path.join(target_dir, "generation")) == b"first"
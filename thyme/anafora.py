@@ -8,23 +8,43 @@ import time
 from lxml import etree
 
 from .brat import generate_brat_conf_files, parse_ann_file
-from .utils import ensure_dir
+from .models import Entity, Relation, intern_string
+from .offsets import OffsetMap, apply_replacements
+from .shard import select_shard_documents, write_shard_stats
+from .utils import copy_file, ensure_dir, translate_newlines
 
 REGEX_TEMPORAL_FILE = re.compile(r".*\.Temporal-(Relation|Entity).(gold|system).completed.xml")
 
+# Annotation file kinds, by decreasing priority, used when several files are available for a document
+DEFAULT_PRECEDENCE = [
+    "Temporal-Relation.gold",
+    "Temporal-Entity.gold",
+    "Temporal-Relation.system",
+    "Temporal-Entity.system"
+]
+
 
 def anafora_to_brat(input_anafora_path: str = None,
                     input_thyme_path: str = None,
                     output_brat_path: str = None,
-                    preproc_file_path: str = None) -> None:
+                    preproc_file_path: str = None,
+                    precedence: list = None,
+                    shard: tuple = None,
+                    balance: bool = False,
+                    link_text: bool = False) -> None:
     """
-    Convert a THYME corpus part to brat format
+    Convert a THYME corpus part to brat format. When a shard is given, only the documents of this shard are converted
+    and shard statistics are written in the output directory (see thyme.shard.merge_shards).
 
     Args:
         input_anafora_path (str): annotation path (anafora format)
         input_thyme_path (str): corpus path (text format)
         output_brat_path(str): output path where brat files will be created
         preproc_file_path (str): preprocessing filepath (json format)
+        precedence (list): annotation file kinds by decreasing priority (see DEFAULT_PRECEDENCE)
+        shard (tuple): shard index and number of shards
+        balance (bool): balance shards by document size
+        link_text (bool): hardlink text documents without corrections instead of copying them
 
     Returns:
         None
@@ -35,106 +55,54 @@ def anafora_to_brat(input_anafora_path: str = None,
     # Loading json content
     preproc_payload = json.load(open(os.path.abspath(preproc_file_path), "r", encoding="UTF-8"))
 
-    for root, dirs, files in os.walk(os.path.abspath(input_anafora_path)):
-        for filename in files:
-            if REGEX_TEMPORAL_FILE.match(filename):
-
-                # Computing source file paths (txt and anafora formats)
-                source_anafora_file = os.path.join(root, filename)
-                source_txt_file = os.path.join(
-                    os.path.abspath(input_thyme_path),
-                    filename.split(".")[0]
-                )
-
-                # Checking is text annotation is in progress, skipping file if it is the case
-                if is_in_progress(source_anafora_file):
-                    logging.info("Skipping file {}. Reason: annotation in progress.".format(
-                        os.path.basename(source_anafora_file)
-                    ))
-                    continue
+    # Selecting one annotation file per document
+    work_items, conflicts = plan_anafora_documents(input_anafora_path, precedence)
+
+    for document_id, (source_anafora_file, discarded_files) in sorted(conflicts.items()):
+        logging.info("Several annotation files for document {}, using {}. Discarded: {}".format(
+            document_id,
+            os.path.basename(source_anafora_file),
+            ", ".join([os.path.basename(filepath) for filepath in discarded_files])
+        ))
+
+    # Keeping the documents of the current shard
+    if shard is not None:
+        shard_documents = select_shard_documents(dict(work_items), shard[0], shard[1], balance)
+        work_items = [(document_id, filepath) for document_id, filepath in work_items if document_id in shard_documents]
 
-                # Computing target brat file paths
-                target_ann_file = os.path.join(
-                    os.path.abspath(output_brat_path),
-                    "{}.ann".format(filename.split(".")[0])
-                )
-                target_txt_file = os.path.join(
-                    os.path.abspath(output_brat_path),
-                    "{}.txt".format(filename.split(".")[0])
-                )
-
-                # Copying and correcting if necessary text document
-                correct_and_copy_txt_file(source_txt_file, target_txt_file, preproc_payload)
-
-                # Fetching entities and relations from anofora file
-                entities = get_anafora_entities(source_anafora_file)
-                relations = get_anafora_relations(source_anafora_file)
-
-                # Correcting entity spans and assigning a brat ID to entities
-                corrected_entities, nb = correct_entity_spans(entities, target_txt_file)
-                corrected_entities, last_entity_id = assign_brat_id(corrected_entities)
-
-                corrected_entities_nb += nb
-
-                # Computing brat relations and assigning a brat ID to relations
-                corrected_relations = compute_brat_relations(relations, corrected_entities)
-                corrected_relations, last_relation_id = assign_brat_id(corrected_relations)
-
-                property_id = 1
-
-                # Writing relations, entities and attributes to file
-                with open(target_ann_file, "w", encoding="UTF-8") as output_file:
-
-                    # Entities
-                    for entity in corrected_entities:
-                        output_file.write(
-                            "T{}\t{} {}\t{}\n".format(
-                                entity["brat_id"],
-                                entity["type"],
-                                ";".join(["{} {}".format(begin, end) for begin, end in entity["span"]]),
-                                " ".join(entity["text"])
-                            )
-                        )
-
-                        # Entity attributes
-                        for prop_name, prop_value in entity["properties"].items():
-                            output_file.write(
-                                "A{}\t{} T{} {}\n".format(
-                                    property_id,
-                                    prop_name,
-                                    entity["brat_id"],
-                                    prop_value
-                                )
-                            )
-
-                            property_id += 1
-
-                        output_file.write(
-                            "A{}\t{} T{} {}\n".format(
-                                property_id,
-                                "AnaforaID",
-                                entity["brat_id"],
-                                entity["id"]
-                            )
-                        )
-
-                        property_id += 1
-
-                    # Relations
-                    for relation in corrected_relations:
-                        output_file.write(
-                            "R{}\t{} Arg1:T{} Arg2:T{}\n".format(
-                                relation["brat_id"],
-                                relation["brat_name"],
-                                relation["brat_arg1"],
-                                relation["brat_arg2"]
-                            )
-                        )
+    converted_documents = list()
+    skipped_documents = list()
+
+    for document_id, source_anafora_file in work_items:
+
+        # Computing source file path (txt format)
+        source_txt_file = os.path.join(os.path.abspath(input_thyme_path), document_id)
+
+        # Checking is text annotation is in progress, skipping file if it is the case
+        if is_in_progress(source_anafora_file):
+            logging.info("Skipping file {}. Reason: annotation in progress.".format(
+                os.path.basename(source_anafora_file)
+            ))
+            skipped_documents.append(document_id)
+            continue
+
+        corrected_entities_nb += convert_anafora_document(
+            source_anafora_file,
+            source_txt_file,
+            output_brat_path,
+            preproc_payload,
+            link_text=link_text
+        )
+        converted_documents.append(document_id)
 
     logging.info("Number of corrected entities: {}".format(corrected_entities_nb))
 
     # Generating a set of brat configuration files for the current directory
-    generate_brat_conf_files(os.path.abspath(output_brat_path))
+    vocabulary = generate_brat_conf_files(os.path.abspath(output_brat_path))
+
+    if shard is not None:
+        write_shard_stats(output_brat_path, "brat", shard, balance, converted_documents, skipped_documents,
+                          corrected_entities_nb, vocabulary)
 
 
 def assign_brat_id(elements: list = None,
@@ -160,40 +128,104 @@ def assign_brat_id(elements: list = None,
 
 
 def brat_to_anafora(input_brat_dir: str = None,
-                    output_anafora_dir: str = None) -> None:
+                    output_anafora_dir: str = None,
+                    preproc_file_path: str = None,
+                    shard: tuple = None,
+                    balance: bool = False) -> None:
     """
-    Convert a THYME corpus part from brat to anafora
+    Convert a THYME corpus part from brat to anafora. When a shard is given, only the documents of this shard are
+    converted and shard statistics are written in the output directory (see thyme.shard.merge_shards).
 
     Args:
         input_brat_dir (str): annotation path (brat format)
         output_anafora_dir (str): output path where anafora files will be created
+        preproc_file_path (str): preprocessing filepath (json format), used to report spans against the original text
+        shard (tuple): shard index and number of shards
+        balance (bool): balance shards by document size
 
     Returns:
         None
     """
 
+    # Loading json content
+    preproc_payload = json.load(open(os.path.abspath(preproc_file_path), "r", encoding="UTF-8"))
+
+    source_ann_files = dict()
+
     for root, dirs, files in os.walk(os.path.abspath(input_brat_dir)):
         for filename in files:
             if re.match("^.*\.ann$", filename):
+                source_ann_files[os.path.splitext(filename)[0]] = os.path.join(root, filename)
+
+    # Keeping the documents of the current shard
+    if shard is not None:
+        shard_documents = select_shard_documents(source_ann_files, shard[0], shard[1], balance)
+        source_ann_files = {
+            document_id: filepath for document_id, filepath in source_ann_files.items()
+            if document_id in shard_documents
+        }
 
-                document_id = filename.split(".")[0]
+    for source_ann_file in source_ann_files.values():
+        convert_brat_document(source_ann_file, output_anafora_dir, preproc_payload)
 
-                # Fetching entities and relations from files and converting to anafora format
-                source_ann_file = os.path.join(root, filename)
-                entities, relations = parse_ann_file(source_ann_file)
-                ana_entities, ana_relations = convert_brat_payload_to_anafora_payload(entities, relations, document_id)
+    if shard is not None:
+        ensure_dir(os.path.abspath(output_anafora_dir))
+        write_shard_stats(output_anafora_dir, "anafora", shard, balance, list(source_ann_files))
 
-                # Building target directory
-                target_dir = os.path.join(os.path.abspath(output_anafora_dir), document_id)
-                ensure_dir(target_dir)
 
-                # Creating xml payload
-                target_file = os.path.join(target_dir, "{}.Temporal-Relation.system.completed.xml".format(document_id))
-                xml_payload = generate_payload(ana_entities, ana_relations, document_id)
+def check_adjudication(root: etree.Element = None,
+                       source_anafora_filepath: str = None) -> None:
+    """
+    Raise Exception if an anafora document contains a non-empty adjudication element
 
-                # Writing payload to disk
-                tree = etree.ElementTree(xml_payload)
-                tree.write(target_file, pretty_print=True, xml_declaration=True, encoding='UTF-8')
+    Args:
+        root (etree.Element): anafora document root element
+        source_anafora_filepath (str): anafora filepath, used in the exception message
+
+    Returns:
+        None
+    """
+
+    adjudication = root.find("./adjudication")
+    if adjudication is not None:
+        if len(adjudication) > 0:
+            raise Exception("The file {} is marked as 'completed' but contains adjudication annotations".format(
+                os.path.basename(source_anafora_filepath)
+            ))
+
+
+def compute_brat_relation_records(relations: list = None,
+                                  entities: list = None) -> None:
+    """
+    Fill the brat name, arguments and ID of relation records, in place. Entities must have brat IDs.
+
+    Args:
+        relations (list): relation records extracted from the document
+        entities (list): entity records with brat IDs
+
+    Returns:
+        None
+    """
+
+    # Building entity index, keeping the first entity when an ID is used several times
+    entity_index = dict()
+    for entity in entities:
+        entity_index.setdefault(entity.id, entity.brat_id)
+
+    for brat_id, relation in enumerate(relations, start=1):
+        source_entity = relation.properties["Source"]
+        target_entity = relation.properties["Target"]
+
+        # Same error as the list lookup of the original implementation
+        if source_entity not in entity_index or target_entity not in entity_index:
+            raise ValueError("{!r} is not in list".format(
+                source_entity if source_entity not in entity_index else target_entity
+            ))
+
+        relation.brat_arg1 = entity_index[source_entity]
+        relation.brat_arg2 = entity_index[target_entity]
+        relation.brat_name = relation.properties["Type"]
+        relation.brat_id = brat_id
 
 
 def compute_brat_relations(source_relations: list = None,
@@ -233,6 +265,85 @@ def compute_brat_relations(source_relations: list = None,
     return corrected_relations
 
 
+def convert_anafora_document(source_anafora_file: str = None,
+                             source_txt_file: str = None,
+                             output_brat_path: str = None,
+                             preproc_payload: dict = None,
+                             link_text: bool = False) -> int:
+    """
+    Convert a single THYME corpus document to brat format. The annotation progress is not checked. Text documents
+    without corrections are copied in kernel space (or hardlinked), only corrected ones are encoded and written back.
+
+    Args:
+        source_anafora_file (str): document annotation filepath (anafora format)
+        source_txt_file (str): document filepath (text format)
+        output_brat_path (str): output path where brat files will be created
+        preproc_payload (dict): preprocessing file content
+        link_text (bool): hardlink the text document instead of copying it when it has no corrections
+
+    Returns:
+        int: number of corrected entities
+    """
+
+    document_id = os.path.basename(source_anafora_file).split(".")[0]
+
+    # Computing target brat file paths
+    target_ann_file = os.path.join(
+        os.path.abspath(output_brat_path),
+        "{}.ann".format(document_id)
+    )
+    target_txt_file = os.path.join(
+        os.path.abspath(output_brat_path),
+        "{}.txt".format(document_id)
+    )
+
+    txt_content, ann_content, nb = render_anafora_document(source_anafora_file, source_txt_file, preproc_payload)
+
+    # Writing corrected text document. Without corrections, the decoded content written in text mode is the source
+    # file itself, unless line breaks are translated on writing (Windows).
+    if not preproc_payload["replace"].get(os.path.basename(source_txt_file)) and os.linesep == "\n":
+        copy_file(source_txt_file, target_txt_file, link=link_text)
+    else:
+        if os.path.lexists(target_txt_file):
+            os.remove(target_txt_file)
+
+        with open(target_txt_file, "w", encoding="UTF-8") as output_file:
+            output_file.write(txt_content)
+
+    # Writing relations, entities and attributes to file
+    with open(target_ann_file, "w", encoding="UTF-8") as output_file:
+        output_file.write(ann_content)
+
+    return nb
+
+
+def convert_brat_document(source_ann_file: str = None,
+                          output_anafora_dir: str = None,
+                          preproc_payload: dict = None) -> None:
+    """
+    Convert a single THYME corpus document from brat to anafora
+
+    Args:
+        source_ann_file (str): document annotation filepath (brat format)
+        output_anafora_dir (str): output path where anafora files will be created
+        preproc_payload (dict): preprocessing file content, used to report spans against the original text
+
+    Returns:
+        None
+    """
+
+    document_id = os.path.basename(source_ann_file).split(".")[0]
+
+    # Building target directory
+    target_dir = os.path.join(os.path.abspath(output_anafora_dir), document_id)
+    ensure_dir(target_dir)
+
+    # Writing xml payload to disk
+    target_file = os.path.join(target_dir, "{}.Temporal-Relation.system.completed.xml".format(document_id))
+    with open(target_file, "wb") as output_file:
+        output_file.write(render_brat_document(source_ann_file, preproc_payload))
+
+
 def convert_brat_payload_to_anafora_payload(brat_entities: dict = None,
                                             brat_relations: dict = None,
                                             document_id: dict = None):
@@ -292,20 +403,61 @@ def correct_and_copy_txt_file(source_txt_filepath: str = None,
         None
     """
 
-    # Loading text file content
-    content_src = open(os.path.abspath(source_txt_filepath), "r", encoding="UTF-8", newline='').read()
-
-    # Fetching file corrections if available
-    for filename in preproc_payload["replace"]:
-        if filename == os.path.basename(source_txt_filepath):
-            for begin, end, replacement in preproc_payload["replace"][filename]:
-                content_src = content_src[:begin] + replacement + content_src[end:]
+    # Loading and correcting text file content
+    content_src = get_corrected_txt_content(source_txt_filepath, preproc_payload)
 
     # Copying modified content to target file
     with open(os.path.abspath(target_txt_filepath), "w", encoding="UTF-8") as output_file:
         output_file.write(content_src)
 
 
+def correct_entity_records(entities: list = None,
+                           content: str = None,
+                           document_name: str = None) -> int:
+    """
+    Correct entity record spans by removing leading and trailing spaces and line breaks, in place. Span texts and brat
+    IDs are filled in the same pass, records are not copied.
+
+    Args:
+        entities (list): entity records extracted from the document
+        content (str): THYME document content (text format)
+        document_name (str): THYME document name, used in the exception message
+
+    Returns:
+        int: number of corrected spans
+    """
+
+    corrected_entities_nb = 0
+
+    for brat_id, entity in enumerate(entities, start=1):
+        spans = list()
+        texts = list()
+
+        # Correcting span
+        for span in sorted(entity.span):
+            begin, end, is_corrected = correct_span(span[0], span[1], content)
+            span_txt = content[begin:end]
+
+            if is_corrected:
+                corrected_entities_nb += 1
+
+            # Sanity check: searching for line break within text spans
+            if "\n" in span_txt:
+                raise Exception("There is a sentence break in the middle of an entity in document {}: {}".format(
+                    document_name,
+                    entity.to_dict()
+                ))
+
+            spans.append((begin, end))
+            texts.append(span_txt)
+
+        entity.span = tuple(spans)
+        entity.text = tuple(texts)
+        entity.brat_id = brat_id
+
+    return corrected_entities_nb
+
+
 def correct_entity_spans(entities: list = None,
                          txt_filepath: str = None):
     """
@@ -337,25 +489,10 @@ def correct_entity_spans(entities: list = None,
 
         # Correcting span
         for span in sorted(entity["span"]):
-            begin = span[0]
-            end = span[1]
-
-            span_txt = content[begin:end]
-
-            # Removing trailing '\n' and ' ' and computing new right boundary
-            span_txt_rstrip = span_txt.rstrip("\n ")
-            offset_right = end - begin - len(span_txt_rstrip)
-
-            # Removing leading '\n' and ' ' and computing new left boundary
-            span_txt_lstrip = span_txt.lstrip("\n ")
-            offset_left = end - begin - len(span_txt_lstrip)
-
-            # Computing new offsets and extracting related text span
-            begin += offset_left
-            end -= offset_right
+            begin, end, is_corrected = correct_span(span[0], span[1], content)
             span_txt = content[begin:end]
 
-            if offset_right > 0 or offset_left > 0:
+            if is_corrected:
                 corrected_entities_nb += 1
 
             # Appending computed properties to entity
@@ -375,6 +512,214 @@ def correct_entity_spans(entities: list = None,
     return corrected_entities, corrected_entities_nb
 
 
+def correct_span(begin: int = None,
+                 end: int = None,
+                 content: str = None) -> (int, int, bool):
+    """
+    Correct a span by removing leading and trailing spaces and line breaks
+
+    Args:
+        begin (int): span begin offset
+        end (int): span end offset
+        content (str): document content
+
+    Returns:
+        (int, int, bool): corrected begin and end offsets, 'True' if the span was modified
+    """
+
+    span_txt = content[begin:end]
+
+    # Removing trailing '\n' and ' ' and computing new right boundary
+    span_txt_rstrip = span_txt.rstrip("\n ")
+    offset_right = end - begin - len(span_txt_rstrip)
+
+    # Removing leading '\n' and ' ' and computing new left boundary
+    span_txt_lstrip = span_txt.lstrip("\n ")
+    offset_left = end - begin - len(span_txt_lstrip)
+
+    return begin + offset_left, end - offset_right, offset_right > 0 or offset_left > 0
+
+
+def extract_anafora_entities(root: etree.Element = None) -> list:
+    """
+    Extract entities from a parsed THYME corpus anafora document
+
+    Args:
+        root (etree.Element): anafora document root element
+
+    Returns:
+        list: entity list
+    """
+
+    # Finding annotations element
+    annotations = root.find("./annotations")
+
+    # Fetching entity elements from annotation element
+    entities = annotations.findall("./entity")
+
+    extracted_entities = list()
+
+    # Processing entities
+    for entity in entities:
+
+        # Fetching entity ID, span and type
+        current_entity_id = entity.find("./id").text
+        current_entity_span = entity.find("./span").text
+        current_entity_type = entity.find("./type").text
+
+        # Fetching entity properties
+        current_entity_properties = dict()
+        for child in entity.find("./properties"):
+            current_entity_properties[child.tag] = child.text
+
+        # Creating entity object
+        current_entity = {
+            "id": current_entity_id,
+            "type": current_entity_type,
+            "properties": current_entity_properties,
+            "span": list()
+        }
+
+        # Processing entity span
+        for span in current_entity_span.split(";"):
+            current_entity["span"].append(
+                (int(span.split(",")[0]), int(span.split(",")[1]))
+            )
+
+        # Adding current entity to entity list
+        extracted_entities.append(current_entity)
+
+    return extracted_entities
+
+
+def extract_anafora_records(root: etree.Element = None) -> (list, list):
+    """
+    Extract entity and relation records from a parsed THYME corpus anafora document. Types and property names and
+    values are interned.
+
+    Args:
+        root (etree.Element): anafora document root element
+
+    Returns:
+        (list, list): entity and relation records
+    """
+
+    # Finding annotations element
+    annotations = root.find("./annotations")
+
+    entities = list()
+    for entity in annotations.iterfind("./entity"):
+        entities.append(Entity(
+            entity.find("./id").text,
+            entity.find("./type").text,
+            {intern_string(child.tag): intern_string(child.text) for child in entity.find("./properties")},
+            tuple(
+                (int(span.split(",")[0]), int(span.split(",")[1]))
+                for span in entity.find("./span").text.split(";")
+            )
+        ))
+
+    relations = list()
+    for relation in annotations.iterfind("./relation"):
+        relations.append(Relation(
+            relation.find("./id").text,
+            relation.find("./type").text,
+            {intern_string(child.tag): intern_string(child.text) for child in relation.find("./properties")}
+        ))
+
+    return entities, relations
+
+
+def extract_anafora_relations(root: etree.Element = None) -> list:
+    """
+    Extract relations from a parsed THYME corpus anafora document
+
+    Args:
+        root (etree.Element): anafora document root element
+
+    Returns:
+        list: relation list
+    """
+
+    # Finding annotations element
+    annotations = root.find("./annotations")
+
+    # Fetching relation elements from annotations element
+    relations = annotations.findall("./relation")
+
+    extracted_relations = list()
+
+    # Processing relations
+    for relation in relations:
+
+        # Fetching relation ID and span
+        current_relation_id = relation.find("./id").text
+        current_relation_type = relation.find("./type").text
+
+        # Fetching relation properties
+        current_entity_properties = dict()
+        for child in relation.find("./properties"):
+            current_entity_properties[child.tag] = child.text
+
+        # Creating relation object
+        current_relation = {
+            "id": current_relation_id,
+            "type": current_relation_type,
+            "properties": current_entity_properties,
+        }
+
+        # Adding current relation to relation list
+        extracted_relations.append(current_relation)
+
+    return extracted_relations
+
+
+def format_ann_content(entities: list = None,
+                       relations: list = None) -> str:
+    """
+    Format corrected entity records and relation records as the content of a brat annotation file
+
+    Args:
+        entities (list): corrected entity records with brat IDs
+        relations (list): relation records with brat fields
+
+    Returns:
+        str: brat annotation file content
+    """
+
+    lines = list()
+
+    property_id = 1
+
+    # Entities
+    for entity in entities:
+        lines.append("T{}\t{} {}\t{}\n".format(
+            entity.brat_id,
+            entity.type,
+            ";".join(["{} {}".format(begin, end) for begin, end in entity.span]),
+            " ".join(entity.text)
+        ))
+
+        # Entity attributes
+        for prop_name, prop_value in entity.properties.items():
+            lines.append("A{}\t{} T{} {}\n".format(property_id, prop_name, entity.brat_id, prop_value))
+            property_id += 1
+
+        lines.append("A{}\t{} T{} {}\n".format(property_id, "AnaforaID", entity.brat_id, entity.id))
+        property_id += 1
+
+    # Relations
+    for relation in relations:
+        lines.append("R{}\t{} Arg1:T{} Arg2:T{}\n".format(
+            relation.brat_id,
+            relation.brat_name,
+            relation.brat_arg1,
+            relation.brat_arg2
+        ))
+
+    return "".join(lines)
+
+
 def generate_payload(entities: list = None,
                      relations: list = None,
                      document_id: list = None) -> etree.Element:
@@ -464,53 +809,31 @@ def get_anafora_entities(source_anafora_filepath: str = None) -> list:
     tree = etree.parse(source_anafora_filepath)
     root = tree.getroot()
 
-    # Finding annotations element
-    annotations = root.find("./annotations")
-
     # Sanity check, raising exception if there is a non-empty adjudication element
-    adjudication = root.find("./adjudication")
-    if adjudication is not None:
-        if len(adjudication) > 0:
-            raise Exception("The file {} is marked as 'completed' but contains adjudication annotations".format(
-                os.path.basename(source_anafora_filepath)
-            ))
+    check_adjudication(root, source_anafora_filepath)
 
-    # Fetching entity elements from annotation element
-    entities = annotations.findall("./entity")
+    return extract_anafora_entities(root)
 
-    extracted_entities = list()
 
-    # Processing entities
-    for entity in entities:
-
-        # Fetching entity ID, span and type
-        current_entity_id = entity.find("./id").text
-        current_entity_span = entity.find("./span").text
-        current_entity_type = entity.find("./type").text
+def get_anafora_records(source_anafora_filepath: str = None) -> (list, list):
+    """
+    Extract entity and relation records from a THYME corpus anafora file, parsing it once
 
-        # Fetching entity properties
-        current_entity_properties = dict()
-        for child in entity.find("./properties"):
-            current_entity_properties[child.tag] = child.text
+    Args:
+        source_anafora_filepath (str): source anafora filepath
 
-        # Creating entity object
-        current_entity = {
-            "id": current_entity_id,
-            "type": current_entity_type,
-            "properties": current_entity_properties,
-            "span": list()
-        }
+    Returns:
+        (list, list): entity and relation records
+    """
 
-        # Processing entity span
-        for span in current_entity_span.split(";"):
-            current_entity["span"].append(
-                (int(span.split(",")[0]), int(span.split(",")[1]))
-            )
+    # Parsing xml file
+    tree = etree.parse(source_anafora_filepath)
+    root = tree.getroot()
 
-        # Adding current entity to entity list
-        extracted_entities.append(current_entity)
+    # Sanity check, raising exception if there is a non-empty adjudication element
+    check_adjudication(root, source_anafora_filepath)
 
-    return extracted_entities
+    return extract_anafora_records(root)
 
 
 def get_anafora_relations(source_anafora_filepath: str = None) -> list:
@@ -528,45 +851,50 @@ def get_anafora_relations(source_anafora_filepath: str = None) -> list:
     tree = etree.parse(source_anafora_filepath)
     root = tree.getroot()
 
-    # Finding annotations element
-    annotations = root.find("./annotations")
-
     # Sanity check, raising exception if there is a non-empty adjudication element
-    adjudication = root.find("./adjudication")
-    if adjudication is not None:
-        if len(adjudication) > 0:
-            raise Exception("The file {} is marked as 'completed' but contains adjudication annotations".format(
-                os.path.basename(source_anafora_filepath)
-            ))
+    check_adjudication(root, source_anafora_filepath)
 
-    # Fetching relation elements from annotations element
-    relations = annotations.findall("./relation")
+    return extract_anafora_relations(root)
 
-    extracted_relations = list()
 
-    # Processing relations
-    for relation in relations:
+def get_corrected_txt_content(source_txt_filepath: str = None,
+                              preproc_payload: dict = None) -> str:
+    """
+    Load a THYME corpus text file and apply the corrections listed in the preprocessing file
 
-        # Fetching relation ID and span
-        current_relation_id = relation.find("./id").text
-        current_relation_type = relation.find("./type").text
+    Args:
+        source_txt_filepath (str): source THYME corpus text filepath
+        preproc_payload (dict): preprocessing file content
 
-        # Fetching relation properties
-        current_entity_properties = dict()
-        for child in relation.find("./properties"):
-            current_entity_properties[child.tag] = child.text
+    Returns:
+        str: corrected content
+    """
 
-        # Creating relation object
-        current_relation = {
-            "id": current_relation_id,
-            "type": current_relation_type,
-            "properties": current_entity_properties,
-        }
+    # Loading text file content
+    content_src = open(os.path.abspath(source_txt_filepath), "r", encoding="UTF-8", newline='').read()
 
-        # Adding current relation to relation list
-        extracted_relations.append(current_relation)
+    # Fetching file corrections if available
+    replacements = preproc_payload["replace"].get(os.path.basename(source_txt_filepath))
+    if replacements:
+        content_src = apply_replacements(content_src, replacements)
 
-    return extracted_relations
+    return content_src
+
+
+def get_offset_map(document_id: str = None,
+                   preproc_payload: dict = None) -> OffsetMap:
+    """
+    Compute the offset mapping between an original THYME document and its corrected version
+
+    Args:
+        document_id (str): document ID
+        preproc_payload (dict): preprocessing file content
+
+    Returns:
+        OffsetMap: offset mapping
+    """
+
+    return OffsetMap.from_replacements(preproc_payload["replace"].get(document_id))
 
 
 def is_in_progress(source_anafora_filepath: str = None) -> bool:
@@ -600,3 +928,170 @@ def is_in_progress(source_anafora_filepath: str = None) -> bool:
             source_anafora_filepath,
             progress.text
         ))
+
+
+def map_entity_record_spans(entities: list = None,
+                            map_function=None) -> None:
+    """
+    Map the spans of all entity records of a document in a single call, in place
+
+    Args:
+        entities (list): entity records
+        map_function (function): span list mapping function (e.g. OffsetMap.spans_to_corrected)
+
+    Returns:
+        None
+    """
+
+    mapped_spans = iter(map_function([span for entity in entities for span in entity.span]))
+
+    for entity in entities:
+        entity.span = tuple(next(mapped_spans) for _ in entity.span)
+
+
+def map_entity_spans(entities: list = None,
+                     span_key: str = None,
+                     map_function=None) -> None:
+    """
+    Map the spans of all entities of a document in a single call, in place
+
+    Args:
+        entities (list): entities
+        span_key (str): span list key ('span' for anafora entities, 'spans' for brat entities)
+        map_function (function): span list mapping function (e.g. OffsetMap.spans_to_corrected)
+
+    Returns:
+        None
+    """
+
+    entities = list(entities)
+
+    mapped_spans = iter(map_function([span for entity in entities for span in entity[span_key]]))
+
+    for entity in entities:
+        entity[span_key] = [next(mapped_spans) for _ in entity[span_key]]
+
+
+def plan_anafora_documents(input_anafora_path: str = None,
+                           precedence: list = None) -> (list, dict):
+    """
+    Select one annotation file per document without parsing them. When several files are available for a document
+    (e.g. Temporal-Entity and Temporal-Relation files), the file kind appearing first in the precedence list is used.
+    Files whose kind is not in the precedence list are ignored. Precedence entries are stripped, unknown kinds are
+    rejected.
+
+    Args:
+        input_anafora_path (str): annotation path (anafora format)
+        precedence (list): annotation file kinds by decreasing priority, e.g. 'Temporal-Relation.gold'
+
+    Returns:
+        (list, dict): (document ID, anafora filepath) work items sorted by document ID and conflicts, i.e.
+        (selected filepath, discarded filepaths) by document ID
+    """
+
+    if precedence is None:
+        precedence = DEFAULT_PRECEDENCE
+
+    precedence = [kind.strip() for kind in precedence]
+
+    for kind in precedence:
+        if kind not in DEFAULT_PRECEDENCE:
+            raise Exception("Invalid annotation file kind: '{}', expected one of: {}".format(
+                kind, ", ".join(DEFAULT_PRECEDENCE)
+            ))
+
+    ranks = {kind: rank for rank, kind in enumerate(precedence)}
+
+    candidates = dict()
+
+    for root, dirs, files in os.walk(os.path.abspath(input_anafora_path)):
+        for filename in files:
+            match = REGEX_TEMPORAL_FILE.match(filename)
+            if match:
+                kind = "Temporal-{}.{}".format(match.group(1), match.group(2))
+                if kind not in ranks:
+                    continue
+
+                document_id = filename.split(".")[0]
+                candidates.setdefault(document_id, list()).append((ranks[kind], os.path.join(root, filename)))
+
+    work_items = list()
+    conflicts = dict()
+
+    for document_id, document_files in sorted(candidates.items()):
+        document_files.sort()
+        work_items.append((document_id, document_files[0][1]))
+
+        if len(document_files) > 1:
+            conflicts[document_id] = (document_files[0][1], [filepath for _, filepath in document_files[1:]])
+
+    return work_items, conflicts
+
+
+def render_anafora_document(source_anafora_file: str = None,
+                            source_txt_file: str = None,
+                            preproc_payload: dict = None) -> (str, str, int):
+    """
+    Convert a single THYME corpus document to brat format in memory. The annotation progress is not checked.
+
+    Args:
+        source_anafora_file (str): document annotation filepath (anafora format)
+        source_txt_file (str): document filepath (text format)
+        preproc_payload (dict): preprocessing file content
+
+    Returns:
+        (str, str, int): corrected text content, brat annotation content and number of corrected entities
+    """
+
+    document_id = os.path.basename(source_anafora_file).split(".")[0]
+
+    # Loading and correcting text document
+    txt_content = get_corrected_txt_content(source_txt_file, preproc_payload)
+
+    # Fetching entities and relations from anofora file
+    entities, relations = get_anafora_records(source_anafora_file)
+
+    # Moving entity spans to the corrected text if corrections changed its length
+    offset_map = get_offset_map(document_id, preproc_payload)
+    if not offset_map.is_identity():
+        map_entity_record_spans(entities, offset_map.spans_to_corrected)
+
+    # Correcting entity spans and assigning a brat ID to entities. Spans refer to the text as read back from the brat
+    # text file, with universal newlines.
+    nb = correct_entity_records(entities, translate_newlines(txt_content), "{}.txt".format(document_id))
+
+    # Computing brat relations and assigning a brat ID to relations
+    compute_brat_relation_records(relations, entities)
+
+    return txt_content, format_ann_content(entities, relations), nb
+
+
+def render_brat_document(source_ann_file: str = None,
+                         preproc_payload: dict = None) -> bytes:
+    """
+    Convert a single THYME corpus document from brat to anafora in memory
+
+    Args:
+        source_ann_file (str): document annotation filepath (brat format)
+        preproc_payload (dict): preprocessing file content, used to report spans against the original text
+
+    Returns:
+        bytes: anafora xml content
+    """
+
+    document_id = os.path.basename(source_ann_file).split(".")[0]
+
+    # Fetching entities and relations from files and converting to anafora format
+    entities, relations = parse_ann_file(source_ann_file)
+
+    # Moving entity spans back to the original text if corrections changed its length
+    offset_map = get_offset_map(document_id, preproc_payload)
+    if not offset_map.is_identity():
+        map_entity_spans(entities.values(), "spans", offset_map.spans_to_original)
+
+    ana_entities, ana_relations = convert_brat_payload_to_anafora_payload(entities, relations, document_id)
+
+    # Creating xml payload
+    xml_payload = generate_payload(ana_entities, ana_relations, document_id)
+
+    return etree.tostring(xml_payload, pretty_print=True, xml_declaration=True, encoding="UTF-8")
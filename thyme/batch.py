@@ -0,0 +1,296 @@
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from .anafora import convert_anafora_document, convert_brat_document, is_in_progress, plan_anafora_documents
+from .brat import generate_brat_conf_files
+from .utils import create_staging_dir, swap_dir, wait_for_cleanup
+
+# Preprocessing file content loaded once per worker process
+worker_preproc_payload = None
+
+
+def batch_convert(manifest: dict = None,
+                  preproc_file_path: str = None,
+                  n_jobs: int = 1,
+                  overwrite: bool = False,
+                  precedence: list = None) -> dict:
+    """
+    Convert several THYME corpus parts (e.g. Train, Dev and Test) to brat format with a single pool of workers.
+    A split may also be converted back to anafora format once its brat files are available.
+
+    The manifest contains a 'splits' list. Each split has a 'name', an 'input_anafora' directory, an 'input_thyme'
+    directory, an 'output_dir' directory where brat files will be stored and an optional 'output_anafora' directory
+    where the brat files will be converted back to anafora format. The manifest is checked before any conversion
+    starts. Output directories are written as staging directories and replace existing ones only once all splits
+    are converted.
+
+    Args:
+        manifest (dict): batch manifest
+        preproc_file_path (str): preprocessing filepath (json format)
+        n_jobs (int): number of worker processes
+        overwrite (bool): overwrite existing output directories
+        precedence (list): annotation file kinds by decreasing priority (see DEFAULT_PRECEDENCE)
+
+    Returns:
+        dict: timing report by split name
+    """
+
+    check_manifest(manifest)
+
+    splits = manifest["splits"]
+
+    # Checking directories before starting any conversion
+    for split in splits:
+        for key in ["input_anafora", "input_thyme"]:
+            if not os.path.isdir(os.path.abspath(split[key])):
+                raise NotADirectoryError("The input directory of split {} does not exist: {}".format(
+                    split["name"], os.path.abspath(split[key])
+                ))
+
+        for key in ["output_dir", "output_anafora"]:
+            if key in split and not overwrite and os.path.isdir(os.path.abspath(split[key])):
+                raise IsADirectoryError("The output directory of split {} already exists: {}".format(
+                    split["name"], os.path.abspath(split[key])
+                ))
+
+    # Converting in staging directories which replace the output directories once all splits are completed
+    staging_dirs = dict()
+
+    try:
+        for split in splits:
+            for key in ["output_dir", "output_anafora"]:
+                if key in split:
+                    staging_dirs[(split["name"], key)] = create_staging_dir(split[key])
+
+        report = batch_convert_splits(
+            [dict(split, **{key: staging_dirs[(split["name"], key)] for key in ["output_dir", "output_anafora"]
+                            if key in split}) for split in splits],
+            preproc_file_path,
+            n_jobs,
+            precedence
+        )
+
+    except BaseException:
+        for staging_dir in staging_dirs.values():
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    for split in splits:
+        for key in ["output_dir", "output_anafora"]:
+            if key in split:
+                swap_dir(staging_dirs[(split["name"], key)], split[key])
+
+    # Previous output directories are deleted while the other splits are swapped
+    wait_for_cleanup()
+
+    return report
+
+
+def batch_convert_splits(splits: list = None,
+                         preproc_file_path: str = None,
+                         n_jobs: int = 1,
+                         precedence: list = None) -> dict:
+    """
+    Convert several THYME corpus parts with a single pool of workers, output directories being staging directories
+
+    Args:
+        splits (list): batch manifest splits
+        preproc_file_path (str): preprocessing filepath (json format)
+        n_jobs (int): number of worker processes
+        precedence (list): annotation file kinds by decreasing priority (see DEFAULT_PRECEDENCE)
+
+    Returns:
+        dict: timing report by split name
+    """
+
+    # Loading json content once, workers receive it at startup
+    preproc_payload = json.load(open(os.path.abspath(preproc_file_path), "r", encoding="UTF-8"))
+
+    report = {
+        split["name"]: {
+            "documents": 0,
+            "skipped": 0,
+            "corrected_entities": 0,
+            "worker_time": 0.0,
+            "wall_time": 0.0
+        }
+        for split in splits
+    }
+
+    start = time.time()
+
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=init_batch_worker,
+                             initargs=(preproc_payload,)) as executor:
+
+        # Anafora to brat conversion, all splits share the worker pool
+        futures = dict()
+        for split in splits:
+            work_items, conflicts = plan_anafora_documents(split["input_anafora"], precedence)
+
+            for document_id, (source_anafora_file, discarded_files) in sorted(conflicts.items()):
+                logging.info("[{}] Several annotation files for document {}, using {}. Discarded: {}".format(
+                    split["name"],
+                    document_id,
+                    os.path.basename(source_anafora_file),
+                    ", ".join([os.path.basename(filepath) for filepath in discarded_files])
+                ))
+
+            for document_id, source_anafora_file in work_items:
+                future = executor.submit(
+                    convert_batch_anafora_document,
+                    source_anafora_file,
+                    os.path.join(os.path.abspath(split["input_thyme"]), document_id),
+                    os.path.abspath(split["output_dir"])
+                )
+                futures[future] = (split, document_id)
+
+        # Each brat document is converted back to anafora as soon as it is written, for splits that request it
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                split, document_id = futures.pop(future)
+                split_report = report[split["name"]]
+
+                if document_id is None:
+                    split_report["worker_time"] += future.result()
+                    split_report["wall_time"] = time.time() - start
+                    continue
+
+                nb, elapsed = future.result()
+
+                if nb is None:
+                    split_report["skipped"] += 1
+                else:
+                    split_report["documents"] += 1
+                    split_report["corrected_entities"] += nb
+
+                    if "output_anafora" in split:
+                        brat_future = executor.submit(
+                            convert_batch_brat_document,
+                            os.path.join(os.path.abspath(split["output_dir"]), "{}.ann".format(document_id)),
+                            os.path.abspath(split["output_anafora"])
+                        )
+                        futures[brat_future] = (split, None)
+
+                split_report["worker_time"] += elapsed
+                split_report["wall_time"] = time.time() - start
+
+    # Generating a set of brat configuration files for each split
+    for split in splits:
+        generate_brat_conf_files(os.path.abspath(split["output_dir"]))
+
+    return report
+
+
+def check_manifest(manifest: dict = None) -> None:
+    """
+    Check a batch manifest: a non-empty 'splits' list whose splits have the required keys, unique names and distinct
+    output directories
+
+    Args:
+        manifest (dict): batch manifest
+
+    Returns:
+        None
+    """
+
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("splits"), list) or not manifest["splits"]:
+        raise Exception("Invalid batch manifest: expected a non-empty 'splits' list")
+
+    names = set()
+    output_dirs = set()
+
+    for i, split in enumerate(manifest["splits"]):
+        if not isinstance(split, dict):
+            raise Exception("Invalid batch manifest: split {} is not an object".format(i))
+
+        missing_keys = [key for key in ["name", "input_anafora", "input_thyme", "output_dir"] if key not in split]
+        if missing_keys:
+            raise Exception("Invalid batch manifest: split {} has no {}".format(
+                split.get("name", i), ", ".join(missing_keys)
+            ))
+
+        if split["name"] in names:
+            raise Exception("Invalid batch manifest: several splits are named {}".format(split["name"]))
+        names.add(split["name"])
+
+        for key in ["output_dir", "output_anafora"]:
+            if key not in split:
+                continue
+
+            output_dir = os.path.abspath(split[key])
+            if output_dir in output_dirs:
+                raise Exception("Invalid batch manifest: output directory {} of split {} is used several times".format(
+                    output_dir, split["name"]
+                ))
+            output_dirs.add(output_dir)
+
+
+def convert_batch_anafora_document(source_anafora_file: str = None,
+                                   source_txt_file: str = None,
+                                   output_brat_path: str = None) -> (int, float):
+    """
+    Convert a THYME corpus document to brat format within a batch worker
+
+    Args:
+        source_anafora_file (str): document annotation filepath (anafora format)
+        source_txt_file (str): document filepath (text format)
+        output_brat_path (str): output path where brat files will be created
+
+    Returns:
+        (int, float): number of corrected entities (None if the annotation is in progress) and elapsed time
+    """
+
+    start = time.time()
+
+    # Checking is text annotation is in progress, skipping file if it is the case
+    if is_in_progress(source_anafora_file):
+        logging.info("Skipping file {}. Reason: annotation in progress.".format(
+            os.path.basename(source_anafora_file)
+        ))
+        return None, time.time() - start
+
+    nb = convert_anafora_document(source_anafora_file, source_txt_file, output_brat_path, worker_preproc_payload)
+
+    return nb, time.time() - start
+
+
+def convert_batch_brat_document(source_ann_file: str = None,
+                                output_anafora_dir: str = None) -> float:
+    """
+    Convert a THYME corpus document from brat to anafora within a batch worker
+
+    Args:
+        source_ann_file (str): document annotation filepath (brat format)
+        output_anafora_dir (str): output path where anafora files will be created
+
+    Returns:
+        float: elapsed time
+    """
+
+    start = time.time()
+
+    convert_brat_document(source_ann_file, output_anafora_dir, worker_preproc_payload)
+
+    return time.time() - start
+
+
+def init_batch_worker(preproc_payload: dict = None) -> None:
+    """
+    Initialize a batch worker process
+
+    Args:
+        preproc_payload (dict): preprocessing file content
+
+    Returns:
+        None
+    """
+
+    global worker_preproc_payload
+
+    worker_preproc_payload = preproc_payload
@@ -1,7 +1,11 @@
 import copy
+import logging
 import math
 import os
 import re
+import time
+
+from .utils import copy_file
 
 colors_pastel = ["#e0f6e7", "#88aee1", "#eddaac", "#95bbef", "#daf4c5", "#cba9d3", "#b5d7a7", "#dec7f5", "#a1c293",
                  "#e8a7ba", "#72c8b8", "#e1a48e", "#7cd3eb", "#f1c1a6", "#99ceeb", "#c9aa8c", "#b8cff2", "#bbc49a",
@@ -10,6 +14,25 @@ colors_pastel = ["#e0f6e7", "#88aee1", "#eddaac", "#95bbef", "#daf4c5", "#cba9d3
                  "#c7dfee", "#e0bfb4", "#a0c6d1", "#f2e9d6", "#afb9cb", "#c2d2ba", "#efd5dc", "#a6b79f", "#d2b9c0",
                  "#c6e1db", "#cab5a7", "#97b1ab", "#d5cdbb", "#abc5bf"]
 
+REGEX_CONF_ENTITY = re.compile(r"T(\d+)\t([^\s]*)\s(\d+\s\d+;?)+\t([^\t]*)")
+REGEX_CONF_ATTRIBUTE = re.compile(r'^A(\d+)\t([^\s]+)\sT(\d+)\s(.*)')
+REGEX_CONF_RELATION = re.compile(r'^R(\d+)\t([^\s]+)\sArg1:T(\d+)\sArg2:T(\d+)')
+
+REGEX_ANN_ID = re.compile(r'^([TAR#])(\d+)\t')
+REGEX_ANN_LAST_IDS = {
+    "T": re.compile(r'^T(\d+)\t([^\s]+)\s(.*)\t(.*)'),
+    "A": re.compile(r'^A(\d+)\t([^\s]+)\sT(\d+)\s(.*)'),
+    "R": re.compile(r'^R(\d+)\t([^\s]+)\sArg1:T(\d+)\sArg2:T(\d+)'),
+    "#": re.compile(r'^#(\d+)\tAnnotatorNotes\s(T|R)(\d+)\t(.*)')
+}
+REGEX_ANN_ENTITY = re.compile(r'^T\d+\t([^\s]+)\s([^\t]+)\t')
+REGEX_ANN_ATTRIBUTE = re.compile(r'^A\d+\t([^\s]+)\sT(\d+)\s(.*)')
+REGEX_ANN_RELATION = re.compile(r'^R\d+\t([^\s]+)\sArg1:T(\d+)\sArg2:T(\d+)')
+
+REGEX_PARSE_ENTITY = re.compile(r"^T(\d+)\t([^\s]+)\s([^\t]+)\t([^\t]*)$")
+REGEX_PARSE_ATTRIBUTE = re.compile(r"^A(\d+)\t([^\s]+)\sT(\d+)\s(.*)$")
+REGEX_PARSE_RELATION = re.compile(r"^R(\d+)\t([^\s]+)\sArg1:T(\d+)\sArg2:T(\d+)$")
+
 
 def generate_brat_conf_files(input_dir: str = None):
     """
@@ -19,13 +42,10 @@ def generate_brat_conf_files(input_dir: str = None):
         input_dir (str): input filepath
 
     Returns:
-        None
+        (set, dict, set): entity types, attribute values by attribute name and relation types
     """
 
     regex_ann_filename = re.compile(r'.*\.ann')
-    regex_entity = re.compile(r"T(\d+)\t([^\s]*)\s(\d+\s\d+;?)+\t([^\t]*)")
-    regex_attribute = re.compile(r'^A(\d+)\t([^\s]+)\sT(\d+)\s(.*)')
-    regex_relation = re.compile(r'^R(\d+)\t([^\s]+)\sArg1:T(\d+)\sArg2:T(\d+)')
 
     entities_list = set()
     attributes_list = {}
@@ -34,25 +54,50 @@ def generate_brat_conf_files(input_dir: str = None):
     for root, dirs, files in os.walk(os.path.abspath(input_dir)):
         for filename in files:
             if regex_ann_filename.match(filename):
-                with open(os.path.join(root, filename), "r", encoding="UTF-8") as input_file:
-                    for line in input_file:
+                merge_vocabularies(
+                    (entities_list, attributes_list, relations_list),
+                    get_ann_vocabulary(os.path.join(root, filename))
+                )
 
-                        entity_match = regex_entity.match(line)
-                        if entity_match:
-                            entities_list.add(entity_match.group(2))
+    write_confs(entities_list, attributes_list, relations_list, input_dir)
 
-                        attrib_match = regex_attribute.match(line)
-                        if attrib_match:
-                            if attrib_match.group(2) not in attributes_list:
-                                attributes_list[attrib_match.group(2)] = set(attrib_match.group(4))
-                            else:
-                                attributes_list[attrib_match.group(2)].add(attrib_match.group(4))
+    return entities_list, attributes_list, relations_list
 
-                        relation_match = regex_relation.match(line)
-                        if relation_match:
-                            relations_list.add(relation_match.group(2))
 
-    write_confs(entities_list, attributes_list, relations_list, input_dir)
+def get_ann_vocabulary(ann_filename: str = None):
+    """
+    Extract entity types, attribute values and relation types used in a brat annotation file
+
+    Args:
+        ann_filename (str): brat document filepath
+
+    Returns:
+        (set, dict, set): entity types, attribute values by attribute name and relation types
+    """
+
+    entities_list = set()
+    attributes_list = {}
+    relations_list = set()
+
+    with open(ann_filename, "r", encoding="UTF-8") as input_file:
+        for line in input_file:
+
+            entity_match = REGEX_CONF_ENTITY.match(line)
+            if entity_match:
+                entities_list.add(entity_match.group(2))
+
+            attrib_match = REGEX_CONF_ATTRIBUTE.match(line)
+            if attrib_match:
+                if attrib_match.group(2) not in attributes_list:
+                    attributes_list[attrib_match.group(2)] = {attrib_match.group(4)}
+                else:
+                    attributes_list[attrib_match.group(2)].add(attrib_match.group(4))
+
+            relation_match = REGEX_CONF_RELATION.match(line)
+            if relation_match:
+                relations_list.add(relation_match.group(2))
+
+    return entities_list, attributes_list, relations_list
 
 
 def get_last_ids(file_path: str = None):
@@ -63,50 +108,332 @@ def get_last_ids(file_path: str = None):
         file_path (str): brat document filepath
 
     Returns:
+        (int, int, int, int): last entity, attribute, relation and annotation IDs
+    """
+
+    index = index_ann_file(file_path)
+
+    return index["last_ids"]["T"], index["last_ids"]["A"], index["last_ids"]["R"], index["last_ids"]["#"]
+
 
+def get_unique_anafora_id(anafora_id: str = None,
+                          anafora_ids: set = None) -> str:
     """
+    Compute an anafora ID which is not used yet, by increasing the number of an ID such as '3@e@ID001_clinic_001@gold'
+    until it is free. IDs which do not start with a number are suffixed instead.
 
-    regex_entity = re.compile(r'^T(\d+)\t([^\s]+)\s(.*)\t(.*)')
-    regex_relation = re.compile(r'^R(\d+)\t([^\s]+)\sArg1:T(\d+)\sArg2:T(\d+)')
-    regex_attribute = re.compile(r'^A(\d+)\t([^\s]+)\sT(\d+)\s(.*)')
-    regex_annotation = re.compile(r'#(\d+)\tAnnotatorNotes\s(T|R)(\d+)\t(.*)')
+    Args:
+        anafora_id (str): candidate anafora ID
+        anafora_ids (set): anafora IDs already used
+
+    Returns:
+        str: unused anafora ID
+    """
 
-    last_entity_id = 0
-    last_att_id = 0
-    last_relation_id = 0
-    last_ann_id = 0
+    if anafora_id not in anafora_ids:
+        return anafora_id
 
-    with open(file_path, "r", encoding="UTF-8") as input_file:
+    number, separator, suffix = anafora_id.partition("@")
 
+    if number.isdigit() and separator:
+        candidate_number = int(number)
+        while "{}@{}".format(candidate_number, suffix) in anafora_ids:
+            candidate_number += 1
+
+        return "{}@{}".format(candidate_number, suffix)
+
+    i = 1
+    while "{}-{}".format(anafora_id, i) in anafora_ids:
+        i += 1
+
+    return "{}-{}".format(anafora_id, i)
+
+
+def index_ann_file(ann_filename: str = None) -> dict:
+    """
+    Index a brat annotation file in a single pass: last ID of each annotation kind, entity IDs by (type, spans),
+    attribute values by (name, entity ID), relation IDs by (type, arg1, arg2) and anafora IDs in use
+
+    Args:
+        ann_filename (str): brat document filepath
+
+    Returns:
+        dict: brat document index
+    """
+
+    index = {
+        "last_ids": {"T": 0, "A": 0, "R": 0, "#": 0},
+        "entities": dict(),
+        "attributes": dict(),
+        "relations": dict(),
+        "anafora_ids": set(),
+        "ends_with_newline": True
+    }
+
+    if not os.path.isfile(ann_filename):
+        return index
+
+    with open(ann_filename, "r", encoding="UTF-8") as input_file:
+        line = ""
         for line in input_file:
+            match = REGEX_ANN_ID.match(line)
+            if not match:
+                continue
 
-            entity_match = regex_entity.match(line)
-            if entity_match:
-                if int(entity_match.group(1)) > last_entity_id:
-                    last_entity_id = int(entity_match.group(1))
+            kind = match.group(1)
+            brat_id = int(match.group(2))
 
-            relation_match = regex_relation.match(line)
-            if relation_match:
-                if int(relation_match.group(1)) > last_relation_id:
-                    last_relation_id = int(relation_match.group(1))
+            # Only well-formed lines (annotator notes for '#') count for the last IDs
+            if brat_id > index["last_ids"][kind] and REGEX_ANN_LAST_IDS[kind].match(line):
+                index["last_ids"][kind] = brat_id
+
+            if kind == "T":
+                entity_match = REGEX_ANN_ENTITY.match(line)
+                if entity_match:
+                    index["entities"][(entity_match.group(1), parse_ann_spans(entity_match.group(2)))] = brat_id
+
+            elif kind == "A":
+                attribute_match = REGEX_ANN_ATTRIBUTE.match(line)
+                if attribute_match:
+                    index["attributes"][(attribute_match.group(1), int(attribute_match.group(2)))] = \
+                        attribute_match.group(3)
+
+                    if attribute_match.group(1) == "AnaforaID":
+                        index["anafora_ids"].add(attribute_match.group(3))
+
+            elif kind == "R":
+                relation_match = REGEX_ANN_RELATION.match(line)
+                if relation_match:
+                    index["relations"][(relation_match.group(1), int(relation_match.group(2)),
+                                        int(relation_match.group(3)))] = brat_id
+
+        index["ends_with_newline"] = line == "" or line.endswith("\n")
+
+    return index
+
+
+def merge_ann_file(target_ann_file: str = None,
+                   entities: dict = None,
+                   relations: dict = None,
+                   index: dict = None) -> dict:
+    """
+    Merge entities, attributes and relations into a brat annotation file. New annotations are appended to a copy of
+    the file with new IDs, the copy replacing the file once written. Annotations already present in the file (same
+    entity type and spans, same attribute or same relation) are skipped. Appended entities whose 'AnaforaID' is already used in the file get a new one (see
+    get_unique_anafora_id), entities merged with existing ones keep the existing 'AnaforaID'.
+
+    Args:
+        target_ann_file (str): brat document filepath, created if it does not exist
+        entities (dict): entities extracted with parse_ann_file
+        relations (dict): relations extracted with parse_ann_file
+        index (dict): index of the target file, computed if None and updated in place
+
+    Returns:
+        dict: number of added and skipped entities, attributes and relations
+    """
+
+    if index is None:
+        index = index_ann_file(target_ann_file)
+
+    counts = {
+        "entities": 0,
+        "attributes": 0,
+        "relations": 0,
+        "duplicates": 0,
+        "conflicts": 0
+    }
+
+    lines = list()
+    id_mapping = dict()
 
-            attribute_match = regex_attribute.match(line)
-            if attribute_match:
-                if int(attribute_match.group(1)) > last_att_id:
-                    last_att_id = int(attribute_match.group(1))
+    for brat_id, entity in entities.items():
+        key = (entity["type"], tuple(sorted(entity["spans"])))
 
-            annotation_match = regex_annotation.match(line)
-            if annotation_match:
-                if int(annotation_match.group(1)) > last_ann_id:
-                    last_ann_id = int(annotation_match.group(1))
+        attributes = dict(entity["attributes"])
 
-    return last_entity_id, last_att_id, last_relation_id, last_ann_id
+        # Identical entities are merged with the existing ones
+        if key in index["entities"]:
+            id_mapping[brat_id] = index["entities"][key]
+            counts["duplicates"] += 1
+
+            # The existing entity keeps its anafora ID
+            attributes.pop("AnaforaID", None)
+
+        else:
+            index["last_ids"]["T"] += 1
+            index["entities"][key] = index["last_ids"]["T"]
+            id_mapping[brat_id] = index["last_ids"]["T"]
+            counts["entities"] += 1
+
+            lines.append("T{}\t{} {}\t{}\n".format(
+                id_mapping[brat_id],
+                entity["type"],
+                ";".join(["{} {}".format(begin, end) for begin, end in entity["spans"]]),
+                entity["text"]
+            ))
+
+            # Anafora IDs must stay unique within the document
+            if "AnaforaID" in attributes:
+                attributes["AnaforaID"] = get_unique_anafora_id(attributes["AnaforaID"], index["anafora_ids"])
+                index["anafora_ids"].add(attributes["AnaforaID"])
+
+        for attribute, value in attributes.items():
+            key = (attribute, id_mapping[brat_id])
+
+            if key in index["attributes"]:
+                if index["attributes"][key] == value:
+                    counts["duplicates"] += 1
+                else:
+                    # An attribute can only have one value per entity, the existing one is kept
+                    counts["conflicts"] += 1
+                continue
+
+            index["last_ids"]["A"] += 1
+            index["attributes"][key] = value
+            counts["attributes"] += 1
+
+            lines.append("A{}\t{} T{} {}\n".format(index["last_ids"]["A"], attribute, id_mapping[brat_id], value))
+
+    for brat_id, relation in relations.items():
+
+        # Relations pointing to unknown entities cannot be merged
+        if relation["arg1"] not in id_mapping or relation["arg2"] not in id_mapping:
+            counts["conflicts"] += 1
+            continue
+
+        key = (relation["type"], id_mapping[relation["arg1"]], id_mapping[relation["arg2"]])
+
+        if key in index["relations"]:
+            counts["duplicates"] += 1
+            continue
+
+        index["last_ids"]["R"] += 1
+        index["relations"][key] = index["last_ids"]["R"]
+        counts["relations"] += 1
+
+        lines.append("R{}\t{} Arg1:T{} Arg2:T{}\n".format(index["last_ids"]["R"], key[0], key[1], key[2]))
+
+    # Appending new annotations to a copy of the file which replaces it once written, a failed merge leaving the file
+    # untouched
+    if lines:
+        target_ann_file = os.path.abspath(target_ann_file)
+        temporary_file = os.path.join(
+            os.path.dirname(target_ann_file),
+            ".{}.merge-{}-{}".format(os.path.basename(target_ann_file), os.getpid(), time.time_ns())
+        )
+
+        try:
+            if os.path.isfile(target_ann_file):
+                copy_file(target_ann_file, temporary_file)
+
+            with open(temporary_file, "a", encoding="UTF-8") as output_file:
+                if not index["ends_with_newline"]:
+                    output_file.write("\n")
+
+                output_file.writelines(lines)
+
+            os.replace(temporary_file, target_ann_file)
+
+        except BaseException:
+            if os.path.lexists(temporary_file):
+                os.remove(temporary_file)
+            raise
+
+        index["ends_with_newline"] = True
+
+    return counts
+
+
+def merge_brat_dirs(target_brat_dir: str = None,
+                    prediction_dirs: list = None) -> dict:
+    """
+    Merge brat predictions of one or several models into existing brat documents. Each target document is indexed
+    once, whatever the number of prediction directories. Documents that do not exist in the target directory are
+    skipped. Brat configuration files are generated again at the end.
+
+    Args:
+        target_brat_dir (str): brat directory path, modified in place
+        prediction_dirs (list): brat directory paths containing predictions
+
+    Returns:
+        dict: number of merged documents, skipped documents and added or skipped annotations
+    """
+
+    regex_ann_filename = re.compile(r'.*\.ann$')
+
+    predictions = dict()
+    for prediction_dir in prediction_dirs:
+        for root, dirs, files in os.walk(os.path.abspath(prediction_dir)):
+            for filename in sorted(files):
+                if regex_ann_filename.match(filename):
+                    predictions.setdefault(filename, list()).append(os.path.join(root, filename))
+
+    counts = {
+        "documents": 0,
+        "skipped": 0,
+        "entities": 0,
+        "attributes": 0,
+        "relations": 0,
+        "duplicates": 0,
+        "conflicts": 0
+    }
+
+    for filename, prediction_files in sorted(predictions.items()):
+        target_ann_file = os.path.join(os.path.abspath(target_brat_dir), filename)
+
+        if not os.path.isfile(target_ann_file):
+            logging.info("Skipping file {}. Reason: document not found in target directory.".format(filename))
+            counts["skipped"] += 1
+            continue
+
+        index = index_ann_file(target_ann_file)
+
+        for prediction_file in prediction_files:
+            entities, relations = parse_ann_file(prediction_file)
+
+            for key, value in merge_ann_file(target_ann_file, entities, relations, index).items():
+                counts[key] += value
+
+        counts["documents"] += 1
+
+    generate_brat_conf_files(os.path.abspath(target_brat_dir))
+
+    return counts
+
+
+def merge_vocabularies(target: tuple = None,
+                       source: tuple = None):
+    """
+    Merge a brat vocabulary (entity types, attribute values and relation types) into another one, in place
+
+    Args:
+        target (tuple): vocabulary which will be updated
+        source (tuple): vocabulary to merge
+
+    Returns:
+        tuple: updated target vocabulary
+    """
+
+    target[0].update(source[0])
+
+    for attribute, values in source[1].items():
+        if attribute not in target[1]:
+            target[1][attribute] = set(values)
+        else:
+            target[1][attribute].update(values)
+
+    target[2].update(source[2])
+
+    return target
 
 
 def parse_ann_file(ann_filename: str = None):
     """
     Parse a brat annotation file and return a dictionary of entities and a list of relations.
 
+    The file is read once. Attributes are applied once all entities are known, in file order, so that attributes
+    written before their entity are kept.
+
     Args:
         ann_filename (str): brat document filepath
 
@@ -114,63 +441,73 @@ def parse_ann_file(ann_filename: str = None):
         (dict, dict): entities and relations
     """
 
-    regex_entity = re.compile(r"^T(\d+)\t([^\s]+)\s([^\t]+)\t([^\t]*)$")
-    regex_attribute = re.compile(r"^A(\d+)\t([^\s]+)\sT(\d+)\s(.*)$")
-    regex_relation = re.compile(r"^R(\d+)\t([^\s]+)\sArg1:T(\d+)\sArg2:T(\d+)$")
-
     entities = dict()
     relations = dict()
+    attributes = list()
 
-    # Extraction entity annotations (without attributes)
     with open(ann_filename, "r", encoding="UTF-8") as input_file:
         for line in input_file:
-            match_entity = regex_entity.match(line)
-            if match_entity:
-
-                brat_id = int(match_entity.group(1))
 
-                current_entity = {
-                    "id": brat_id,
-                    "spans": list(),
-                    "is_split": False,
-                    "type": match_entity.group(2),
-                    "text": match_entity.group(4).rstrip("\n"),
-                    "attributes": dict()
-                }
+            # Entity annotations (without attributes)
+            if line.startswith("T"):
+                match_entity = REGEX_PARSE_ENTITY.match(line)
+                if match_entity:
+
+                    brat_id = int(match_entity.group(1))
+
+                    spans = [
+                        (int(span.split()[0]), int(span.split()[1]))
+                        for span in match_entity.group(3).split(";")
+                    ]
+
+                    entities[brat_id] = {
+                        "id": brat_id,
+                        "spans": spans,
+                        "is_split": len(spans) == 1,
+                        "type": match_entity.group(2),
+                        "text": match_entity.group(4).rstrip("\n"),
+                        "attributes": dict()
+                    }
+
+            # Entity attributes
+            elif line.startswith("A"):
+                match_attribute = REGEX_PARSE_ATTRIBUTE.match(line)
+                if match_attribute:
+                    attributes.append((int(match_attribute.group(3)), match_attribute.group(2),
+                                       match_attribute.group(4)))
+
+            # Relations
+            elif line.startswith("R"):
+                match_relation = REGEX_PARSE_RELATION.match(line)
+                if match_relation:
+                    relations[int(match_relation.group(1))] = {
+                        "type": match_relation.group(2),
+                        "arg1": int(match_relation.group(3)),
+                        "arg2": int(match_relation.group(4))
+                    }
+
+    for brat_id, name, value in attributes:
+        if brat_id in entities:
+            entities[brat_id]["attributes"][name] = value
 
-                spans = match_entity.group(3).split(";")
-                for span in spans:
-                    begin = int(span.split()[0])
-                    end = int(span.split()[1])
-
-                    current_entity["spans"].append((begin, end))
+    return entities, relations
 
-                if len(current_entity["spans"]) == 1:
-                    current_entity["is_split"] = True
 
-                entities[brat_id] = current_entity
+def parse_ann_spans(spans: str = None) -> tuple:
+    """
+    Parse the span field of a brat entity line (e.g. '12 15;20 25')
 
-    # Extracting entity attributes
-    with open(ann_filename, "r", encoding="UTF-8") as input_file:
-        for line in input_file:
-            match_attribute = regex_attribute.match(line)
-            if match_attribute:
-                if int(match_attribute.group(3)) in entities:
-                    entities[int(match_attribute.group(3))][
-                        'attributes'][match_attribute.group(2)] = match_attribute.group(4)
+    Args:
+        spans (str): span field
 
-    # Extracting relations
-    with open(ann_filename, "r", encoding="UTF-8") as input_file:
-        for line in input_file:
-            match_relation = regex_relation.match(line)
-            if match_relation:
-                relations[int(match_relation.group(1))] = {
-                    "type": match_relation.group(2),
-                    "arg1": int(match_relation.group(3)),
-                    "arg2": int(match_relation.group(4))
-                }
+    Returns:
+        tuple: sorted (begin, end) tuples
+    """
 
-    return entities, relations
+    return tuple(sorted(
+        (int(span.split()[0]), int(span.split()[1]))
+        for span in spans.split(";")
+    ))
 
 
 def write_confs(entities_list: list = None,
@@ -178,7 +515,8 @@ def write_confs(entities_list: list = None,
                 relations_list: list = None,
                 input_dir: str = None):
     """
-    Write brat configuration files to disk
+    Write brat configuration files to disk. Types and values are sorted so that the same vocabulary always produces
+    the same files.
 
     Args:
         entities_list (list): entity list
@@ -190,6 +528,10 @@ def write_confs(entities_list: list = None,
         None
     """
 
+    entities_list = sorted(entities_list)
+    attributes_list = {attribute: sorted(attributes_list[attribute]) for attribute in sorted(attributes_list)}
+    relations_list = sorted(relations_list)
+
     with open(os.path.join(os.path.abspath(input_dir), "annotation.conf"), "w", encoding="UTF-8") as ann_conf:
 
         # Entities
@@ -0,0 +1,261 @@
+import json
+import logging
+import os
+import re
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from .anafora import correct_entity_records, get_anafora_records, get_corrected_txt_content, get_offset_map, \
+    is_in_progress, map_entity_record_spans, plan_anafora_documents
+from .utils import translate_newlines
+
+CANDIDATE_UNITS = ["char", "sentence", "section"]
+
+CANDIDATE_COLUMNS = ["document", "arg1", "arg2", "arg1_span", "arg2_span", "distance", "label"]
+
+REGEX_SENTENCE_END = re.compile(r"[.!?](?=\s)|\n")
+REGEX_SECTION_START = re.compile(r"\[start section id=[^\]]*\]")
+
+
+def generate_candidates(input_anafora_path: str = None,
+                        input_thyme_path: str = None,
+                        preproc_file_path: str = None,
+                        output_filepath: str = None,
+                        unit: str = "char",
+                        window: int = 100,
+                        recall_windows: list = None,
+                        kinds: list = None,
+                        precedence: list = None,
+                        n_jobs: int = 1,
+                        chunk_size: int = 10000) -> dict:
+    """
+    Generate the relation candidates of a THYME corpus part: every pair of entities within a window, labelled with the
+    gold relation type (suffixed with '-1' when the relation goes from the second entity to the first one) or 'NONE'.
+    Candidates are written to a tsv file in chunks, document by document.
+
+    Args:
+        input_anafora_path (str): annotation path (anafora format)
+        input_thyme_path (str): corpus path (text format)
+        preproc_file_path (str): preprocessing filepath (json format)
+        output_filepath (str): output tsv filepath
+        unit (str): window unit, 'char' (distance between entity beginnings), 'sentence' or 'section'
+        window (int): maximum distance between two entities of a candidate, in window units
+        recall_windows (list): window sizes for which the recall of gold relations is reported
+        kinds (list): gold relation kinds (TLINK, ALINK)
+        precedence (list): annotation file kinds by decreasing priority (see DEFAULT_PRECEDENCE)
+        n_jobs (int): number of worker processes
+        chunk_size (int): number of candidates written at once
+
+    Returns:
+        dict: numbers of documents, candidates and gold relations, and recall by window size
+    """
+
+    if unit not in CANDIDATE_UNITS:
+        raise Exception("Invalid window unit: {}".format(unit))
+
+    # Loading json content
+    preproc_payload = json.load(open(os.path.abspath(preproc_file_path), "r", encoding="UTF-8"))
+
+    work_items, _ = plan_anafora_documents(input_anafora_path, precedence)
+
+    report = {
+        "unit": unit,
+        "window": window,
+        "documents": 0,
+        "skipped": list(),
+        "candidates": 0,
+        "positives": 0,
+        "gold": 0,
+        "unreachable_gold": 0,
+        "recall": None,
+        "recall_by_window": dict()
+    }
+
+    gold_distances = Counter()
+
+    with ProcessPoolExecutor(max_workers=max(1, n_jobs)) as executor, \
+            open(os.path.abspath(output_filepath), "w", encoding="UTF-8") as output_file:
+
+        output_file.write("\t".join(CANDIDATE_COLUMNS) + "\n")
+
+        chunk = list()
+
+        for document_id, result in zip(
+                [document_id for document_id, _ in work_items],
+                executor.map(
+                    generate_document_candidates,
+                    [source_anafora_file for _, source_anafora_file in work_items],
+                    [os.path.join(os.path.abspath(input_thyme_path), document_id) for document_id, _ in work_items],
+                    [preproc_payload] * len(work_items),
+                    [unit] * len(work_items),
+                    [window] * len(work_items),
+                    [kinds] * len(work_items)
+                )
+        ):
+            error, candidates, document_gold_distances, unreachable_gold = result
+
+            if error is not None:
+                logging.info("Skipping document {}. Reason: {}".format(document_id, error))
+                report["skipped"].append(document_id)
+                continue
+
+            report["documents"] += 1
+            report["candidates"] += len(candidates)
+            report["unreachable_gold"] += unreachable_gold
+            gold_distances.update(document_gold_distances)
+
+            for candidate in candidates:
+                report["positives"] += candidate[-1] != "NONE"
+                chunk.append("\t".join([document_id] + [str(value) for value in candidate]) + "\n")
+
+            # Writing candidates by chunks
+            if len(chunk) >= chunk_size:
+                output_file.writelines(chunk)
+                chunk = list()
+
+        output_file.writelines(chunk)
+
+    report["gold"] = sum(gold_distances.values()) + report["unreachable_gold"]
+
+    # Recall of gold relations, relations between unknown entities can not be reached by any window
+    for window_size in sorted(set((recall_windows or []) + [window])):
+        reached = sum(count for distance, count in gold_distances.items() if distance <= window_size)
+        report["recall_by_window"][window_size] = reached / report["gold"] if report["gold"] > 0 else None
+
+    report["recall"] = report["recall_by_window"][window]
+
+    return report
+
+
+def generate_document_candidates(source_anafora_file: str = None,
+                                 source_txt_file: str = None,
+                                 preproc_payload: dict = None,
+                                 unit: str = "char",
+                                 window: int = 100,
+                                 kinds: list = None) -> (str, list, Counter, int):
+    """
+    Generate the relation candidates of a single THYME corpus document. Entities are sorted once by position and pairs
+    are enumerated with two pointers, so that only pairs within the window are visited. Entity spans are corrected as
+    in the anafora to brat conversion.
+
+    Args:
+        source_anafora_file (str): document annotation filepath (anafora format)
+        source_txt_file (str): document filepath (text format)
+        preproc_payload (dict): preprocessing file content
+        unit (str): window unit, 'char', 'sentence' or 'section'
+        window (int): maximum distance between two entities of a candidate, in window units
+        kinds (list): gold relation kinds (TLINK, ALINK)
+
+    Returns:
+        (str, list, Counter, int): skipping reason (None if the document was processed), candidates, distances of
+        gold relations and number of gold relations pointing to unknown entities
+    """
+
+    kinds = kinds or ["TLINK"]
+    document_id = os.path.basename(source_txt_file)
+
+    try:
+        # Checking is text annotation is in progress, skipping file if it is the case
+        if is_in_progress(source_anafora_file):
+            return "annotation in progress", list(), Counter(), 0
+
+        content = translate_newlines(get_corrected_txt_content(source_txt_file, preproc_payload))
+        entities, relations = get_anafora_records(source_anafora_file)
+
+        # Moving entity spans to the corrected text if corrections changed its length
+        offset_map = get_offset_map(document_id, preproc_payload)
+        if not offset_map.is_identity():
+            map_entity_record_spans(entities, offset_map.spans_to_corrected)
+
+        correct_entity_records(entities, content, "{}.txt".format(document_id))
+
+    except Exception as e:
+        return str(e), list(), Counter(), 0
+
+    # Entity positions in window units, entities sorted by position
+    boundaries = get_unit_boundaries(content, unit)
+    positions = array("q", [
+        entity.span[0][0] if unit == "char" else bisect_right(boundaries, entity.span[0][0]) for entity in entities
+    ])
+    order = sorted(range(len(entities)), key=lambda i: (positions[i], entities[i].span))
+
+    # Gold relation index, keeping the first relation when a pair is annotated several times
+    gold = dict()
+    for relation in relations:
+        if relation.type in kinds:
+            gold.setdefault((relation.properties.get("Source"), relation.properties.get("Target")),
+                            relation.properties.get("Type"))
+
+    candidates = list()
+
+    upper = 0
+    for lower in range(len(order)):
+        first = entities[order[lower]]
+
+        # Moving the upper pointer to the first entity out of the window
+        upper = max(upper, lower + 1)
+        while upper < len(order) and positions[order[upper]] - positions[order[lower]] <= window:
+            upper += 1
+
+        for k in range(lower + 1, upper):
+            second = entities[order[k]]
+
+            if first.id == second.id:
+                continue
+
+            if (first.id, second.id) in gold:
+                label = gold[(first.id, second.id)]
+            elif (second.id, first.id) in gold:
+                label = "{}-1".format(gold[(second.id, first.id)])
+            else:
+                label = "NONE"
+
+            candidates.append((
+                first.id,
+                second.id,
+                ";".join(["{} {}".format(begin, end) for begin, end in first.span]),
+                ";".join(["{} {}".format(begin, end) for begin, end in second.span]),
+                positions[order[k]] - positions[order[lower]],
+                label
+            ))
+
+    # Distances of gold relations, used to compute the recall of any window size
+    entity_positions = dict()
+    for i, entity in enumerate(entities):
+        entity_positions.setdefault(entity.id, positions[i])
+
+    gold_distances = Counter()
+    unreachable_gold = 0
+
+    for source, target in gold:
+        if source in entity_positions and target in entity_positions and source != target:
+            gold_distances[abs(entity_positions[source] - entity_positions[target])] += 1
+        else:
+            unreachable_gold += 1
+
+    return None, candidates, gold_distances, unreachable_gold
+
+
+def get_unit_boundaries(content: str = None,
+                        unit: str = "char") -> array:
+    """
+    Compute the offsets where a new window unit begins: after each sentence end (period, question or exclamation mark
+    followed by a space, or line break) or at each section start marker
+
+    Args:
+        content (str): document content
+        unit (str): window unit, 'char', 'sentence' or 'section'
+
+    Returns:
+        array: sorted unit beginning offsets (empty for the 'char' unit)
+    """
+
+    if unit == "sentence":
+        return array("q", [match.end() for match in REGEX_SENTENCE_END.finditer(content)])
+
+    if unit == "section":
+        return array("q", [match.start() for match in REGEX_SECTION_START.finditer(content)])
+
+    return array("q")
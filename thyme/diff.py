@@ -0,0 +1,359 @@
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+from .anafora import correct_span, get_anafora_entities, get_anafora_relations, get_corrected_txt_content, \
+    get_offset_map, map_entity_spans, plan_anafora_documents
+from .brat import parse_ann_file
+from .utils import translate_newlines
+
+INPUT_FORMATS = ["brat", "anafora"]
+
+REGEX_SAVETIME = re.compile(rb"<savetime>[^<]*</savetime>")
+
+
+def diff_dirs(input_dir_a: str = None,
+              format_a: str = "brat",
+              input_dir_b: str = None,
+              format_b: str = "brat",
+              input_thyme_path: str = None,
+              preproc_file_path: str = None,
+              n_jobs: int = 1) -> dict:
+    """
+    Compare the annotations of two directories, in brat or anafora format. When both directories have the same format,
+    documents whose raw content is identical (anafora 'savetime' elements excepted) are skipped without being parsed.
+    Other documents are reduced to a fingerprint of their normalised annotations, only documents whose fingerprints
+    differ are compared in detail.
+
+    Brat spans refer to the corrected text: when a brat directory is compared with an anafora directory, anafora spans
+    are moved to the corrected text and corrected as done by the anafora to brat conversion, which requires the text
+    corpus and the preprocessing file.
+
+    Args:
+        input_dir_a (str): first annotation directory
+        format_a (str): first directory format (brat or anafora)
+        input_dir_b (str): second annotation directory
+        format_b (str): second directory format (brat or anafora)
+        input_thyme_path (str): corpus path (text format), required when the formats differ
+        preproc_file_path (str): preprocessing filepath (json format), required when the formats differ
+        n_jobs (int): number of worker processes
+
+    Returns:
+        dict: identical documents, documents found in only one directory and differences by document ID
+    """
+
+    preproc_payload = None
+
+    if format_a != format_b:
+        if input_thyme_path is None or preproc_file_path is None:
+            raise Exception("Comparing brat and anafora directories requires the text corpus and the preprocessing "
+                            "file")
+
+        # Loading json content
+        preproc_payload = json.load(open(os.path.abspath(preproc_file_path), "r", encoding="UTF-8"))
+
+    documents_a = list_documents(input_dir_a, format_a)
+    documents_b = list_documents(input_dir_b, format_b)
+
+    common = sorted(set(documents_a) & set(documents_b))
+
+    # Text documents used to correct anafora spans, when the formats differ
+    source_txt_files = dict.fromkeys(common)
+    if preproc_payload is not None:
+        source_txt_files = {
+            document_id: os.path.join(os.path.abspath(input_thyme_path), document_id) for document_id in common
+        }
+
+    report = {
+        "identical": list(),
+        "only_a": sorted(set(documents_a) - set(documents_b)),
+        "only_b": sorted(set(documents_b) - set(documents_a)),
+        "differences": dict()
+    }
+
+    # Documents are processed in the current process when a single job is requested
+    with ProcessPoolExecutor(max_workers=n_jobs) if n_jobs > 1 else nullcontext() as executor:
+        map_function = executor.map if executor is not None else map
+
+        # Hashing raw contents of both sides, which can only match if both directories have the same format
+        candidates = common
+        if format_a == format_b:
+            digests_a = map_function(hash_raw_document, [documents_a[d] for d in common], [format_a] * len(common))
+            digests_b = map_function(hash_raw_document, [documents_b[d] for d in common], [format_b] * len(common))
+
+            candidates = list()
+            for document_id, digest_a, digest_b in zip(common, digests_a, digests_b):
+                if digest_a == digest_b:
+                    report["identical"].append(document_id)
+                else:
+                    candidates.append(document_id)
+
+        # Fingerprinting the normalised annotations of both sides
+        fingerprints_a = map_function(fingerprint_document, [documents_a[d] for d in candidates],
+                                      [format_a] * len(candidates), [source_txt_files[d] for d in candidates],
+                                      [preproc_payload] * len(candidates))
+        fingerprints_b = map_function(fingerprint_document, [documents_b[d] for d in candidates],
+                                      [format_b] * len(candidates), [source_txt_files[d] for d in candidates],
+                                      [preproc_payload] * len(candidates))
+
+        changed = list()
+        for document_id, fingerprint_a, fingerprint_b in zip(candidates, fingerprints_a, fingerprints_b):
+            if fingerprint_a == fingerprint_b:
+                report["identical"].append(document_id)
+            else:
+                changed.append(document_id)
+
+        report["identical"].sort()
+
+        # Detailed comparison of documents that differ
+        differences = map_function(
+            diff_documents,
+            [documents_a[d] for d in changed], [format_a] * len(changed),
+            [documents_b[d] for d in changed], [format_b] * len(changed),
+            [source_txt_files[d] for d in changed], [preproc_payload] * len(changed)
+        )
+
+        for document_id, document_differences in zip(changed, differences):
+            report["differences"][document_id] = document_differences
+
+    return report
+
+
+def diff_documents(filepath_a: str = None,
+                   format_a: str = "brat",
+                   filepath_b: str = None,
+                   format_b: str = "brat",
+                   source_txt_file: str = None,
+                   preproc_payload: dict = None) -> dict:
+    """
+    Compare the normalised annotations of two documents. Entities found in only one document with the same type and
+    spans as an entity of the other document are reported as attribute differences.
+
+    Args:
+        filepath_a (str): first document filepath
+        format_a (str): first document format (brat or anafora)
+        filepath_b (str): second document filepath
+        format_b (str): second document format (brat or anafora)
+        source_txt_file (str): document filepath (text format), used to correct anafora spans (see
+            get_normalised_annotations)
+        preproc_payload (dict): preprocessing file content
+
+    Returns:
+        dict: entities, attributes and relations found in only one document
+    """
+
+    entities_a, relations_a = get_normalised_annotations(filepath_a, format_a, source_txt_file, preproc_payload)
+    entities_b, relations_b = get_normalised_annotations(filepath_b, format_b, source_txt_file, preproc_payload)
+
+    differences = {
+        "entities_only_a": list(),
+        "entities_only_b": list(),
+        "attributes": list(),
+        "relations_only_a": sorted((relations_a - relations_b).elements(), key=repr),
+        "relations_only_b": sorted((relations_b - relations_a).elements(), key=repr)
+    }
+
+    # Entities found in only one document, grouped by type and spans
+    only_a = dict()
+    for key, attributes in sorted((entities_a - entities_b).elements()):
+        only_a.setdefault(key, list()).append(attributes)
+
+    only_b = dict()
+    for key, attributes in sorted((entities_b - entities_a).elements()):
+        only_b.setdefault(key, list()).append(attributes)
+
+    for key in sorted(set(only_a) | set(only_b)):
+        attributes_list_a = list(only_a.get(key, list()))
+        attributes_list_b = list(only_b.get(key, list()))
+
+        # Pairing entities with the same type and spans, most similar attributes first
+        while attributes_list_a and attributes_list_b:
+            attributes_a, attributes_b = max(
+                [(candidate_a, candidate_b) for candidate_a in attributes_list_a for candidate_b in attributes_list_b],
+                key=lambda pair: len(set(pair[0]) & set(pair[1]))
+            )
+            attributes_list_a.remove(attributes_a)
+            attributes_list_b.remove(attributes_b)
+
+            attributes_a = dict(attributes_a)
+            attributes_b = dict(attributes_b)
+
+            for attribute in sorted(set(attributes_a) | set(attributes_b)):
+                if attributes_a.get(attribute) != attributes_b.get(attribute):
+                    differences["attributes"].append((key, attribute, attributes_a.get(attribute),
+                                                      attributes_b.get(attribute)))
+
+        differences["entities_only_a"].extend([key] * len(attributes_list_a))
+        differences["entities_only_b"].extend([key] * len(attributes_list_b))
+
+    return differences
+
+
+def fingerprint_document(filepath: str = None,
+                         input_format: str = "brat",
+                         source_txt_file: str = None,
+                         preproc_payload: dict = None) -> str:
+    """
+    Compute the fingerprint of the normalised annotations of a document
+
+    Args:
+        filepath (str): document filepath
+        input_format (str): document format (brat or anafora)
+        source_txt_file (str): document filepath (text format), used to correct anafora spans (see
+            get_normalised_annotations)
+        preproc_payload (dict): preprocessing file content
+
+    Returns:
+        str: sha1 hexadecimal digest
+    """
+
+    entities, relations = get_normalised_annotations(filepath, input_format, source_txt_file, preproc_payload)
+
+    payload = repr((
+        sorted(entities.items()),
+        sorted(relations.items(), key=repr)
+    ))
+
+    return hashlib.sha1(payload.encode("UTF-8")).hexdigest()
+
+
+def get_normalised_annotations(filepath: str = None,
+                               input_format: str = "brat",
+                               source_txt_file: str = None,
+                               preproc_payload: dict = None) -> (Counter, Counter):
+    """
+    Load the annotations of a document without any identifier: entities are identified by their type and spans and
+    relations by their type and the entities they link. The brat 'AnaforaID' attribute is ignored, anafora relations
+    are identified by their 'Type' property and attribute values are compared as written in brat files (empty anafora
+    properties become 'None'), so that brat and anafora documents can be compared. Entities and relations are counted,
+    so that annotations repeated in a document are not collapsed.
+
+    When a text document is given, anafora spans are moved to the corrected text and corrected as done by the anafora
+    to brat conversion, so that they can be compared with brat spans.
+
+    Args:
+        filepath (str): document filepath
+        input_format (str): document format (brat or anafora)
+        source_txt_file (str): document filepath (text format), used to correct anafora spans
+        preproc_payload (dict): preprocessing file content
+
+    Returns:
+        (Counter, Counter): (entity key, sorted attribute items) counts and relation key counts
+    """
+
+    entities = Counter()
+    relations = Counter()
+
+    if input_format == "brat":
+        brat_entities, brat_relations = parse_ann_file(filepath)
+
+        keys = dict()
+        for brat_id, entity in brat_entities.items():
+            keys[brat_id] = (entity["type"], tuple(sorted(entity["spans"])))
+            entities[(keys[brat_id], normalise_attributes(
+                {k: v for k, v in entity["attributes"].items() if k != "AnaforaID"}
+            ))] += 1
+
+        for relation in brat_relations.values():
+            relations[(relation["type"], keys.get(relation["arg1"]), keys.get(relation["arg2"]))] += 1
+
+    elif input_format == "anafora":
+        anafora_entities = get_anafora_entities(filepath)
+
+        # Moving entity spans to the corrected text and correcting them as the anafora to brat conversion does
+        if source_txt_file is not None:
+            content = translate_newlines(get_corrected_txt_content(source_txt_file, preproc_payload))
+
+            offset_map = get_offset_map(os.path.basename(filepath).split(".")[0], preproc_payload)
+            if not offset_map.is_identity():
+                map_entity_spans(anafora_entities, "span", offset_map.spans_to_corrected)
+
+            for entity in anafora_entities:
+                entity["span"] = [correct_span(begin, end, content)[:2] for begin, end in entity["span"]]
+
+        keys = dict()
+        for entity in anafora_entities:
+            keys.setdefault(entity["id"], (entity["type"], tuple(sorted(entity["span"]))))
+            entities[((entity["type"], tuple(sorted(entity["span"]))),
+                      normalise_attributes(entity["properties"]))] += 1
+
+        for relation in get_anafora_relations(filepath):
+            relations[(
+                "{}".format(relation["properties"].get("Type")),
+                keys.get(relation["properties"].get("Source")),
+                keys.get(relation["properties"].get("Target"))
+            )] += 1
+
+    else:
+        raise Exception("Invalid input format: {}".format(input_format))
+
+    return entities, relations
+
+
+def hash_raw_document(filepath: str = None,
+                      input_format: str = "brat") -> str:
+    """
+    Compute the digest of the raw content of a document, without parsing it. Anafora 'savetime' elements are removed
+    as they change with every conversion.
+
+    Args:
+        filepath (str): document filepath
+        input_format (str): document format (brat or anafora)
+
+    Returns:
+        str: sha1 hexadecimal digest
+    """
+
+    with open(filepath, "rb") as input_file:
+        content = input_file.read()
+
+    if input_format == "anafora":
+        content = REGEX_SAVETIME.sub(b"", content)
+
+    return hashlib.sha1(content).hexdigest()
+
+
+def list_documents(input_dir: str = None,
+                   input_format: str = "brat") -> dict:
+    """
+    List the documents of an annotation directory
+
+    Args:
+        input_dir (str): annotation directory
+        input_format (str): directory format (brat or anafora)
+
+    Returns:
+        dict: document filepath by document ID
+    """
+
+    if input_format == "anafora":
+        work_items, _ = plan_anafora_documents(input_dir)
+        return dict(work_items)
+
+    documents = dict()
+
+    for root, dirs, files in os.walk(os.path.abspath(input_dir)):
+        for filename in files:
+            if re.match(r"^.*\.ann$", filename):
+                documents[filename.split(".")[0]] = os.path.join(root, filename)
+
+    return documents
+
+
+def normalise_attributes(attributes: dict = None) -> tuple:
+    """
+    Normalise entity attributes: values are formatted as in brat files, where empty anafora properties are written
+    'None', and items are sorted
+
+    Args:
+        attributes (dict): attribute values by name
+
+    Returns:
+        tuple: sorted (name, value) items
+    """
+
+    return tuple(sorted((name, "{}".format(value)) for name, value in attributes.items()))
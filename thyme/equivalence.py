@@ -0,0 +1,418 @@
+import os
+import random
+import re
+import tempfile
+import time
+from xml.sax.saxutils import escape
+
+from . import anafora, brat, reference
+
+ENTITY_TYPES = ["EVENT", "TIMEX3", "SECTIONTIME", "DOCTIME"]
+
+PROPERTY_VALUES = {
+    "DocTimeRel": ["BEFORE", "OVERLAP", "AFTER", "BEFORE/OVERLAP"],
+    "Polarity": ["POS", "NEG"],
+    "Degree": ["N/A", "MOST", "LITTLE"],
+    "Class": ["DATE", "TIME", "DURATION"]
+}
+
+RELATION_TYPES = ["CONTAINS", "BEFORE", "OVERLAP", "BEGINS-ON", "ENDS-ON"]
+
+REGEX_SAVETIME = re.compile(rb"<savetime>[^<]*</savetime>")
+
+WORDS = ["patient", "tumor", "biopsy", "scan", "today", "colectomy", "CT", "x-ray", "naïve", "résection", "œdème",
+         "señal", "肿瘤", "überprüft", "Ωmega", "2010-05-12", "mg/dL", "😀", "(", ")", ",", "."]
+
+
+def check_equivalence(n_documents: int = 100,
+                      seed: int = 0,
+                      repeat: int = 5) -> dict:
+    """
+    Check that the optimised conversion functions produce the same output as the frozen reference implementation
+    (thyme.reference) on randomly generated documents, and measure the speed-up of each path. Documents raising an
+    exception are equivalent if both implementations raise the same exception type with the same message.
+
+    Generated xml files are compared byte by byte once their 'savetime' elements, which contain the conversion time,
+    are removed.
+
+    Args:
+        n_documents (int): number of generated documents
+        seed (int): random generator seed
+        repeat (int): number of timed runs of each path, the fastest one is kept
+
+    Returns:
+        dict: number of documents, failing documents, mismatches and timings by path
+    """
+
+    rng = random.Random(seed)
+
+    report = dict()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_anafora_dir = os.path.join(work_dir, "anafora")
+        input_thyme_dir = os.path.join(work_dir, "thyme")
+        input_brat_dir = os.path.join(work_dir, "brat")
+
+        for dir_path in [input_anafora_dir, input_thyme_dir, input_brat_dir]:
+            os.makedirs(dir_path)
+
+        preproc_payload = {"replace": dict(), "duplicates": list()}
+
+        # Generating random anafora and brat documents
+        documents = list()
+        for i in range(n_documents):
+            document_id = "ID{:03d}_clinic_{:03d}".format(i, rng.randrange(1000))
+            txt_content, xml_content, replacements = generate_anafora_document(rng, document_id)
+
+            os.makedirs(os.path.join(input_anafora_dir, document_id))
+
+            source_anafora_file = os.path.join(
+                input_anafora_dir, document_id, "{}.Temporal-Relation.gold.completed.xml".format(document_id)
+            )
+            source_txt_file = os.path.join(input_thyme_dir, document_id)
+            source_ann_file = os.path.join(input_brat_dir, "{}.ann".format(document_id))
+
+            with open(source_anafora_file, "w", encoding="UTF-8") as output_file:
+                output_file.write(xml_content)
+
+            with open(source_txt_file, "w", encoding="UTF-8", newline="") as output_file:
+                output_file.write(txt_content)
+
+            with open(source_ann_file, "w", encoding="UTF-8") as output_file:
+                output_file.write(generate_ann_content(rng, document_id))
+
+            if replacements:
+                preproc_payload["replace"][document_id] = replacements
+
+            documents.append((document_id, source_anafora_file, source_txt_file, source_ann_file))
+
+        # Parsing brat annotation files
+        report["parse_ann_file"] = compare_path(
+            documents,
+            lambda document, output_dir: reference.parse_ann_file(document[3]),
+            lambda document, output_dir: brat.parse_ann_file(document[3]),
+            lambda reference_output, optimised_output: reference_output == optimised_output,
+            work_dir, repeat
+        )
+
+        # Converting anafora documents to brat format
+        report["anafora_to_brat"] = compare_path(
+            documents,
+            lambda document, output_dir: reference.convert_anafora_document(
+                document[1], document[2], output_dir, preproc_payload
+            ),
+            lambda document, output_dir: anafora.convert_anafora_document(
+                document[1], document[2], output_dir, preproc_payload
+            ),
+            lambda reference_output, optimised_output: reference_output == optimised_output,
+            work_dir, repeat,
+            output_files=lambda document: ["{}.ann".format(document[0]), "{}.txt".format(document[0])]
+        )
+
+        # Converting brat documents to anafora format
+        report["brat_to_anafora"] = compare_path(
+            documents,
+            lambda document, output_dir: reference.convert_brat_document(document[3], output_dir, preproc_payload),
+            lambda document, output_dir: anafora.convert_brat_document(document[3], output_dir, preproc_payload),
+            None,
+            work_dir, repeat,
+            output_files=lambda document: [os.path.join(
+                document[0], "{}.Temporal-Relation.system.completed.xml".format(document[0])
+            )]
+        )
+
+    return report
+
+
+def compare_path(documents: list = None,
+                 reference_function=None,
+                 optimised_function=None,
+                 compare_function=None,
+                 work_dir: str = None,
+                 repeat: int = 5,
+                 output_files=None) -> dict:
+    """
+    Run the reference and optimised implementations of a conversion path on all documents and compare their outputs
+
+    Args:
+        documents (list): (document ID, anafora filepath, text filepath, brat filepath) tuples
+        reference_function (function): reference implementation, called with a document and an output directory
+        optimised_function (function): optimised implementation, called with a document and an output directory
+        compare_function (function): comparison of the values returned by both implementations, None if the
+            implementations return nothing
+        work_dir (str): working directory
+        repeat (int): number of timed runs, the fastest one is kept
+        output_files (function): relative paths of the files written for a document, compared byte by byte
+
+    Returns:
+        dict: number of documents, failing documents, mismatches, timings and speed-up
+    """
+
+    reference_dir = tempfile.mkdtemp(dir=work_dir)
+    optimised_dir = tempfile.mkdtemp(dir=work_dir)
+
+    reference_time = None
+    optimised_time = None
+
+    # Alternating the runs of both implementations, so that they are timed in the same conditions
+    for _ in range(max(1, repeat)):
+        reference_results, elapsed = run_path(documents, reference_function, reference_dir)
+        reference_time = elapsed if reference_time is None else min(reference_time, elapsed)
+
+        optimised_results, elapsed = run_path(documents, optimised_function, optimised_dir)
+        optimised_time = elapsed if optimised_time is None else min(optimised_time, elapsed)
+
+    path_report = {
+        "documents": len(documents),
+        "failing_documents": 0,
+        "mismatches": list(),
+        "reference_time": reference_time,
+        "optimised_time": optimised_time,
+        "speedup": reference_time / optimised_time if optimised_time > 0 else None
+    }
+
+    for document, reference_result, optimised_result in zip(documents, reference_results, optimised_results):
+        reference_error, reference_output = reference_result
+        optimised_error, optimised_output = optimised_result
+
+        # Both implementations must fail on the same documents, with the same exception type and message
+        if reference_error is not None or optimised_error is not None:
+            if reference_error is None or optimised_error is None:
+                path_report["mismatches"].append({
+                    "document": document[0],
+                    "reason": "exception raised by one implementation only: {}: {}".format(
+                        *(reference_error or optimised_error)
+                    )
+                })
+            elif reference_error != optimised_error:
+                path_report["mismatches"].append({
+                    "document": document[0],
+                    "reason": "different exceptions: {}: {} / {}: {}".format(*reference_error, *optimised_error)
+                })
+            else:
+                path_report["failing_documents"] += 1
+            continue
+
+        if compare_function is not None and not compare_function(reference_output, optimised_output):
+            path_report["mismatches"].append({"document": document[0], "reason": "different return values"})
+            continue
+
+        for filename in output_files(document) if output_files is not None else []:
+            if read_normalised_file(os.path.join(reference_dir, filename)) != \
+                    read_normalised_file(os.path.join(optimised_dir, filename)):
+                path_report["mismatches"].append({"document": document[0], "reason": "different file {}".format(
+                    filename
+                )})
+
+    return path_report
+
+
+def generate_anafora_document(rng: random.Random = None,
+                              document_id: str = None) -> (str, str, list):
+    """
+    Generate a random THYME document with its anafora annotations. Entities may have several spans given in any
+    order, spans may include leading and trailing spaces or line breaks, texts and property values may contain unicode
+    characters and properties may be empty. A few documents use '\\r\\n' line breaks or have a relation pointing to an
+    unknown entity, both implementations failing on them.
+
+    Args:
+        rng (random.Random): random generator
+        document_id (str): document ID
+
+    Returns:
+        (str, str, list): text content, anafora xml content and preprocessing replacements
+    """
+
+    # A few documents use '\r\n' line breaks, which shift the offsets of the text read back by the conversion
+    separators = [" ", " ", " ", "  ", "\n", "\n\n"]
+    if rng.random() < 0.02:
+        separators.append("\r\n")
+
+    # Building text, keeping track of word offsets
+    chunks = list()
+    words = list()
+    offset = 0
+
+    for _ in range(rng.randrange(20, 300)):
+        word = rng.choice(WORDS)
+        words.append((offset, offset + len(word)))
+        chunks.append(word)
+        offset += len(word)
+
+        separator = rng.choice(separators)
+        chunks.append(separator)
+        offset += len(separator)
+
+    txt_content = "".join(chunks)
+
+    # Entities, spans may be extended to the surrounding spaces and line breaks
+    entity_ids = list()
+    entities = list()
+
+    for i in range(rng.randrange(0, len(words) // 2 + 1)):
+        entity_id = "{}@e@{}@gold".format(i, document_id)
+        if entity_ids and rng.random() < 0.01:
+            entity_id = rng.choice(entity_ids)
+        entity_ids.append(entity_id)
+
+        spans = list()
+        for begin, end in rng.sample(words, min(len(words), rng.choice([1, 1, 1, 2, 3]))):
+            for _ in range(rng.choice([0, 0, 0, 1, 2])):
+                if begin > 0 and txt_content[begin - 1] in " \n":
+                    begin -= 1
+            for _ in range(rng.choice([0, 0, 0, 1, 2])):
+                if end < len(txt_content) and txt_content[end] in " \n":
+                    end += 1
+            spans.append("{},{}".format(begin, end))
+
+        properties = list()
+        for name in rng.sample(list(PROPERTY_VALUES), rng.randrange(0, len(PROPERTY_VALUES) + 1)):
+            if rng.random() < 0.15:
+                properties.append("<{0}/>".format(name))
+            else:
+                value = rng.choice(PROPERTY_VALUES[name] + ["été", "ñ"])
+                properties.append("<{0}>{1}</{0}>".format(name, escape(value)))
+
+        entities.append(
+            "<entity><id>{}</id><span>{}</span><type>{}</type><parentsType>TemporalEntities</parentsType>"
+            "<properties>{}</properties></entity>".format(
+                entity_id, ";".join(spans), rng.choice(ENTITY_TYPES), "".join(properties)
+            )
+        )
+
+    # Relations, a few documents have one relation pointing to an unknown entity
+    relations = list()
+    dangling = rng.random() < 0.01
+
+    for i in range(rng.randrange(0, len(entity_ids) + 1) if entity_ids else 0):
+        source = rng.choice(entity_ids)
+        target = rng.choice(entity_ids) if not dangling or i > 0 else "unknown@e@{}@gold".format(document_id)
+
+        relations.append(
+            "<relation><id>{}@r@{}@gold</id><type>{}</type><parentsType>TemporalRelations</parentsType>"
+            "<properties><Source>{}</Source><Type>{}</Type><Target>{}</Target></properties></relation>".format(
+                i, document_id, rng.choice(["TLINK", "TLINK", "ALINK"]), source, rng.choice(RELATION_TYPES), target
+            )
+        )
+
+    xml_content = "<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n<data><info><savetime>0</savetime>" \
+                  "<progress>completed</progress></info><schema></schema><annotations>{}{}</annotations></data>\n"
+
+    # Preprocessing replacements, changing the text length or not, in increasing or decreasing order
+    replacements = list()
+    if words and rng.random() < 0.3:
+        for begin, end in sorted(rng.sample(words, min(len(words), rng.randrange(1, 4))), reverse=True):
+            replacements.append([begin, end, rng.choice(["X", "XXXXXXXX", txt_content[begin:end].upper()])])
+
+    return txt_content, xml_content.format("".join(entities), "".join(relations)), replacements
+
+
+def generate_ann_content(rng: random.Random = None,
+                         document_id: str = None) -> str:
+    """
+    Generate a random brat annotation file. Entities may have one or several spans, attributes may be written before
+    their entity or refer to unknown entities. A few documents have an entity without 'AnaforaID' attribute or an
+    entity ID used twice, both implementations failing on them.
+
+    Args:
+        rng (random.Random): random generator
+        document_id (str): document ID
+
+    Returns:
+        str: brat annotation content
+    """
+
+    lines = list()
+    n_entities = rng.randrange(0, 60)
+    attribute_id = 1
+
+    # A few documents have an entity without 'AnaforaID' attribute or an entity ID used twice
+    missing_anafora_id = rng.randrange(1, n_entities + 1) if n_entities > 0 and rng.random() < 0.01 else None
+    duplicate_id = rng.randrange(2, n_entities + 1) if n_entities > 1 and rng.random() < 0.01 else None
+
+    for i in range(1, n_entities + 1):
+        spans = list()
+        for _ in range(rng.choice([1, 1, 2, 3])):
+            begin = rng.randrange(0, 5000)
+            spans.append("{} {}".format(begin, begin + rng.randrange(1, 20)))
+
+        brat_id = i if i != duplicate_id else rng.randrange(1, i + 1)
+        entity_line = "T{}\t{} {}\t{}\n".format(
+            brat_id, rng.choice(ENTITY_TYPES), ";".join(spans), " ".join(rng.sample(WORDS, len(spans)))
+        )
+
+        attribute_lines = list()
+        for name in rng.sample(list(PROPERTY_VALUES), rng.randrange(0, 3)):
+            attribute_lines.append("A{}\t{} T{} {}\n".format(
+                attribute_id, name, brat_id, rng.choice(PROPERTY_VALUES[name] + ["None", "été"])
+            ))
+            attribute_id += 1
+
+        if i != missing_anafora_id:
+            attribute_lines.append("A{}\tAnaforaID T{} {}@e@{}@gold\n".format(attribute_id, brat_id, i, document_id))
+            attribute_id += 1
+
+        if rng.random() < 0.05:
+            attribute_lines.append("A{}\tDocTimeRel T{} AFTER\n".format(attribute_id, n_entities + 10))
+            attribute_id += 1
+
+        # Attributes are usually written after their entity
+        if rng.random() < 0.1:
+            lines.extend(attribute_lines + [entity_line])
+        else:
+            lines.extend([entity_line] + attribute_lines)
+
+        if rng.random() < 0.05:
+            lines.append("#{}\tAnnotatorNotes T{}\tnote\n".format(i, brat_id))
+
+    for i in range(1, (rng.randrange(0, n_entities) if n_entities else 0) + 1):
+        lines.append("R{}\t{} Arg1:T{} Arg2:T{}\n".format(
+            i, rng.choice(RELATION_TYPES), rng.randrange(1, n_entities + 1), rng.randrange(1, n_entities + 1)
+        ))
+
+    return "".join(lines)
+
+
+def read_normalised_file(filepath: str = None) -> bytes:
+    """
+    Read a file for comparison, without the 'savetime' elements of xml files
+
+    Args:
+        filepath (str): filepath
+
+    Returns:
+        bytes: file content, None if the file does not exist
+    """
+
+    if not os.path.isfile(filepath):
+        return None
+
+    with open(filepath, "rb") as input_file:
+        return REGEX_SAVETIME.sub(b"", input_file.read())
+
+
+def run_path(documents: list = None,
+             function=None,
+             output_dir: str = None) -> (list, float):
+    """
+    Run a conversion function on all documents
+
+    Args:
+        documents (list): (document ID, anafora filepath, text filepath, brat filepath) tuples
+        function (function): conversion function, called with a document and an output directory
+        output_dir (str): output directory
+
+    Returns:
+        (list, float): ((exception type name, exception message), returned value) by document and elapsed time
+    """
+
+    results = list()
+    start = time.perf_counter()
+
+    for document in documents:
+        try:
+            results.append((None, function(document, output_dir)))
+        except Exception as e:
+            results.append(((type(e).__name__, str(e)), None))
+
+    return results, time.perf_counter() - start
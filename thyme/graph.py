@@ -0,0 +1,391 @@
+from .anafora import get_anafora_relations
+from .models import Relation
+
+CLOSED_RELATION_TYPES = ["BEFORE", "CONTAINS"]
+
+
+def iter_bits(bitset: int = None):
+    """
+    Iterate over the positions of the bits set in an integer
+
+    Args:
+        bitset (int): integer used as a bitset
+
+    Returns:
+        generator: bit positions in increasing order
+    """
+
+    while bitset:
+        lowest = bitset & -bitset
+        yield lowest.bit_length() - 1
+        bitset ^= lowest
+
+
+def count_bits(bitset: int = None) -> int:
+    """
+    Count the number of bits set in an integer
+
+    Args:
+        bitset (int): integer used as a bitset
+
+    Returns:
+        int: number of bits set
+    """
+
+    return bin(bitset).count("1")
+
+
+class RelationGraph:
+    """
+    Temporal relation graph of a THYME document. Entities are mapped to consecutive integers and each closed relation
+    is stored as one bitset (Python integer) per entity, in both directions:
+
+    * inside[a]: entities contained by a, including a itself
+    * container[a]: entities containing a, including a itself
+    * after[a]: entities that a is before
+    * before[a]: entities before a
+
+    CONTAINS and BEFORE are closed incrementally each time a relation is added, using transitivity and the fact that
+    an entity contained by A is before (resp. after) everything that A is before (resp. after). OVERLAP, BEGINS-ON,
+    ENDS-ON and ALINK relations are stored but not closed. Relations contradicting the current closure (cycles,
+    BEFORE between nested or overlapping entities, etc.) are not added and are reported in 'contradictions'.
+    """
+
+    def __init__(self):
+        self.ids = list()
+        self.index = dict()
+
+        self.inside = list()
+        self.container = list()
+        self.after = list()
+        self.before = list()
+        self.overlap = list()
+
+        # Explicit relations: (source, relation kind, relation type, target) with integer entities
+        self.relations = list()
+        self.successors = dict()
+
+        # Contradicting relations: (source ID, relation type, target ID, reason)
+        self.contradictions = list()
+
+        # Previous bitset values, used to roll back a relation that turns out to be contradicting
+        self._journal = list()
+
+    @classmethod
+    def from_anafora_file(cls, source_anafora_filepath: str = None):
+        """
+        Build the relation graph of a THYME corpus anafora file
+
+        Args:
+            source_anafora_filepath (str): source anafora filepath
+
+        Returns:
+            RelationGraph: relation graph
+        """
+
+        return cls.from_anafora_relations(get_anafora_relations(source_anafora_filepath))
+
+    @classmethod
+    def from_anafora_relations(cls, relations: list = None):
+        """
+        Build a relation graph from relations extracted with get_anafora_relations (dictionaries) or
+        get_anafora_records (Relation records)
+
+        Args:
+            relations (list): anafora relation list
+
+        Returns:
+            RelationGraph: relation graph
+        """
+
+        graph = cls()
+
+        for relation in relations:
+            if isinstance(relation, Relation):
+                kind, properties = relation.type, relation.properties
+            else:
+                kind, properties = relation["type"], relation["properties"]
+
+            graph.add_relation(properties["Source"], properties["Type"], properties["Target"], kind=kind)
+
+        return graph
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add_entity(self, entity_id: str = None) -> int:
+        """
+        Add an entity to the graph if it is not already present
+
+        Args:
+            entity_id (str): entity ID
+
+        Returns:
+            int: entity index
+        """
+
+        if entity_id in self.index:
+            return self.index[entity_id]
+
+        i = len(self.ids)
+
+        self.index[entity_id] = i
+        self.ids.append(entity_id)
+
+        self.inside.append(1 << i)
+        self.container.append(1 << i)
+        self.after.append(0)
+        self.before.append(0)
+        self.overlap.append(0)
+
+        return i
+
+    def add_relation(self, source: str = None,
+                     relation_type: str = None,
+                     target: str = None,
+                     kind: str = "TLINK") -> bool:
+        """
+        Add a relation to the graph and update the closure
+
+        Args:
+            source (str): source entity ID
+            relation_type (str): relation type (e.g. CONTAINS, BEFORE, OVERLAP)
+            target (str): target entity ID
+            kind (str): relation kind (TLINK or ALINK)
+
+        Returns:
+            bool: 'False' if the relation contradicts the graph and was not added, 'True' otherwise
+        """
+
+        u = self.add_entity(source)
+        v = self.add_entity(target)
+
+        self._journal.clear()
+
+        if kind == "TLINK" and relation_type == "CONTAINS":
+            reason = self._add_contains(u, v)
+        elif kind == "TLINK" and relation_type == "BEFORE":
+            reason = self._close_before(self.inside[u], self.inside[v])
+        elif kind == "TLINK" and relation_type == "OVERLAP":
+            reason = self._add_overlap(u, v)
+        else:
+            reason = None
+
+        if reason is not None:
+            for bitsets, i, value in reversed(self._journal):
+                bitsets[i] = value
+
+            self.contradictions.append((source, relation_type, target, reason))
+            return False
+
+        self.relations.append((u, kind, relation_type, v))
+        self.successors.setdefault(relation_type, dict()).setdefault(u, list()).append(v)
+
+        return True
+
+    def _add_contains(self, u: int = None,
+                      v: int = None) -> str:
+        """
+        Add a CONTAINS relation and propagate it to the closure
+
+        Args:
+            u (int): container entity
+            v (int): contained entity
+
+        Returns:
+            str: contradiction reason, None if the relation was added
+        """
+
+        if u == v or (self.inside[v] >> u) & 1:
+            return "cycle"
+
+        containers = self.container[u]
+        contained = self.inside[v]
+
+        # New nested entities must not be ordered by BEFORE
+        for a in iter_bits(containers):
+            if (self.after[a] | self.before[a]) & contained:
+                return "nested entities ordered by BEFORE"
+
+        for a in iter_bits(containers):
+            self._update(self.inside, a, contained)
+
+        for b in iter_bits(contained):
+            self._update(self.container, b, containers)
+
+        # Contained entities inherit BEFORE relations of their containers
+        for a in iter_bits(containers):
+            if self.before[a]:
+                reason = self._close_before(self.before[a], contained)
+                if reason is not None:
+                    return reason
+
+            if self.after[a]:
+                reason = self._close_before(contained, self.after[a])
+                if reason is not None:
+                    return reason
+
+        return None
+
+    def _add_overlap(self, u: int = None,
+                     v: int = None) -> str:
+        """
+        Add an OVERLAP relation
+
+        Args:
+            u (int): source entity
+            v (int): target entity
+
+        Returns:
+            str: contradiction reason, None if the relation was added
+        """
+
+        if ((self.after[u] | self.before[u]) >> v) & 1:
+            return "overlapping entities ordered by BEFORE"
+
+        self._update(self.overlap, u, 1 << v)
+        self._update(self.overlap, v, 1 << u)
+
+        return None
+
+    def _close_before(self, left: int = None,
+                      right: int = None) -> str:
+        """
+        Assert that every entity of 'left' is before every entity of 'right' and close the BEFORE relation
+
+        Args:
+            left (int): bitset of entities, closed under containment
+            right (int): bitset of entities, closed under containment
+
+        Returns:
+            str: contradiction reason, None if the relations were added
+        """
+
+        # Everything before an entity of 'left' is also before 'right', and reciprocally
+        closed_left = left
+        for x in iter_bits(left):
+            closed_left |= self.before[x]
+
+        closed_right = right
+        for y in iter_bits(right):
+            closed_right |= self.after[y]
+
+        if closed_left & closed_right:
+            return "cycle"
+
+        for x in iter_bits(closed_left):
+            if (self.inside[x] | self.container[x]) & closed_right:
+                return "nested entities ordered by BEFORE"
+            if self.overlap[x] & closed_right:
+                return "overlapping entities ordered by BEFORE"
+
+        for x in iter_bits(closed_left):
+            self._update(self.after, x, closed_right)
+
+        for y in iter_bits(closed_right):
+            self._update(self.before, y, closed_left)
+
+        return None
+
+    def _update(self, bitsets: list = None,
+                i: int = None,
+                bits: int = None) -> None:
+        """
+        Set bits in the bitset of an entity, keeping track of the previous value
+
+        Args:
+            bitsets (list): bitsets of a relation (e.g. inside, after)
+            i (int): entity index
+            bits (int): bits to set
+
+        Returns:
+            None
+        """
+
+        if bits & ~bitsets[i]:
+            self._journal.append((bitsets, i, bitsets[i]))
+            bitsets[i] |= bits
+
+    def get_closure(self):
+        """
+        Iterate over the closed CONTAINS and BEFORE relations
+
+        Returns:
+            generator: (source ID, relation type, target ID) triples
+        """
+
+        for a in range(len(self.ids)):
+            for b in iter_bits(self.inside[a] & ~(1 << a)):
+                yield self.ids[a], "CONTAINS", self.ids[b]
+
+            for b in iter_bits(self.after[a]):
+                yield self.ids[a], "BEFORE", self.ids[b]
+
+    def has_relation(self, source: str = None,
+                     relation_type: str = None,
+                     target: str = None) -> bool:
+        """
+        Check if a relation holds in the closed graph
+
+        Args:
+            source (str): source entity ID
+            relation_type (str): relation type
+            target (str): target entity ID
+
+        Returns:
+            bool: 'True' if the relation is explicit or can be inferred
+        """
+
+        if source not in self.index or target not in self.index:
+            return False
+
+        u = self.index[source]
+        v = self.index[target]
+
+        if relation_type == "CONTAINS":
+            return u != v and bool((self.inside[u] >> v) & 1)
+
+        if relation_type == "BEFORE":
+            return bool((self.after[u] >> v) & 1)
+
+        if relation_type == "OVERLAP":
+            return bool((self.overlap[u] >> v) & 1)
+
+        return v in self.successors.get(relation_type, dict()).get(u, list())
+
+    def get_statistics(self) -> dict:
+        """
+        Compute closure-aware statistics
+
+        Returns:
+            dict: entity, explicit relation, closed relation and contradiction counts
+        """
+
+        explicit = dict()
+        explicit_pairs = {relation_type: set() for relation_type in CLOSED_RELATION_TYPES}
+        for u, kind, relation_type, v in self.relations:
+            key = "{}:{}".format(kind, relation_type)
+            explicit[key] = explicit.get(key, 0) + 1
+
+            if kind == "TLINK" and relation_type in explicit_pairs:
+                explicit_pairs[relation_type].add((u, v))
+
+        closed = {
+            "CONTAINS": sum(count_bits(bitset) for bitset in self.inside) - len(self.ids),
+            "BEFORE": sum(count_bits(bitset) for bitset in self.after)
+        }
+
+        contradictions = dict()
+        for _, _, _, reason in self.contradictions:
+            contradictions[reason] = contradictions.get(reason, 0) + 1
+
+        return {
+            "entities": len(self.ids),
+            "explicit": explicit,
+            "closed": closed,
+            "inferred": {
+                relation_type: closed[relation_type] - len(explicit_pairs[relation_type])
+                for relation_type in CLOSED_RELATION_TYPES
+            },
+            "contradictions": contradictions
+        }
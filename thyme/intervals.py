@@ -0,0 +1,252 @@
+import math
+from bisect import bisect_left, bisect_right
+
+
+class SpanIndex:
+    """
+    Static interval index over the entity spans of a document. Each span fragment of an entity (split entities have
+    several fragments) is stored once. Fragments are sorted by begin offset and organised as an implicit balanced
+    binary tree where each node keeps the minimum and maximum end offsets of its subtree, so that overlap, containment
+    and inclusion queries only visit subtrees holding matching fragments.
+
+    Spans are half-open intervals [begin, end), as in anafora and brat files. A zero-length fragment overlaps a span
+    when it lies strictly inside it, and is contained in a span when it lies inside it or on one of its bounds.
+    """
+
+    def __init__(self, entities: dict = None):
+        """
+        Build the index
+
+        Args:
+            entities (dict): span list by entity key, spans being (begin, end) tuples
+        """
+
+        self.spans = {key: tuple(sorted(spans)) for key, spans in entities.items()}
+        self._bounds = {key: (spans[0][0], max(end for _, end in spans)) for key, spans in self.spans.items() if spans}
+
+        fragments = sorted(
+            (begin, end, key)
+            for key, spans in self.spans.items()
+            for begin, end in spans
+        )
+
+        self._begins = [begin for begin, _, _ in fragments]
+        self._ends = [end for _, end, _ in fragments]
+        self._keys = [key for _, _, key in fragments]
+
+        # Fragment ends sorted independently, used for nearest neighbour queries
+        ends = sorted((end, i) for i, end in enumerate(self._ends))
+        self._sorted_ends = [end for end, _ in ends]
+        self._sorted_ends_idx = [i for _, i in ends]
+
+        self._max_ends = [0] * len(fragments)
+        self._min_ends = [0] * len(fragments)
+        self._build(0, len(fragments))
+
+    @classmethod
+    def from_anafora_entities(cls, entities: list = None):
+        """
+        Build an index from entities extracted with get_anafora_entities or correct_entity_spans
+
+        Args:
+            entities (list): anafora entity list
+
+        Returns:
+            SpanIndex: index where entities are identified by their anafora ID
+        """
+
+        return cls({entity["id"]: entity["span"] for entity in entities})
+
+    @classmethod
+    def from_brat_entities(cls, entities: dict = None):
+        """
+        Build an index from entities extracted with parse_ann_file
+
+        Args:
+            entities (dict): brat entities by brat ID
+
+        Returns:
+            SpanIndex: index where entities are identified by their brat ID
+        """
+
+        return cls({brat_id: entity["spans"] for brat_id, entity in entities.items()})
+
+    def __len__(self):
+        return len(self.spans)
+
+    def _build(self, lo: int = None,
+               hi: int = None) -> tuple:
+        """
+        Compute the minimum and maximum end offsets of each subtree, the root of range [lo, hi) being its middle
+        element
+
+        Args:
+            lo (int): range start
+            hi (int): range end (excluded)
+
+        Returns:
+            (float, float): minimum and maximum end offsets of the range
+        """
+
+        if lo >= hi:
+            return math.inf, -math.inf
+
+        mid = (lo + hi) // 2
+        left_min, left_max = self._build(lo, mid)
+        right_min, right_max = self._build(mid + 1, hi)
+
+        self._min_ends[mid] = min(self._ends[mid], left_min, right_min)
+        self._max_ends[mid] = max(self._ends[mid], left_max, right_max)
+
+        return self._min_ends[mid], self._max_ends[mid]
+
+    def _find_fragments(self, begin_min: float = -math.inf,
+                        begin_max: float = math.inf,
+                        end_min: float = -math.inf,
+                        end_max: float = math.inf) -> list:
+        """
+        Find the fragments whose begin and end offsets lie within bounds (included). Subtrees are skipped when their
+        begin offsets or their end offsets cannot lie within the bounds.
+
+        Args:
+            begin_min (float): minimum begin offset
+            begin_max (float): maximum begin offset
+            end_min (float): minimum end offset
+            end_max (float): maximum end offset
+
+        Returns:
+            list: fragment positions
+        """
+
+        fragments = list()
+        stack = [(0, len(self._begins))]
+
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+
+            mid = (lo + hi) // 2
+
+            # No fragment of this subtree ends within the bounds
+            if self._max_ends[mid] < end_min or self._min_ends[mid] > end_max:
+                continue
+
+            # Fragments on the left begin before the current one and fragments on the right after it
+            if self._begins[mid] >= begin_min:
+                stack.append((lo, mid))
+
+            if self._begins[mid] <= begin_max:
+                stack.append((mid + 1, hi))
+
+            if begin_min <= self._begins[mid] <= begin_max and end_min <= self._ends[mid] <= end_max:
+                fragments.append(mid)
+
+        return fragments
+
+    def overlapping(self, begin: int = None,
+                    end: int = None) -> set:
+        """
+        Find entities having at least one fragment overlapping a span
+
+        Args:
+            begin (int): span begin offset
+            end (int): span end offset
+
+        Returns:
+            set: entity keys
+        """
+
+        return {self._keys[i] for i in self._find_fragments(begin_max=end - 1, end_min=begin + 1)}
+
+    def containing(self, begin: int = None,
+                   end: int = None) -> set:
+        """
+        Find entities having one fragment that covers a whole span
+
+        Args:
+            begin (int): span begin offset
+            end (int): span end offset
+
+        Returns:
+            set: entity keys
+        """
+
+        return {self._keys[i] for i in self._find_fragments(begin_max=begin, end_min=end)}
+
+    def contained(self, begin: int = None,
+                  end: int = None) -> set:
+        """
+        Find entities whose fragments all lie within a span
+
+        Args:
+            begin (int): span begin offset
+            end (int): span end offset
+
+        Returns:
+            set: entity keys
+        """
+
+        candidates = {self._keys[i] for i in self._find_fragments(begin_min=begin, begin_max=end, end_max=end)}
+
+        # Split entities must have every fragment within the span
+        return {key for key in candidates if self._bounds[key][0] >= begin and self._bounds[key][1] <= end}
+
+    def nearest(self, begin: int = None,
+                end: int = None,
+                exclude: set = None) -> tuple:
+        """
+        Find the closest entities on the left and on the right of a span. Entities overlapping the span are ignored.
+        Fragments are found by bisection, only fragments of ignored entities are scanned past.
+
+        Args:
+            begin (int): span begin offset
+            end (int): span end offset
+            exclude (set): entity keys to ignore
+
+        Returns:
+            ((key, distance), (key, distance)): closest entities on the left and on the right, None if there is none
+        """
+
+        exclude = exclude or set()
+        overlapping = self.overlapping(begin, end)
+
+        left = None
+        i = bisect_right(self._sorted_ends, begin) - 1
+        while i >= 0:
+            key = self._keys[self._sorted_ends_idx[i]]
+            if key not in exclude and key not in overlapping:
+                left = (key, begin - self._sorted_ends[i])
+                break
+            i -= 1
+
+        right = None
+        i = bisect_left(self._begins, end)
+        while i < len(self._begins):
+            key = self._keys[i]
+            if key not in exclude and key not in overlapping:
+                right = (key, self._begins[i] - end)
+                break
+            i += 1
+
+        return left, right
+
+    def overlapping_pairs(self) -> set:
+        """
+        Compute all pairs of distinct entities having overlapping fragments
+
+        Returns:
+            set: (key, key) pairs, each pair is reported once with its keys sorted
+        """
+
+        pairs = set()
+
+        for i, (begin, end) in enumerate(zip(self._begins, self._ends)):
+            j = i + 1
+            # Fragments are sorted by begin offset, scanning stops at the first one beginning after the current end
+            while j < len(self._begins) and self._begins[j] < end:
+                if self._keys[i] != self._keys[j]:
+                    pairs.add(tuple(sorted((self._keys[i], self._keys[j]), key=str)))
+                j += 1
+
+        return pairs
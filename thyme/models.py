@@ -0,0 +1,142 @@
+import sys
+
+
+def intern_string(value: str = None):
+    """
+    Intern a string so that repeated types, property names and property values share a single object
+
+    Args:
+        value (str): input string, may be None (empty anafora property)
+
+    Returns:
+        str: interned string
+    """
+
+    if value is None:
+        return None
+
+    return sys.intern(value)
+
+
+class Entity:
+    """
+    THYME corpus entity. Spans are (begin, end) tuples and the text of each span is filled once spans are corrected.
+    """
+
+    __slots__ = ("id", "type", "properties", "span", "text", "brat_id")
+
+    def __init__(self, entity_id: str = None,
+                 entity_type: str = None,
+                 properties: dict = None,
+                 span: tuple = None):
+        self.id = entity_id
+        self.type = intern_string(entity_type)
+        self.properties = properties if properties is not None else dict()
+        self.span = span if span is not None else tuple()
+        self.text = None
+        self.brat_id = None
+
+    @classmethod
+    def from_dict(cls, entity: dict = None):
+        """
+        Build an entity from the dictionary returned by extract_anafora_entities or correct_entity_spans
+
+        Args:
+            entity (dict): entity dictionary
+
+        Returns:
+            Entity: entity
+        """
+
+        record = cls(entity["id"], entity["type"], entity["properties"], tuple(entity["span"]))
+
+        if "text" in entity:
+            record.text = tuple(entity["text"])
+
+        if "brat_id" in entity:
+            record.brat_id = entity["brat_id"]
+
+        return record
+
+    def to_dict(self) -> dict:
+        """
+        Convert the entity to the dictionary format used by extract_anafora_entities and correct_entity_spans
+
+        Returns:
+            dict: entity dictionary
+        """
+
+        entity = {
+            "id": self.id,
+            "type": self.type,
+            "properties": dict(self.properties),
+            "span": list(self.span)
+        }
+
+        if self.text is not None:
+            entity["text"] = list(self.text)
+
+        if self.brat_id is not None:
+            entity["brat_id"] = self.brat_id
+
+        return entity
+
+
+class Relation:
+    """
+    THYME corpus relation. Brat fields are filled once the entities it links have brat IDs.
+    """
+
+    __slots__ = ("id", "type", "properties", "brat_id", "brat_name", "brat_arg1", "brat_arg2")
+
+    def __init__(self, relation_id: str = None,
+                 relation_type: str = None,
+                 properties: dict = None):
+        self.id = relation_id
+        self.type = intern_string(relation_type)
+        self.properties = properties if properties is not None else dict()
+        self.brat_id = None
+        self.brat_name = None
+        self.brat_arg1 = None
+        self.brat_arg2 = None
+
+    @classmethod
+    def from_dict(cls, relation: dict = None):
+        """
+        Build a relation from the dictionary returned by extract_anafora_relations or compute_brat_relations
+
+        Args:
+            relation (dict): relation dictionary
+
+        Returns:
+            Relation: relation
+        """
+
+        record = cls(relation["id"], relation["type"], relation["properties"])
+
+        record.brat_id = relation.get("brat_id")
+        record.brat_name = relation.get("brat_name")
+        record.brat_arg1 = relation.get("brat_arg1")
+        record.brat_arg2 = relation.get("brat_arg2")
+
+        return record
+
+    def to_dict(self) -> dict:
+        """
+        Convert the relation to the dictionary format used by extract_anafora_relations and compute_brat_relations
+
+        Returns:
+            dict: relation dictionary
+        """
+
+        relation = {
+            "id": self.id,
+            "type": self.type,
+            "properties": dict(self.properties)
+        }
+
+        for key in ["brat_arg1", "brat_arg2", "brat_name", "brat_id"]:
+            if getattr(self, key) is not None:
+                relation[key] = getattr(self, key)
+
+        return relation
@@ -0,0 +1,426 @@
+from array import array
+from bisect import bisect_left
+
+# Optional dependency, span arrays are mapped in vectorised form when it is available
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class OffsetMap:
+    """
+    Character offset mapping between an original THYME document and its corrected version (see preprocessing.json).
+
+    Edits are stored as run-length arrays sorted by position: the original region [original_begins[k],
+    original_ends[k]) was replaced by the corrected region [corrected_begins[k], corrected_ends[k]). Between two edits,
+    the offset delta is constant and equal to corrected_ends[k] - original_ends[k].
+
+    Offsets falling strictly inside a replaced region are moved to the region boundaries: to the beginning of the
+    region for span begin offsets and to its end for span end offsets, so that mapped spans cover the whole region.
+    """
+
+    def __init__(self, edits: list = None):
+        """
+        Build the mapping
+
+        Args:
+            edits (list): sorted and non-overlapping (original begin, original end, corrected length) edits
+        """
+
+        self.original_begins = array("q")
+        self.original_ends = array("q")
+        self.corrected_begins = array("q")
+        self.corrected_ends = array("q")
+
+        delta = 0
+
+        for begin, end, length in edits or []:
+            self.original_begins.append(begin)
+            self.original_ends.append(end)
+            self.corrected_begins.append(begin + delta)
+            self.corrected_ends.append(begin + delta + length)
+
+            delta += length - (end - begin)
+
+    @classmethod
+    def from_replacements(cls, replacements: list = None):
+        """
+        Build the mapping from replacements applied one after the other, as in preprocessing.json: offsets of each
+        replacement refer to the text produced by the previous ones.
+
+        Args:
+            replacements (list): (begin, end, replacement text) triples
+
+        Returns:
+            OffsetMap: offset mapping
+        """
+
+        replacements = replacements or []
+        order = get_replacement_order(replacements)
+
+        # Replacements sorted by decreasing position do not shift each other
+        if order == "descending":
+            return cls([(begin, end, len(text)) for begin, end, text in reversed(replacements)])
+
+        # Replacements sorted by increasing position are shifted by the previous ones
+        if order == "ascending":
+            edits = list()
+            delta = 0
+
+            for begin, end, text in replacements:
+                edits.append((begin - delta, end - delta, len(text)))
+                delta += len(text) - (end - begin)
+
+            return cls(edits)
+
+        # Any other order: replacements are merged one by one into the current edits
+        edits = list()
+        for begin, end, text in replacements:
+            edits = merge_edit(edits, begin, end, len(text))
+
+        return cls(edits)
+
+    def __len__(self):
+        return len(self.original_begins)
+
+    def is_identity(self) -> bool:
+        """
+        Check if the mapping leaves every offset unchanged
+
+        Returns:
+            bool: 'True' if no edit changes the text length or if there is no edit
+        """
+
+        return all(
+            self.original_begins[k] == self.corrected_begins[k] and self.original_ends[k] == self.corrected_ends[k]
+            for k in range(len(self))
+        )
+
+    def to_corrected(self, offset: int = None,
+                     is_end: bool = False) -> int:
+        """
+        Map an original offset to the corrected document
+
+        Args:
+            offset (int): original offset
+            is_end (bool): 'True' for span end offsets
+
+        Returns:
+            int: corrected offset
+        """
+
+        return map_offset(offset, is_end, self.original_begins, self.original_ends,
+                          self.corrected_begins, self.corrected_ends)
+
+    def to_original(self, offset: int = None,
+                    is_end: bool = False) -> int:
+        """
+        Map a corrected offset to the original document
+
+        Args:
+            offset (int): corrected offset
+            is_end (bool): 'True' for span end offsets
+
+        Returns:
+            int: original offset
+        """
+
+        return map_offset(offset, is_end, self.corrected_begins, self.corrected_ends,
+                          self.original_begins, self.original_ends)
+
+    def spans_to_corrected(self, spans: list = None) -> list:
+        """
+        Map a list of original spans to the corrected document
+
+        Args:
+            spans (list): (begin, end) tuples
+
+        Returns:
+            list: mapped (begin, end) tuples, in the same order
+        """
+
+        return map_spans(spans, self.original_begins, self.original_ends, self.corrected_begins, self.corrected_ends)
+
+    def spans_to_original(self, spans: list = None) -> list:
+        """
+        Map a list of corrected spans to the original document
+
+        Args:
+            spans (list): (begin, end) tuples
+
+        Returns:
+            list: mapped (begin, end) tuples, in the same order
+        """
+
+        return map_spans(spans, self.corrected_begins, self.corrected_ends, self.original_begins, self.original_ends)
+
+
+def apply_replacements(content: str = None,
+                       replacements: list = None) -> str:
+    """
+    Apply replacements one after the other to a text, offsets of each replacement referring to the text produced by
+    the previous ones. Replacements sorted by position are applied in a single pass.
+
+    Args:
+        content (str): input text
+        replacements (list): (begin, end, replacement text) triples
+
+    Returns:
+        str: corrected text
+    """
+
+    order = get_replacement_order(replacements)
+
+    # Replacements in any other order are applied one by one
+    if order is None:
+        for begin, end, replacement in replacements:
+            content = content[:begin] + replacement + content[end:]
+
+        return content
+
+    offset_map = OffsetMap.from_replacements(replacements)
+    ordered = list(reversed(replacements)) if order == "descending" else replacements
+
+    chunks = list()
+    previous_end = 0
+
+    for k, (_, _, replacement) in enumerate(ordered):
+        chunks.append(content[previous_end:offset_map.original_begins[k]])
+        chunks.append(replacement)
+        previous_end = offset_map.original_ends[k]
+
+    chunks.append(content[previous_end:])
+
+    return "".join(chunks)
+
+
+def get_replacement_order(replacements: list = None) -> str:
+    """
+    Check if sequential replacements are sorted by position without overlapping each other
+
+    Args:
+        replacements (list): (begin, end, replacement text) triples
+
+    Returns:
+        str: 'descending', 'ascending' or None if replacements are not sorted
+    """
+
+    if all(replacements[i][1] <= replacements[i - 1][0] for i in range(1, len(replacements))):
+        return "descending"
+
+    if all(replacements[i][0] >= replacements[i - 1][0] + len(replacements[i - 1][2])
+           for i in range(1, len(replacements))):
+        return "ascending"
+
+    return None
+
+
+def map_offset(offset: int = None,
+               is_end: bool = False,
+               source_begins: array = None,
+               source_ends: array = None,
+               target_begins: array = None,
+               target_ends: array = None) -> int:
+    """
+    Map an offset between two versions of a document
+
+    Args:
+        offset (int): source offset
+        is_end (bool): 'True' for span end offsets
+        source_begins (array): edit begin offsets in the source document
+        source_ends (array): edit end offsets in the source document
+        target_begins (array): edit begin offsets in the target document
+        target_ends (array): edit end offsets in the target document
+
+    Returns:
+        int: target offset
+    """
+
+    # Last edit beginning strictly before the offset
+    k = bisect_left(source_begins, offset) - 1
+
+    if k < 0:
+        return offset
+
+    if offset < source_ends[k]:
+        return target_ends[k] if is_end else target_begins[k]
+
+    return offset + target_ends[k] - source_ends[k]
+
+
+def map_spans(spans: list = None,
+              source_begins: array = None,
+              source_ends: array = None,
+              target_begins: array = None,
+              target_ends: array = None) -> list:
+    """
+    Map a list of spans between two versions of a document, in vectorised form when numpy is available (see
+    map_spans_numpy) and with a single merge pass over the edits otherwise (see map_spans_merge)
+
+    Args:
+        spans (list): (begin, end) tuples
+        source_begins (array): edit begin offsets in the source document
+        source_ends (array): edit end offsets in the source document
+        target_begins (array): edit begin offsets in the target document
+        target_ends (array): edit end offsets in the target document
+
+    Returns:
+        list: mapped (begin, end) tuples, in the same order
+    """
+
+    if len(source_begins) == 0 or len(spans) == 0:
+        return list(spans)
+
+    if numpy is not None:
+        return map_spans_numpy(spans, source_begins, source_ends, target_begins, target_ends)
+
+    return map_spans_merge(spans, source_begins, source_ends, target_begins, target_ends)
+
+
+def map_spans_merge(spans: list = None,
+                    source_begins: array = None,
+                    source_ends: array = None,
+                    target_begins: array = None,
+                    target_ends: array = None) -> list:
+    """
+    Map a list of spans between two versions of a document. Offsets are sorted once and mapped in a single merge
+    pass over the edits.
+
+    Args:
+        spans (list): (begin, end) tuples
+        source_begins (array): edit begin offsets in the source document
+        source_ends (array): edit end offsets in the source document
+        target_begins (array): edit begin offsets in the target document
+        target_ends (array): edit end offsets in the target document
+
+    Returns:
+        list: mapped (begin, end) tuples, in the same order
+    """
+
+    if len(source_begins) == 0:
+        return list(spans)
+
+    offsets = [(begin, 0, i) for i, (begin, _) in enumerate(spans)] + [(end, 1, i) for i, (_, end) in enumerate(spans)]
+    offsets.sort()
+
+    mapped = [[0, 0] for _ in range(len(spans))]
+
+    k = -1
+    for offset, is_end, i in offsets:
+
+        # Moving to the last edit beginning strictly before the offset
+        while k + 1 < len(source_begins) and source_begins[k + 1] < offset:
+            k += 1
+
+        if k < 0:
+            mapped[i][is_end] = offset
+        elif offset < source_ends[k]:
+            mapped[i][is_end] = target_ends[k] if is_end else target_begins[k]
+        else:
+            mapped[i][is_end] = offset + target_ends[k] - source_ends[k]
+
+    return [(begin, end) for begin, end in mapped]
+
+
+def map_spans_numpy(spans: list = None,
+                    source_begins: array = None,
+                    source_ends: array = None,
+                    target_begins: array = None,
+                    target_ends: array = None) -> list:
+    """
+    Map a list of spans between two versions of a document with numpy: the edit of every offset is found with one
+    binary search over the whole offset array, and offsets are shifted or moved to the edit boundaries without any
+    Python loop. Edit arrays are shared with numpy without being copied.
+
+    Args:
+        spans (list): (begin, end) tuples
+        source_begins (array): edit begin offsets in the source document
+        source_ends (array): edit end offsets in the source document
+        target_begins (array): edit begin offsets in the target document
+        target_ends (array): edit end offsets in the target document
+
+    Returns:
+        list: mapped (begin, end) tuples, in the same order
+    """
+
+    if len(source_begins) == 0:
+        return list(spans)
+
+    source_begins, source_ends, target_begins, target_ends = (
+        numpy.frombuffer(edit_offsets, dtype=numpy.int64)
+        for edit_offsets in [source_begins, source_ends, target_begins, target_ends]
+    )
+
+    offsets = numpy.array(spans, dtype=numpy.int64).reshape(-1, 2)
+
+    # Last edit beginning strictly before each offset, offsets before the first edit are not moved
+    k = numpy.searchsorted(source_begins, offsets, side="left") - 1
+    is_edited = k >= 0
+    k = numpy.maximum(k, 0)
+
+    # Offsets inside an edited region are moved to its beginning (span begins) or to its end (span ends), offsets
+    # after it are shifted by the length difference accumulated so far
+    is_inside = is_edited & (offsets < source_ends[k])
+    boundaries = numpy.stack([target_begins[k[:, 0]], target_ends[k[:, 1]]], axis=1)
+    shifted = offsets + numpy.where(is_edited, target_ends[k] - source_ends[k], 0)
+
+    return [(begin, end) for begin, end in numpy.where(is_inside, boundaries, shifted).tolist()]
+
+
+def merge_edit(edits: list = None,
+               begin: int = None,
+               end: int = None,
+               length: int = None) -> list:
+    """
+    Merge a replacement expressed in corrected offsets into a list of edits expressed in original offsets. Edits
+    overlapping the replacement are merged with it into a single edit.
+
+    Args:
+        edits (list): sorted and non-overlapping (original begin, original end, corrected length) edits
+        begin (int): replacement begin offset in the current corrected document
+        end (int): replacement end offset in the current corrected document
+        length (int): replacement length
+
+    Returns:
+        list: updated edits
+    """
+
+    before = list()
+    overlapping = list()
+    after = list()
+
+    delta_before = 0
+    delta_overlapping = 0
+    delta = 0
+
+    for edit_begin, edit_end, edit_length in edits:
+        corrected_begin = edit_begin + delta
+        corrected_end = corrected_begin + edit_length
+        edit_delta = edit_length - (edit_end - edit_begin)
+
+        if corrected_begin < end and corrected_end > begin:
+            overlapping.append((edit_begin, edit_end, corrected_begin, corrected_end))
+            delta_overlapping += edit_delta
+        elif corrected_end <= begin and not after:
+            before.append((edit_begin, edit_end, edit_length))
+            delta_before += edit_delta
+        else:
+            after.append((edit_begin, edit_end, edit_length))
+
+        delta += edit_delta
+
+    # Merged region boundaries, in corrected and original offsets
+    if overlapping and overlapping[0][2] < begin:
+        region_begin, original_begin = overlapping[0][2], overlapping[0][0]
+    else:
+        region_begin, original_begin = begin, begin - delta_before
+
+    if overlapping and overlapping[-1][3] > end:
+        region_end, original_end = overlapping[-1][3], overlapping[-1][1]
+    else:
+        region_end, original_end = end, end - delta_before - delta_overlapping
+
+    region_length = (region_end - region_begin) - (end - begin) + length
+
+    return before + [(original_begin, original_end, region_length)] + after
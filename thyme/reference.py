@@ -0,0 +1,750 @@
+"""
+Frozen reference implementation of the THYME corpus conversion, based on plain dictionaries.
+
+Functions of this module must not be optimised nor modified, except to follow an intended change of the conversion
+output. They are used by thyme.equivalence to check that the optimised functions of thyme.anafora and thyme.brat produce
+exactly the same files.
+"""
+
+import copy
+import os
+import re
+import time
+
+from lxml import etree
+
+from .utils import ensure_dir
+
+
+def assign_brat_id(elements: list = None,
+                   start: int = 1) -> (list, int):
+    """
+    Assign a brat ID for elements in a list of dictionaries
+
+    Args:
+        elements (list): element list
+        start (int): starting index
+
+    Returns:
+        (list, int): element list with brat IDs and last ID
+    """
+
+    last_id = 0
+
+    for i, el in enumerate(elements, start=start):
+        el["brat_id"] = i
+        last_id = i
+
+    return elements, last_id
+
+
+def check_adjudication(root: etree.Element = None,
+                       source_anafora_filepath: str = None) -> None:
+    """
+    Raise Exception if an anafora document contains a non-empty adjudication element
+
+    Args:
+        root (etree.Element): anafora document root element
+        source_anafora_filepath (str): anafora filepath, used in the exception message
+
+    Returns:
+        None
+    """
+
+    adjudication = root.find("./adjudication")
+    if adjudication is not None:
+        if len(adjudication) > 0:
+            raise Exception("The file {} is marked as 'completed' but contains adjudication annotations".format(
+                os.path.basename(source_anafora_filepath)
+            ))
+
+
+def compute_brat_relations(source_relations: list = None,
+                           corrected_entities: list = None) -> list:
+    """
+    Compute a brat relation list based on corrected entities and relations extracted from a THYME corpus document
+
+    Args:
+        source_relations (list): list of relations extracted from the document
+        corrected_entities (list): corrected entities with brat IDs
+
+    Returns:
+        list: brat relations
+    """
+
+    # Building entity index
+    entity_index = [entity["id"] for entity in corrected_entities]
+
+    corrected_relations = list()
+
+    # Processing relations
+    for relation in source_relations:
+        current_relation = copy.deepcopy(relation)
+
+        # Fetching source and target entities from current relation
+        source_entity = current_relation["properties"]["Source"]
+        target_entity = current_relation["properties"]["Target"]
+
+        # Computing brat name, arg1 and arg2 based on entity index and relation type
+        current_relation["brat_arg1"] = corrected_entities[entity_index.index(source_entity)]["brat_id"]
+        current_relation["brat_arg2"] = corrected_entities[entity_index.index(target_entity)]["brat_id"]
+        current_relation["brat_name"] = current_relation["properties"]["Type"]
+
+        # Appending current relation to list
+        corrected_relations.append(current_relation)
+
+    return corrected_relations
+
+
+def convert_anafora_document(source_anafora_file: str = None,
+                             source_txt_file: str = None,
+                             output_brat_path: str = None,
+                             preproc_payload: dict = None) -> int:
+    """
+    Convert a single THYME corpus document to brat format
+
+    Args:
+        source_anafora_file (str): document annotation filepath (anafora format)
+        source_txt_file (str): document filepath (text format)
+        output_brat_path (str): output path where brat files will be created
+        preproc_payload (dict): preprocessing file content
+
+    Returns:
+        int: number of corrected entities
+    """
+
+    document_id = os.path.basename(source_anafora_file).split(".")[0]
+
+    # Computing target brat file paths
+    target_ann_file = os.path.join(os.path.abspath(output_brat_path), "{}.ann".format(document_id))
+    target_txt_file = os.path.join(os.path.abspath(output_brat_path), "{}.txt".format(document_id))
+
+    # Copying and correcting if necessary text document
+    correct_and_copy_txt_file(source_txt_file, target_txt_file, preproc_payload)
+
+    # Fetching entities and relations from anofora file
+    entities = get_anafora_entities(source_anafora_file)
+    relations = get_anafora_relations(source_anafora_file)
+
+    # Moving entity spans to the corrected text if corrections changed its length
+    replacements = preproc_payload["replace"].get(document_id) or []
+    if any(len(text) != end - begin for begin, end, text in replacements):
+        map_entity_spans(entities, "span", lambda spans: [
+            (map_offset(begin, False, replacements), map_offset(end, True, replacements)) for begin, end in spans
+        ])
+
+    # Correcting entity spans and assigning a brat ID to entities
+    corrected_entities, nb = correct_entity_spans(entities, target_txt_file)
+    corrected_entities, last_entity_id = assign_brat_id(corrected_entities)
+
+    # Computing brat relations and assigning a brat ID to relations
+    corrected_relations = compute_brat_relations(relations, corrected_entities)
+    corrected_relations, last_relation_id = assign_brat_id(corrected_relations)
+
+    property_id = 1
+
+    # Writing relations, entities and attributes to file
+    with open(target_ann_file, "w", encoding="UTF-8") as output_file:
+
+        # Entities
+        for entity in corrected_entities:
+            output_file.write(
+                "T{}\t{} {}\t{}\n".format(
+                    entity["brat_id"],
+                    entity["type"],
+                    ";".join(["{} {}".format(begin, end) for begin, end in entity["span"]]),
+                    " ".join(entity["text"])
+                )
+            )
+
+            # Entity attributes
+            for prop_name, prop_value in entity["properties"].items():
+                output_file.write(
+                    "A{}\t{} T{} {}\n".format(
+                        property_id,
+                        prop_name,
+                        entity["brat_id"],
+                        prop_value
+                    )
+                )
+
+                property_id += 1
+
+            output_file.write(
+                "A{}\t{} T{} {}\n".format(
+                    property_id,
+                    "AnaforaID",
+                    entity["brat_id"],
+                    entity["id"]
+                )
+            )
+
+            property_id += 1
+
+        # Relations
+        for relation in corrected_relations:
+            output_file.write(
+                "R{}\t{} Arg1:T{} Arg2:T{}\n".format(
+                    relation["brat_id"],
+                    relation["brat_name"],
+                    relation["brat_arg1"],
+                    relation["brat_arg2"]
+                )
+            )
+
+    return nb
+
+
+def convert_brat_document(source_ann_file: str = None,
+                          output_anafora_dir: str = None,
+                          preproc_payload: dict = None) -> None:
+    """
+    Convert a single THYME corpus document from brat to anafora
+
+    Args:
+        source_ann_file (str): document annotation filepath (brat format)
+        output_anafora_dir (str): output path where anafora files will be created
+        preproc_payload (dict): preprocessing file content, used to report spans against the original text
+
+    Returns:
+        None
+    """
+
+    document_id = os.path.basename(source_ann_file).split(".")[0]
+
+    # Fetching entities and relations from files and converting to anafora format
+    entities, relations = parse_ann_file(source_ann_file)
+
+    # Moving entity spans back to the original text if corrections changed its length
+    if preproc_payload is not None:
+        replacements = preproc_payload["replace"].get(document_id) or []
+        if any(len(text) != end - begin for begin, end, text in replacements):
+            map_entity_spans(entities.values(), "spans", lambda spans: [
+                (map_offset(begin, False, replacements, True), map_offset(end, True, replacements, True))
+                for begin, end in spans
+            ])
+    ana_entities, ana_relations = convert_brat_payload_to_anafora_payload(entities, relations, document_id)
+
+    # Building target directory
+    target_dir = os.path.join(os.path.abspath(output_anafora_dir), document_id)
+    ensure_dir(target_dir)
+
+    # Creating xml payload
+    target_file = os.path.join(target_dir, "{}.Temporal-Relation.system.completed.xml".format(document_id))
+    xml_payload = generate_payload(ana_entities, ana_relations, document_id)
+
+    # Writing payload to disk
+    tree = etree.ElementTree(xml_payload)
+    tree.write(target_file, pretty_print=True, xml_declaration=True, encoding='UTF-8')
+
+
+def convert_brat_payload_to_anafora_payload(brat_entities: dict = None,
+                                            brat_relations: dict = None,
+                                            document_id: dict = None):
+    """
+    Convert a brat payload (entities and relations) to anafora format
+
+    Args:
+        brat_entities (dict): entities extracted from brat file
+        brat_relations (dict): relations extracted from brat file
+        document_id (str): document ID used for naming elements
+
+    Returns:
+        (list, list): entities and relations in anafora format
+    """
+
+    ana_entities = list()
+    ana_relations = list()
+
+    for brat_id, entity in brat_entities.items():
+        current_entity = {
+            "id": entity["attributes"]["AnaforaID"],
+            "type": entity["type"],
+            "span": entity["spans"],
+            "properties": {k: v for k, v in entity["attributes"].items() if k != "AnaforaID"}
+        }
+
+        ana_entities.append(current_entity)
+
+    for brat_id, relation in brat_relations.items():
+        current_relation = {
+            "id": "{}@r@{}@system".format(brat_id, document_id),
+            "type": "TLINK",
+            "properties": {
+                "Source": brat_entities[relation["arg1"]]["attributes"]["AnaforaID"],
+                "Target": brat_entities[relation["arg2"]]["attributes"]["AnaforaID"],
+                "Type": relation["type"]
+            }
+        }
+
+        ana_relations.append(current_relation)
+
+    return ana_entities, ana_relations
+
+
+def correct_and_copy_txt_file(source_txt_filepath: str = None,
+                              target_txt_filepath: str = None,
+                              preproc_payload: dict = None) -> None:
+    """
+    Copy and correct a THYME corpus text file from one location to another location
+
+    Args:
+        source_txt_filepath (str): source THYME corpus text filepath
+        target_txt_filepath (str): target THYME corpus text filepath
+        preproc_payload (dict): preprocessing file content
+
+    Returns:
+        None
+    """
+
+    # Loading and correcting text file content
+    content_src = get_corrected_txt_content(source_txt_filepath, preproc_payload)
+
+    # Copying modified content to target file
+    with open(os.path.abspath(target_txt_filepath), "w", encoding="UTF-8") as output_file:
+        output_file.write(content_src)
+
+
+def correct_entity_spans(entities: list = None,
+                         txt_filepath: str = None):
+    """
+    Correct entity span by removing leading and trailing spaces and line breaks.
+    Add text span to entities.
+
+    Args:
+        entities (list): entity list extracted from the document
+        txt_filepath (str): THYME document filepath (text format)
+
+    Returns:
+        list: corrected entity list
+    """
+
+    corrected_entities_nb = 0
+
+    # Loading document content
+    content = open(os.path.abspath(txt_filepath), "r", encoding="UTF-8").read()
+
+    corrected_entities = list()
+
+    # Processing entities
+    for entity in entities:
+
+        # Copying entity, clearing span and creating text property
+        current_entity = copy.deepcopy(entity)
+        current_entity["span"].clear()
+        current_entity["text"] = list()
+
+        # Correcting span
+        for span in sorted(entity["span"]):
+            begin, end, is_corrected = correct_span(span[0], span[1], content)
+            span_txt = content[begin:end]
+
+            if is_corrected:
+                corrected_entities_nb += 1
+
+            # Appending computed properties to entity
+            current_entity["span"].append((begin, end))
+            current_entity["text"].append(span_txt)
+
+            # Sanity check: searching for line break within text spans
+            if re.search("\n", span_txt):
+                raise Exception("There is a sentence break in the middle of an entity in document {}: {}".format(
+                    os.path.basename(txt_filepath),
+                    entity
+                ))
+
+        # Appending corrected entity to list
+        corrected_entities.append(current_entity)
+
+    return corrected_entities, corrected_entities_nb
+
+
+def correct_span(begin: int = None,
+                 end: int = None,
+                 content: str = None) -> (int, int, bool):
+    """
+    Correct a span by removing leading and trailing spaces and line breaks
+
+    Args:
+        begin (int): span begin offset
+        end (int): span end offset
+        content (str): document content
+
+    Returns:
+        (int, int, bool): corrected begin and end offsets, 'True' if the span was modified
+    """
+
+    span_txt = content[begin:end]
+
+    # Removing trailing '\n' and ' ' and computing new right boundary
+    span_txt_rstrip = span_txt.rstrip("\n ")
+    offset_right = end - begin - len(span_txt_rstrip)
+
+    # Removing leading '\n' and ' ' and computing new left boundary
+    span_txt_lstrip = span_txt.lstrip("\n ")
+    offset_left = end - begin - len(span_txt_lstrip)
+
+    return begin + offset_left, end - offset_right, offset_right > 0 or offset_left > 0
+
+
+def extract_anafora_entities(root: etree.Element = None) -> list:
+    """
+    Extract entities from a parsed THYME corpus anafora document
+
+    Args:
+        root (etree.Element): anafora document root element
+
+    Returns:
+        list: entity list
+    """
+
+    # Finding annotations element
+    annotations = root.find("./annotations")
+
+    # Fetching entity elements from annotation element
+    entities = annotations.findall("./entity")
+
+    extracted_entities = list()
+
+    # Processing entities
+    for entity in entities:
+
+        # Fetching entity ID, span and type
+        current_entity_id = entity.find("./id").text
+        current_entity_span = entity.find("./span").text
+        current_entity_type = entity.find("./type").text
+
+        # Fetching entity properties
+        current_entity_properties = dict()
+        for child in entity.find("./properties"):
+            current_entity_properties[child.tag] = child.text
+
+        # Creating entity object
+        current_entity = {
+            "id": current_entity_id,
+            "type": current_entity_type,
+            "properties": current_entity_properties,
+            "span": list()
+        }
+
+        # Processing entity span
+        for span in current_entity_span.split(";"):
+            current_entity["span"].append(
+                (int(span.split(",")[0]), int(span.split(",")[1]))
+            )
+
+        # Adding current entity to entity list
+        extracted_entities.append(current_entity)
+
+    return extracted_entities
+
+
+def extract_anafora_relations(root: etree.Element = None) -> list:
+    """
+    Extract relations from a parsed THYME corpus anafora document
+
+    Args:
+        root (etree.Element): anafora document root element
+
+    Returns:
+        list: relation list
+    """
+
+    # Finding annotations element
+    annotations = root.find("./annotations")
+
+    # Fetching relation elements from annotations element
+    relations = annotations.findall("./relation")
+
+    extracted_relations = list()
+
+    # Processing relations
+    for relation in relations:
+
+        # Fetching relation ID and span
+        current_relation_id = relation.find("./id").text
+        current_relation_type = relation.find("./type").text
+
+        # Fetching relation properties
+        current_entity_properties = dict()
+        for child in relation.find("./properties"):
+            current_entity_properties[child.tag] = child.text
+
+        # Creating relation object
+        current_relation = {
+            "id": current_relation_id,
+            "type": current_relation_type,
+            "properties": current_entity_properties,
+        }
+
+        # Adding current relation to relation list
+        extracted_relations.append(current_relation)
+
+    return extracted_relations
+
+
+def generate_payload(entities: list = None,
+                     relations: list = None,
+                     document_id: list = None) -> etree.Element:
+    """
+    Generate xml payload for a thyme document
+
+    Args:
+        entities (list): list of entities
+        relations (list): list of relations
+        document_id (str): document ID
+
+    Returns:
+        etree.Element: xml payload
+
+    """
+
+    timestamp = time.strftime("%Y-%m-%d-%H:%M:%S")
+
+    root = etree.Element("data")
+
+    el_info = etree.SubElement(root, "info")
+
+    el_savetime = etree.SubElement(el_info, "savetime")
+    el_savetime.text = timestamp
+
+    el_progress = etree.SubElement(el_info, "progress")
+    el_progress.text = "completed"
+
+    el_annotations = etree.SubElement(root, "annotations")
+
+    for entity in entities:
+        el_entity = etree.SubElement(el_annotations, "entity")
+
+        el_id = etree.SubElement(el_entity, "id")
+        el_id.text = entity["id"]
+
+        el_span = etree.SubElement(el_entity, "span")
+        el_span.text = ";".join(["{},{}".format(b, e) for b, e in entity["span"]])
+
+        el_type = etree.SubElement(el_entity, "type")
+        el_type.text = entity["type"]
+
+        el_parents_type = etree.SubElement(el_entity, "parentsType")
+        el_parents_type.text = "TemporalEntities"
+
+        el_properties = etree.SubElement(el_entity, "properties")
+        for att_tag, att_value in entity["properties"].items():
+            el_attribute = etree.SubElement(el_properties, att_tag)
+            el_attribute.text = att_value
+
+    relation_id = 1
+
+    for relation in relations:
+        el_relation = etree.SubElement(el_annotations, "relation")
+
+        el_id = etree.SubElement(el_relation, "id")
+        el_id.text = "{}@r@{}@system".format(relation_id, document_id)
+
+        el_type = etree.SubElement(el_relation, "type")
+        el_type.text = relation["type"]
+
+        relation_id += 1
+
+        el_parents_type = etree.SubElement(el_relation, "parentsType")
+        el_parents_type.text = "TemporalRelations"
+
+        el_properties = etree.SubElement(el_relation, "properties")
+        for att_tag, att_value in relation["properties"].items():
+            el_attribute = etree.SubElement(el_properties, att_tag)
+            el_attribute.text = str(att_value)
+
+    return root
+
+
+def get_anafora_entities(source_anafora_filepath: str = None) -> list:
+    """
+    Extract entities from a THYME corpus anafora file
+
+    Args:
+        source_anafora_filepath (str): source anafora filepath
+
+    Returns:
+        list: entity list
+    """
+
+    # Parsing xml file
+    tree = etree.parse(source_anafora_filepath)
+    root = tree.getroot()
+
+    # Sanity check, raising exception if there is a non-empty adjudication element
+    check_adjudication(root, source_anafora_filepath)
+
+    return extract_anafora_entities(root)
+
+
+def get_anafora_relations(source_anafora_filepath: str = None) -> list:
+    """
+    Extract relations from a THYME corpus anafora file
+
+    Args:
+        source_anafora_filepath (str): source anafora filepath
+
+    Returns:
+        list: relation list
+    """
+
+    # Parsing xml file
+    tree = etree.parse(source_anafora_filepath)
+    root = tree.getroot()
+
+    # Sanity check, raising exception if there is a non-empty adjudication element
+    check_adjudication(root, source_anafora_filepath)
+
+    return extract_anafora_relations(root)
+
+
+def get_corrected_txt_content(source_txt_filepath: str = None,
+                              preproc_payload: dict = None) -> str:
+    """
+    Load a THYME corpus text file and apply the corrections listed in the preprocessing file one after the other
+
+    Args:
+        source_txt_filepath (str): source THYME corpus text filepath
+        preproc_payload (dict): preprocessing file content
+
+    Returns:
+        str: corrected content
+    """
+
+    # Loading text file content
+    content_src = open(os.path.abspath(source_txt_filepath), "r", encoding="UTF-8", newline='').read()
+
+    # Fetching file corrections if available
+    if os.path.basename(source_txt_filepath) in preproc_payload["replace"]:
+        for begin, end, replacement in preproc_payload["replace"][os.path.basename(source_txt_filepath)]:
+            content_src = content_src[:begin] + replacement + content_src[end:]
+
+    return content_src
+
+
+def map_entity_spans(entities: list = None,
+                     span_key: str = None,
+                     map_function=None) -> None:
+    """
+    Map the spans of all entities of a document in a single call, in place
+
+    Args:
+        entities (list): entities
+        span_key (str): span list key ('span' for anafora entities, 'spans' for brat entities)
+        map_function (function): span list mapping function
+
+    Returns:
+        None
+    """
+
+    entities = list(entities)
+
+    mapped_spans = iter(map_function([span for entity in entities for span in entity[span_key]]))
+
+    for entity in entities:
+        entity[span_key] = [next(mapped_spans) for _ in entity[span_key]]
+
+
+def map_offset(offset: int = None,
+               is_end: bool = False,
+               replacements: list = None,
+               to_original: bool = False) -> int:
+    """
+    Map an offset between an original THYME document and its corrected version, going through the replacements one
+    after the other. Offsets falling strictly inside a replaced region are moved to the beginning of the region for
+    span begin offsets and to its end for span end offsets.
+
+    Args:
+        offset (int): offset to map
+        is_end (bool): 'True' for span end offsets
+        replacements (list): (begin, end, replacement text) triples, offsets of each replacement referring to the text
+            produced by the previous ones
+        to_original (bool): map a corrected offset to the original document instead
+
+    Returns:
+        int: mapped offset
+    """
+
+    for begin, end, text in reversed(replacements) if to_original else replacements:
+        source_end, target_end = (begin + len(text), end) if to_original else (end, begin + len(text))
+
+        if offset <= begin:
+            continue
+
+        if offset < source_end:
+            offset = target_end if is_end else begin
+        else:
+            offset += target_end - source_end
+
+    return offset
+
+
+def parse_ann_file(ann_filename: str = None):
+    """
+    Parse a brat annotation file and return a dictionary of entities and a list of relations.
+
+    Args:
+        ann_filename (str): brat document filepath
+
+    Returns:
+        (dict, dict): entities and relations
+    """
+
+    regex_entity = re.compile(r"^T(\d+)\t([^\s]+)\s([^\t]+)\t([^\t]*)$")
+    regex_attribute = re.compile(r"^A(\d+)\t([^\s]+)\sT(\d+)\s(.*)$")
+    regex_relation = re.compile(r"^R(\d+)\t([^\s]+)\sArg1:T(\d+)\sArg2:T(\d+)$")
+
+    entities = dict()
+    relations = dict()
+
+    # Extraction entity annotations (without attributes)
+    with open(ann_filename, "r", encoding="UTF-8") as input_file:
+        for line in input_file:
+            match_entity = regex_entity.match(line)
+            if match_entity:
+
+                brat_id = int(match_entity.group(1))
+
+                current_entity = {
+                    "id": brat_id,
+                    "spans": list(),
+                    "is_split": False,
+                    "type": match_entity.group(2),
+                    "text": match_entity.group(4).rstrip("\n"),
+                    "attributes": dict()
+                }
+
+                spans = match_entity.group(3).split(";")
+                for span in spans:
+                    begin = int(span.split()[0])
+                    end = int(span.split()[1])
+
+                    current_entity["spans"].append((begin, end))
+
+                if len(current_entity["spans"]) == 1:
+                    current_entity["is_split"] = True
+
+                entities[brat_id] = current_entity
+
+    # Extracting entity attributes
+    with open(ann_filename, "r", encoding="UTF-8") as input_file:
+        for line in input_file:
+            match_attribute = regex_attribute.match(line)
+            if match_attribute:
+                if int(match_attribute.group(3)) in entities:
+                    entities[int(match_attribute.group(3))][
+                        'attributes'][match_attribute.group(2)] = match_attribute.group(4)
+
+    # Extracting relations
+    with open(ann_filename, "r", encoding="UTF-8") as input_file:
+        for line in input_file:
+            match_relation = regex_relation.match(line)
+            if match_relation:
+                relations[int(match_relation.group(1))] = {
+                    "type": match_relation.group(2),
+                    "arg1": int(match_relation.group(3)),
+                    "arg2": int(match_relation.group(4))
+                }
+
+    return entities, relations
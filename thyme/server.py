@@ -0,0 +1,401 @@
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from .anafora import is_in_progress, plan_anafora_documents, render_anafora_document, render_brat_document
+
+REGEX_DOCUMENT_ID = re.compile(r"^[\w\-]+$")
+
+
+class DocumentCache:
+    """
+    Size-bounded LRU cache of converted documents. Each entry is stored with the path, modification time and size of
+    its source files and is computed again as soon as one of them changes.
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key: str = None,
+            filepaths: list = None,
+            loader=None):
+        """
+        Fetch a cached value, computing it if it is missing or outdated
+
+        Args:
+            key (str): cache key
+            filepaths (list): source filepaths of the value
+            loader (function): function computing the value
+
+        Returns:
+            object: cached value
+
+        Raises:
+            FileNotFoundError: if a source file does not exist
+        """
+
+        # Each source file is checked once, a missing file is reported to the caller
+        stamp = list()
+        for filepath in filepaths:
+            file_stat = os.stat(filepath)
+            stamp.append((filepath, file_stat.st_mtime_ns, file_stat.st_size))
+
+        stamp = tuple(stamp)
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None and entry[0] == stamp:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+
+        # Converting outside of the lock, other documents can be served in the meantime
+        value = loader()
+
+        with self.lock:
+            self.entries[key] = (stamp, value)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+        return value
+
+    def get_statistics(self) -> dict:
+        """
+        Compute cache statistics
+
+        Returns:
+            dict: number of entries, hits and misses
+        """
+
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+class ConversionServer(ThreadingHTTPServer):
+    """
+    HTTP server converting THYME corpus documents on demand. The preprocessing file is loaded once and converted
+    documents are kept in an LRU cache. Annotation files are found anywhere under the anafora directory, as in the
+    command line conversion, and the directory is scanned again when a document is not found. An endpoint whose input
+    directories were not given is disabled.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, server_address: tuple = None,
+                 input_anafora_path: str = None,
+                 input_thyme_path: str = None,
+                 preproc_payload: dict = None,
+                 input_brat_path: str = None,
+                 precedence: list = None,
+                 cache_size: int = 256):
+        super().__init__(server_address, ConversionRequestHandler)
+
+        self.input_anafora_path = input_anafora_path
+        self.input_thyme_path = input_thyme_path
+        self.input_brat_path = input_brat_path
+        self.preproc_payload = preproc_payload
+        self.precedence = precedence
+
+        self.brat_cache = DocumentCache(cache_size)
+        self.anafora_cache = DocumentCache(cache_size)
+
+        self.anafora_files = dict()
+        self.anafora_files_lock = threading.Lock()
+
+        if self.input_anafora_path is not None:
+            self.scan_anafora_files()
+
+    def find_anafora_file(self, document_id: str = None) -> str:
+        """
+        Find the annotation file of a document, scanning the anafora directory again if it is unknown or was removed
+
+        Args:
+            document_id (str): document ID
+
+        Returns:
+            str: anafora filepath, None if the document does not exist
+        """
+
+        with self.anafora_files_lock:
+            source_anafora_file = self.anafora_files.get(document_id)
+
+        if source_anafora_file is None or not os.path.isfile(source_anafora_file):
+            source_anafora_file = self.scan_anafora_files().get(document_id)
+
+        return source_anafora_file
+
+    def get_missing_options(self, endpoint: str = None) -> list:
+        """
+        List the command line options required by an endpoint and not given when the server was started
+
+        Args:
+            endpoint (str): endpoint path
+
+        Returns:
+            list: missing options, empty if the endpoint is enabled
+        """
+
+        if endpoint == "/anafora-to-brat":
+            required_options = [("--input-anafora", self.input_anafora_path), ("--input-thyme", self.input_thyme_path)]
+        elif endpoint == "/brat-to-anafora":
+            required_options = [("--input-brat", self.input_brat_path)]
+        else:
+            required_options = list()
+
+        return [option for option, value in required_options if value is None]
+
+    def get_brat_document(self, document_id: str = None) -> dict:
+        """
+        Convert a document to brat format
+
+        Args:
+            document_id (str): document ID
+
+        Returns:
+            dict: corrected text, brat annotation content and number of corrected entities, None if the document
+            does not exist and 'in_progress' set to True if its annotation is in progress
+        """
+
+        source_anafora_file = self.find_anafora_file(document_id)
+        source_txt_file = os.path.join(self.input_thyme_path, document_id)
+
+        if source_anafora_file is None or not os.path.isfile(source_txt_file):
+            return None
+
+        def load():
+            if is_in_progress(source_anafora_file):
+                return {"document": document_id, "in_progress": True}
+
+            txt_content, ann_content, nb = render_anafora_document(source_anafora_file, source_txt_file,
+                                                                   self.preproc_payload)
+
+            return {
+                "document": document_id,
+                "in_progress": False,
+                "txt": txt_content,
+                "ann": ann_content,
+                "corrected_entities": nb
+            }
+
+        return self.brat_cache.get(document_id, [source_anafora_file, source_txt_file], load)
+
+    def get_anafora_document(self, document_id: str = None) -> bytes:
+        """
+        Convert a brat document of the brat directory to anafora format
+
+        Args:
+            document_id (str): document ID
+
+        Returns:
+            bytes: anafora xml content, None if the document does not exist
+        """
+
+        source_ann_file = os.path.join(self.input_brat_path, "{}.ann".format(document_id))
+
+        if not os.path.isfile(source_ann_file):
+            return None
+
+        return self.anafora_cache.get(
+            document_id,
+            [source_ann_file],
+            lambda: render_brat_document(source_ann_file, self.preproc_payload)
+        )
+
+    def scan_anafora_files(self) -> dict:
+        """
+        Scan the anafora directory, selecting one annotation file per document with the precedence list
+
+        Returns:
+            dict: anafora filepath by document ID
+        """
+
+        work_items, conflicts = plan_anafora_documents(self.input_anafora_path, self.precedence)
+
+        with self.anafora_files_lock:
+            previous_files = self.anafora_files
+
+        # Conflicts are logged once, unless the selected file changes
+        for document_id, (source_anafora_file, discarded_files) in sorted(conflicts.items()):
+            if previous_files.get(document_id) == source_anafora_file:
+                continue
+
+            logging.info("Several annotation files for document {}, using {}. Discarded: {}".format(
+                document_id,
+                os.path.basename(source_anafora_file),
+                ", ".join([os.path.basename(filepath) for filepath in discarded_files])
+            ))
+
+        with self.anafora_files_lock:
+            self.anafora_files = dict(work_items)
+            return self.anafora_files
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the conversion server:
+
+    * GET /anafora-to-brat?document=<ID>: corrected text and brat annotations (json), requires the anafora and text
+      directories
+    * GET /brat-to-anafora?document=<ID>: anafora annotations (xml), requires the brat directory
+    * GET /status: cache statistics (json)
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        document_id = parse_qs(url.query).get("document", [None])[0]
+
+        if url.path == "/status":
+            self.send_payload(200, "application/json", json.dumps({
+                "brat_cache": self.server.brat_cache.get_statistics(),
+                "anafora_cache": self.server.anafora_cache.get_statistics()
+            }).encode("UTF-8"))
+            return
+
+        if url.path not in ["/anafora-to-brat", "/brat-to-anafora"]:
+            self.send_error_payload(404, "Unknown endpoint: {}".format(url.path))
+            return
+
+        missing_options = self.server.get_missing_options(url.path)
+        if missing_options:
+            self.send_error_payload(404, "Endpoint {} disabled, the server was started without: {}".format(
+                url.path, ", ".join(missing_options)
+            ))
+            return
+
+        if document_id is None or not REGEX_DOCUMENT_ID.match(document_id):
+            self.send_error_payload(400, "Missing or invalid document ID: {}".format(document_id))
+            return
+
+        try:
+            if url.path == "/anafora-to-brat":
+                payload = self.server.get_brat_document(document_id)
+
+                if payload is None:
+                    self.send_error_payload(404, "Document not found: {}".format(document_id))
+                elif payload["in_progress"]:
+                    self.send_error_payload(409, "Annotation in progress: {}".format(document_id))
+                else:
+                    self.send_payload(200, "application/json", json.dumps(payload).encode("UTF-8"))
+
+            else:
+                payload = self.server.get_anafora_document(document_id)
+
+                if payload is None:
+                    self.send_error_payload(404, "Document not found: {}".format(document_id))
+                else:
+                    self.send_payload(200, "application/xml", payload)
+
+        # Source files removed since the document was found
+        except FileNotFoundError:
+            self.send_error_payload(404, "Document not found: {}".format(document_id))
+
+        except Exception as e:
+            logging.exception("Conversion of document {} failed".format(document_id))
+            self.send_error_payload(500, "Conversion of document {} failed: {}".format(document_id, e))
+
+    def log_message(self, format, *args):
+        logging.info("{} {}".format(self.address_string(), format % args))
+
+    def send_error_payload(self, status: int = None,
+                           message: str = None) -> None:
+        """
+        Send a json error message
+
+        Args:
+            status (int): HTTP status code
+            message (str): error message
+
+        Returns:
+            None
+        """
+
+        self.send_payload(status, "application/json", json.dumps({"error": message}).encode("UTF-8"))
+
+    def send_payload(self, status: int = None,
+                     content_type: str = None,
+                     payload: bytes = None) -> None:
+        """
+        Send a response
+
+        Args:
+            status (int): HTTP status code
+            content_type (str): response content type
+            payload (bytes): response body
+
+        Returns:
+            None
+        """
+
+        self.send_response(status)
+        self.send_header("Content-Type", "{}; charset=UTF-8".format(content_type))
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def serve(input_anafora_path: str = None,
+          input_thyme_path: str = None,
+          preproc_file_path: str = None,
+          input_brat_path: str = None,
+          precedence: list = None,
+          host: str = "127.0.0.1",
+          port: int = 8001,
+          cache_size: int = 256) -> None:
+    """
+    Start a conversion server, until interrupted
+
+    Args:
+        input_anafora_path (str): annotation path (anafora format) used for anafora to brat conversion
+        input_thyme_path (str): corpus path (text format) used for anafora to brat conversion
+        preproc_file_path (str): preprocessing filepath (json format)
+        input_brat_path (str): annotation path (brat format) used for brat to anafora conversion
+        precedence (list): annotation file kinds by decreasing priority (see DEFAULT_PRECEDENCE)
+        host (str): listening address
+        port (int): listening port
+        cache_size (int): maximum number of cached documents, for each conversion direction
+
+    Returns:
+        None
+    """
+
+    # Loading json content once
+    preproc_payload = json.load(open(os.path.abspath(preproc_file_path), "r", encoding="UTF-8"))
+
+    server = ConversionServer(
+        (host, port),
+        os.path.abspath(input_anafora_path) if input_anafora_path is not None else None,
+        os.path.abspath(input_thyme_path) if input_thyme_path is not None else None,
+        preproc_payload,
+        input_brat_path=os.path.abspath(input_brat_path) if input_brat_path is not None else None,
+        precedence=precedence,
+        cache_size=cache_size
+    )
+
+    logging.info("Serving on http://{}:{}".format(*server.server_address[:2]))
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,247 @@
+import hashlib
+import heapq
+import json
+import os
+import re
+import shutil
+
+from .brat import merge_vocabularies, write_confs
+from .utils import ensure_dir
+
+SHARD_STATS_FILENAME = "shard.json"
+
+REGEX_SHARD = re.compile(r"^(\d+)/(\d+)$")
+
+
+def balance_documents(document_sizes: dict = None,
+                      shard_count: int = None) -> dict:
+    """
+    Assign documents to shards so that shards have similar total sizes. Documents are sorted by decreasing size and
+    each one goes to the least loaded shard (longest processing time first). Ties are broken by document ID and shard
+    index, so that every node computes the same assignment from the same document list.
+
+    Args:
+        document_sizes (dict): document size (bytes) by document ID
+        shard_count (int): number of shards
+
+    Returns:
+        dict: shard index by document ID
+    """
+
+    loads = [(0, shard_index) for shard_index in range(shard_count)]
+
+    assignment = dict()
+
+    for document_id, size in sorted(document_sizes.items(), key=lambda item: (-item[1], item[0])):
+        load, shard_index = heapq.heappop(loads)
+        assignment[document_id] = shard_index
+        heapq.heappush(loads, (load + size, shard_index))
+
+    return assignment
+
+
+def get_document_shard(document_id: str = None,
+                       shard_count: int = None) -> int:
+    """
+    Compute the shard of a document from a stable hash of its ID (independent of the Python hash seed)
+
+    Args:
+        document_id (str): document ID
+        shard_count (int): number of shards
+
+    Returns:
+        int: shard index
+    """
+
+    return int(hashlib.md5(document_id.encode("UTF-8")).hexdigest(), 16) % shard_count
+
+
+def load_shard_stats(shard_dir: str = None) -> dict:
+    """
+    Load the statistics written by a shard conversion
+
+    Args:
+        shard_dir (str): shard output directory
+
+    Returns:
+        dict: shard statistics
+    """
+
+    stats_file = os.path.join(os.path.abspath(shard_dir), SHARD_STATS_FILENAME)
+
+    if not os.path.isfile(stats_file):
+        raise FileNotFoundError("The shard statistics file does not exist: {}".format(stats_file))
+
+    with open(stats_file, "r", encoding="UTF-8") as input_file:
+        return json.load(input_file)
+
+
+def merge_shards(shard_dirs: list = None,
+                 output_dir: str = None) -> dict:
+    """
+    Merge the outputs of all the shards of a conversion into a single directory. Documents are copied, counters and
+    brat vocabularies are summed up and brat configuration files are written from the merged vocabulary, so that the
+    result is the same as the one of a single-node conversion.
+
+    Args:
+        shard_dirs (list): shard output directories, one per shard
+        output_dir (str): output directory
+
+    Returns:
+        dict: merged statistics
+    """
+
+    shard_stats = [load_shard_stats(shard_dir) for shard_dir in shard_dirs]
+
+    # Checking that shards belong to the same conversion and that none is missing
+    if len({(stats["format"], stats["shard_count"], stats["balanced"]) for stats in shard_stats}) != 1:
+        raise Exception("Shards do not belong to the same conversion: {}".format(", ".join(shard_dirs)))
+
+    shard_count = shard_stats[0]["shard_count"]
+    shard_indexes = sorted(stats["shard"] for stats in shard_stats)
+
+    if shard_indexes != list(range(shard_count)):
+        raise Exception("Expected shards 0 to {}, got: {}".format(
+            shard_count - 1, ", ".join([str(shard_index) for shard_index in shard_indexes])
+        ))
+
+    ensure_dir(os.path.abspath(output_dir))
+
+    merged_stats = {
+        "format": shard_stats[0]["format"],
+        "documents": list(),
+        "skipped": list(),
+        "corrected_entities": 0
+    }
+
+    vocabulary = (set(), dict(), set())
+
+    for shard_dir, stats in zip(shard_dirs, shard_stats):
+
+        # Copying documents, shard statistics and brat configuration files are produced again below
+        for root, dirs, files in os.walk(os.path.abspath(shard_dir)):
+            for filename in files:
+                if filename in [SHARD_STATS_FILENAME, "annotation.conf", "visual.conf"]:
+                    continue
+
+                target_file = os.path.join(
+                    os.path.abspath(output_dir),
+                    os.path.relpath(os.path.join(root, filename), os.path.abspath(shard_dir))
+                )
+
+                if os.path.exists(target_file):
+                    raise Exception("File found in several shards: {}".format(target_file))
+
+                ensure_dir(os.path.dirname(target_file))
+                shutil.copyfile(os.path.join(root, filename), target_file)
+
+        merged_stats["documents"].extend(stats["documents"])
+        merged_stats["skipped"].extend(stats["skipped"])
+        merged_stats["corrected_entities"] += stats["corrected_entities"]
+
+        merge_vocabularies(vocabulary, (
+            set(stats["vocabulary"]["entities"]),
+            stats["vocabulary"]["attributes"],
+            set(stats["vocabulary"]["relations"])
+        ))
+
+    merged_stats["documents"].sort()
+    merged_stats["skipped"].sort()
+
+    if merged_stats["format"] == "brat":
+        write_confs(vocabulary[0], vocabulary[1], vocabulary[2], os.path.abspath(output_dir))
+
+    return merged_stats
+
+
+def parse_shard(shard: str = None) -> (int, int):
+    """
+    Parse a shard specification 'i/N', where i is the shard index (from 0 to N-1) and N the number of shards
+
+    Args:
+        shard (str): shard specification
+
+    Returns:
+        (int, int): shard index and number of shards
+    """
+
+    match = REGEX_SHARD.match(shard)
+
+    if not match or int(match.group(1)) >= int(match.group(2)):
+        raise Exception("Invalid shard specification, expected i/N with 0 <= i < N: {}".format(shard))
+
+    return int(match.group(1)), int(match.group(2))
+
+
+def select_shard_documents(documents: dict = None,
+                           shard_index: int = None,
+                           shard_count: int = None,
+                           balance: bool = False) -> set:
+    """
+    Select the documents processed by a shard
+
+    Args:
+        documents (dict): document filepath by document ID
+        shard_index (int): shard index
+        shard_count (int): number of shards
+        balance (bool): balance shards by document size instead of using the document ID hash only
+
+    Returns:
+        set: IDs of the documents processed by the shard
+    """
+
+    if balance:
+        assignment = balance_documents(
+            {document_id: os.path.getsize(filepath) for document_id, filepath in documents.items()},
+            shard_count
+        )
+    else:
+        assignment = {document_id: get_document_shard(document_id, shard_count) for document_id in documents}
+
+    return {document_id for document_id, document_shard in assignment.items() if document_shard == shard_index}
+
+
+def write_shard_stats(output_dir: str = None,
+                      input_format: str = None,
+                      shard: tuple = None,
+                      balance: bool = False,
+                      documents: list = None,
+                      skipped: list = None,
+                      corrected_entities: int = 0,
+                      vocabulary: tuple = None) -> None:
+    """
+    Write the statistics of a shard conversion next to its output, they are used by merge_shards
+
+    Args:
+        output_dir (str): shard output directory
+        input_format (str): output format (brat or anafora)
+        shard (tuple): shard index and number of shards
+        balance (bool): 'True' if shards were balanced by document size
+        documents (list): converted document IDs
+        skipped (list): skipped document IDs
+        corrected_entities (int): number of corrected entities
+        vocabulary (tuple): brat vocabulary (entity types, attribute values by attribute name and relation types)
+
+    Returns:
+        None
+    """
+
+    entities_list, attributes_list, relations_list = vocabulary or (set(), dict(), set())
+
+    stats = {
+        "format": input_format,
+        "shard": shard[0],
+        "shard_count": shard[1],
+        "balanced": balance,
+        "documents": sorted(documents or []),
+        "skipped": sorted(skipped or []),
+        "corrected_entities": corrected_entities,
+        "vocabulary": {
+            "entities": sorted(entities_list),
+            "attributes": {attribute: sorted(values) for attribute, values in sorted(attributes_list.items())},
+            "relations": sorted(relations_list)
+        }
+    }
+
+    with open(os.path.join(os.path.abspath(output_dir), SHARD_STATS_FILENAME), "w", encoding="UTF-8") as output_file:
+        json.dump(stats, output_file, indent=2)
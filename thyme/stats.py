@@ -0,0 +1,327 @@
+import json
+import os
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from .anafora import correct_span, get_anafora_records, get_corrected_txt_content, get_offset_map, is_in_progress
+from .brat import parse_ann_file
+from .diff import list_documents
+from .intervals import SpanIndex
+from .utils import translate_newlines
+
+# Span lengths greater or equal to the last bin are counted in the last bin
+SPAN_LENGTH_BINS = 64
+
+# Relation argument distances are counted in power of two bins: 0, 1, 2-3, 4-7, etc.
+DISTANCE_BINS = 32
+
+
+def compute_corpus_stats(input_dir: str = None,
+                         input_format: str = "anafora",
+                         input_thyme_path: str = None,
+                         preproc_file_path: str = None,
+                         n_jobs: int = 1) -> dict:
+    """
+    Compute the statistics of a THYME corpus part in one parallel pass: entity counts by type and property value,
+    span length distributions, relation counts by type, relation argument distances and, for anafora documents whose
+    text is available, the number of corrected spans.
+
+    Args:
+        input_dir (str): annotation directory
+        input_format (str): directory format (brat or anafora)
+        input_thyme_path (str): corpus path (text format), used to count corrected spans of anafora documents
+        preproc_file_path (str): preprocessing filepath (json format)
+        n_jobs (int): number of worker processes
+
+    Returns:
+        dict: corpus statistics
+    """
+
+    preproc_payload = {"replace": dict()}
+
+    # Loading json content
+    if preproc_file_path is not None:
+        preproc_payload = json.load(open(os.path.abspath(preproc_file_path), "r", encoding="UTF-8"))
+
+    documents = sorted(list_documents(input_dir, input_format).items())
+
+    source_txt_files = [
+        os.path.join(os.path.abspath(input_thyme_path), document_id) if input_thyme_path is not None else None
+        for document_id, _ in documents
+    ]
+
+    stats = create_stats()
+
+    with ProcessPoolExecutor(max_workers=max(1, n_jobs)) as executor:
+        for document_stats in executor.map(
+                compute_document_stats,
+                [filepath for _, filepath in documents],
+                [input_format] * len(documents),
+                source_txt_files,
+                [preproc_payload] * len(documents),
+                chunksize=max(1, len(documents) // (max(1, n_jobs) * 4))
+        ):
+            merge_stats(stats, document_stats)
+
+    return stats
+
+
+def compute_document_stats(filepath: str = None,
+                           input_format: str = "anafora",
+                           source_txt_file: str = None,
+                           preproc_payload: dict = None) -> dict:
+    """
+    Compute the statistics of a single document. Anafora documents whose annotation is in progress, and documents
+    that cannot be parsed or whose text cannot be read, are skipped without counting any of their annotations.
+    Brat relations are counted as TLINK, as done by the brat to anafora conversion.
+
+    Args:
+        filepath (str): document filepath
+        input_format (str): document format (brat or anafora)
+        source_txt_file (str): document filepath (text format), used to count corrected spans of anafora documents
+        preproc_payload (dict): preprocessing file content
+
+    Returns:
+        dict: document statistics
+    """
+
+    stats = create_stats()
+
+    if input_format not in ["anafora", "brat"]:
+        raise Exception("Invalid input format: {}".format(input_format))
+
+    # Entities: (ID, type, spans, properties) and relations: (kind, type, source, target), documents that cannot be
+    # read are skipped instead of aborting the whole run
+    try:
+        if input_format == "anafora":
+            if is_in_progress(filepath):
+                stats["skipped"] += 1
+                return stats
+
+            records, relation_records = get_anafora_records(filepath)
+
+            entities = [(record.id, record.type, record.span, record.properties) for record in records]
+
+            relations = [
+                (record.type, record.properties.get("Type"), record.properties.get("Source"),
+                 record.properties.get("Target"))
+                for record in relation_records
+            ]
+
+        else:
+            brat_entities, brat_relations = parse_ann_file(filepath)
+
+            entities = [
+                (brat_id, entity["type"], entity["spans"],
+                 {k: v for k, v in entity["attributes"].items() if k != "AnaforaID"})
+                for brat_id, entity in brat_entities.items()
+            ]
+
+            relations = [
+                ("TLINK", relation["type"], relation["arg1"], relation["arg2"])
+                for relation in brat_relations.values()
+            ]
+
+        # Counting spans modified by the anafora to brat conversion, a document whose text cannot be read is skipped
+        corrected_spans = 0
+
+        if input_format == "anafora" and source_txt_file is not None and os.path.isfile(source_txt_file):
+            content = translate_newlines(get_corrected_txt_content(source_txt_file, preproc_payload))
+            offset_map = get_offset_map(os.path.basename(source_txt_file), preproc_payload)
+
+            spans = offset_map.spans_to_corrected([span for _, _, entity_spans, _ in entities for span in entity_spans])
+
+            for begin, end in spans:
+                corrected_spans += correct_span(begin, end, content)[2]
+
+    except Exception:
+        stats["skipped"] += 1
+        return stats
+
+    stats["documents"] += 1
+    stats["corrected_spans"] += corrected_spans
+
+    counts = stats["counts"]
+
+    # First span beginning of each entity, keeping the first entity when an ID is used several times
+    entity_begins = dict()
+
+    for entity_id, entity_type, spans, properties in entities:
+        entity_begins.setdefault(entity_id, min(spans)[0])
+
+        counts[entity_type] += 1
+
+        for prop_name, prop_value in properties.items():
+            counts["{}:{}".format(entity_type, prop_name)] += 1
+            counts["{}:{}:{}".format(entity_type, prop_name, prop_value)] += 1
+
+        span_lengths = stats["span_lengths"].setdefault(entity_type, array("q", bytes(8 * SPAN_LENGTH_BINS)))
+        # Reversed spans (end before beginning) are not counted
+        for begin, end in spans:
+            if end >= begin:
+                span_lengths[min(end - begin, SPAN_LENGTH_BINS - 1)] += 1
+
+    # Overlapping entities and entities nested in a fragment of another one, by entity types
+    index = SpanIndex({i: spans for i, (_, _, spans, _) in enumerate(entities)})
+    entity_types = [entity_type for _, entity_type, _, _ in entities]
+
+    for i, j in index.overlapping_pairs():
+        counts["{}:<overlapping>:{}".format(*sorted([entity_types[i], entity_types[j]]))] += 1
+
+    nested_pairs = {
+        (i, j)
+        for i, (_, _, spans, _) in enumerate(entities)
+        for begin, end in spans
+        for j in index.contained(begin, end)
+        if j != i
+    }
+
+    for i, j in nested_pairs:
+        counts["{}:<contains>:{}".format(entity_types[i], entity_types[j])] += 1
+
+    for kind, relation_type, source, target in relations:
+        counts[kind] += 1
+        counts["{}:Type:{}".format(kind, relation_type)] += 1
+
+        # Distance between the beginnings of both arguments, relations pointing to unknown entities are ignored
+        if source in entity_begins and target in entity_begins:
+            distance = abs(entity_begins[source] - entity_begins[target])
+
+            distances = stats["distances"].setdefault(
+                "{}:Type:{}".format(kind, relation_type), array("q", bytes(8 * DISTANCE_BINS))
+            )
+            distances[min(distance.bit_length(), DISTANCE_BINS - 1)] += 1
+
+    return stats
+
+
+def create_stats() -> dict:
+    """
+    Create empty corpus statistics
+
+    Returns:
+        dict: corpus statistics
+    """
+
+    return {
+        "documents": 0,
+        "skipped": 0,
+        "corrected_spans": 0,
+        "counts": Counter(),
+        "span_lengths": dict(),
+        "distances": dict()
+    }
+
+
+def get_bin_label(histogram: str = None,
+                  index: int = None) -> str:
+    """
+    Compute the label of a histogram bin
+
+    Args:
+        histogram (str): histogram name ('span_lengths' or 'distances')
+        index (int): bin index
+
+    Returns:
+        str: bin label
+    """
+
+    if histogram == "span_lengths":
+        return "{}+".format(index) if index == SPAN_LENGTH_BINS - 1 else str(index)
+
+    if index == 0:
+        return "0"
+
+    if index == DISTANCE_BINS - 1:
+        return "{}+".format(2 ** (index - 1))
+
+    return "{}-{}".format(2 ** (index - 1), 2 ** index - 1)
+
+
+def merge_stats(target: dict = None,
+                source: dict = None) -> dict:
+    """
+    Merge corpus statistics into other ones, in place
+
+    Args:
+        target (dict): statistics which will be updated
+        source (dict): statistics to merge
+
+    Returns:
+        dict: updated target statistics
+    """
+
+    for key in ["documents", "skipped", "corrected_spans"]:
+        target[key] += source[key]
+
+    target["counts"].update(source["counts"])
+
+    for histogram in ["span_lengths", "distances"]:
+        for key, values in source[histogram].items():
+            if key not in target[histogram]:
+                target[histogram][key] = array("q", values)
+            else:
+                target_values = target[histogram][key]
+                for i, value in enumerate(values):
+                    target_values[i] += value
+
+    return target
+
+
+def stats_to_json(stats: dict = None) -> dict:
+    """
+    Convert corpus statistics to a json serializable dictionary, histograms bins are labelled and empty bins removed
+
+    Args:
+        stats (dict): corpus statistics
+
+    Returns:
+        dict: json serializable statistics
+    """
+
+    payload = {
+        "documents": stats["documents"],
+        "skipped": stats["skipped"],
+        "corrected_spans": stats["corrected_spans"],
+        "counts": dict(sorted(stats["counts"].items()))
+    }
+
+    for histogram in ["span_lengths", "distances"]:
+        payload[histogram] = {
+            key: {get_bin_label(histogram, i): value for i, value in enumerate(values) if value > 0}
+            for key, values in sorted(stats[histogram].items())
+        }
+
+    return payload
+
+
+def write_stats_tsv(stats: dict = None,
+                    output_filepath: str = None) -> None:
+    """
+    Write corpus statistics to a tsv file, with one count per line as in the anafora evaluation outputs (see logs)
+
+    Args:
+        stats (dict): corpus statistics
+        output_filepath (str): output filepath
+
+    Returns:
+        None
+    """
+
+    with open(os.path.abspath(output_filepath), "w", encoding="UTF-8") as output_file:
+        output_file.write("{:<40}\t{:<5}\n".format("", "count"))
+
+        for key in ["documents", "skipped", "corrected_spans"]:
+            output_file.write("{:<40}\t{:<5}\n".format("<{}>".format(key), stats[key]))
+
+        for key, value in sorted(stats["counts"].items()):
+            output_file.write("{:<40}\t{:<5}\n".format(key, value))
+
+        for histogram, name in [("span_lengths", "<span-length>"), ("distances", "<distance>")]:
+            for key, values in sorted(stats[histogram].items()):
+                for i, value in enumerate(values):
+                    if value > 0:
+                        output_file.write("{:<40}\t{:<5}\n".format(
+                            "{}:{}:{}".format(key, name, get_bin_label(histogram, i)), value
+                        ))
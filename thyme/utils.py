@@ -1,4 +1,88 @@
+import glob
+import logging
 import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+# Threads deleting previous output directories, joined by wait_for_cleanup
+CLEANUP_THREADS = list()
+
+
+def copy_file(source_filepath: str = None,
+              target_filepath: str = None,
+              link: bool = False) -> None:
+    """
+    Copy a file without reading it in user space: hardlink if requested and possible, otherwise in-kernel copy
+    (copy_file_range, which may share blocks on copy-on-write file systems, or sendfile). An existing target file is
+    removed first, so that a previously linked target never writes through to its source, and a failed copy leaves
+    no partial target file.
+
+    Args:
+        source_filepath (str): source filepath
+        target_filepath (str): target filepath
+        link (bool): hardlink the target to the source instead of copying it
+
+    Returns:
+        None
+    """
+
+    if os.path.lexists(target_filepath):
+        os.remove(target_filepath)
+
+    if link:
+        try:
+            os.link(source_filepath, target_filepath)
+            return
+        except OSError:
+            # Falling back to a copy (other file system, unsupported links)
+            pass
+
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(source_filepath, "rb") as input_file, open(target_filepath, "wb") as output_file:
+                while os.copy_file_range(input_file.fileno(), output_file.fileno(), 1 << 30) > 0:
+                    pass
+            return
+        except OSError:
+            # Removing the partial copy, then falling back to shutil, which uses sendfile when available
+            if os.path.lexists(target_filepath):
+                os.remove(target_filepath)
+
+    try:
+        shutil.copyfile(source_filepath, target_filepath)
+    except BaseException:
+        if os.path.lexists(target_filepath):
+            os.remove(target_filepath)
+        raise
+
+
+def create_staging_dir(target_dir: str = None) -> str:
+    """
+    Create an empty staging directory next to a target directory, on the same file system so that it can be renamed
+    to the target directory once completed
+
+    Args:
+        target_dir (str): target directory path
+
+    Returns:
+        str: staging directory path
+    """
+
+    target_dir = os.path.abspath(target_dir)
+    ensure_dir(os.path.dirname(target_dir))
+
+    staging_dir = os.path.join(
+        os.path.dirname(target_dir),
+        ".{}.staging-{}-{}".format(os.path.basename(target_dir), os.getpid(), time.time_ns())
+    )
+    os.makedirs(staging_dir)
+
+    # Previous directories whose deletion was interrupted by the end of an earlier run are removed while converting
+    remove_previous_dirs(target_dir)
+
+    return staging_dir
 
 
 def ensure_dir(dir_path: str = None):
@@ -54,3 +138,123 @@ def remove_abs(path: str = None):
         return path.lstrip("/")
     else:
         return path
+
+
+def remove_previous_dirs(target_dir: str = None) -> threading.Thread:
+    """
+    Delete the previous versions of a target directory renamed aside by swap_dir ('.<name>.previous-*') in a daemon
+    thread, registered for wait_for_cleanup. A deletion interrupted before it completes (e.g. by Ctrl+C) leaves its
+    directory in place, to be deleted by the next call.
+
+    Args:
+        target_dir (str): target directory path
+
+    Returns:
+        threading.Thread: thread deleting the previous directories
+    """
+
+    target_dir = os.path.abspath(target_dir)
+
+    previous_dirs = sorted(glob.glob(os.path.join(
+        os.path.dirname(target_dir), ".{}.previous-*".format(glob.escape(os.path.basename(target_dir)))
+    )))
+
+    def remove_dirs():
+        for previous_dir in previous_dirs:
+            shutil.rmtree(previous_dir, ignore_errors=True)
+
+    cleaner = threading.Thread(target=remove_dirs, name="cleanup-{}".format(os.path.basename(target_dir)), daemon=True)
+    cleaner.start()
+
+    CLEANUP_THREADS.append(cleaner)
+
+    return cleaner
+
+
+@contextmanager
+def staged_dir(target_dir: str = None):
+    """
+    Context manager yielding a staging directory which replaces the target directory when the block succeeds (see
+    swap_dir). If the block fails, the staging directory is removed and the target directory is left untouched.
+
+    Args:
+        target_dir (str): target directory path
+
+    Returns:
+        str: staging directory path
+    """
+
+    staging_dir = create_staging_dir(target_dir)
+
+    try:
+        yield staging_dir
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    swap_dir(staging_dir, target_dir)
+
+
+def swap_dir(staging_dir: str = None,
+             target_dir: str = None) -> threading.Thread:
+    """
+    Replace a target directory by a completed staging directory with two renames: the target directory is renamed
+    aside, then the staging directory takes its place. Each rename is atomic on a single file system but the swap is
+    not: between both renames, the target path briefly does not exist. A reader never sees a partial directory. The
+    previous target directory is deleted in a daemon thread (see remove_previous_dirs and wait_for_cleanup).
+
+    Args:
+        staging_dir (str): staging directory path
+        target_dir (str): target directory path
+
+    Returns:
+        threading.Thread: thread deleting the previous target directory, None if there was none
+    """
+
+    target_dir = os.path.abspath(target_dir)
+
+    if not os.path.isdir(target_dir):
+        os.rename(staging_dir, target_dir)
+        return None
+
+    previous_dir = os.path.join(
+        os.path.dirname(target_dir),
+        ".{}.previous-{}-{}".format(os.path.basename(target_dir), os.getpid(), time.time_ns())
+    )
+
+    os.rename(target_dir, previous_dir)
+    os.rename(staging_dir, target_dir)
+
+    logging.info("Removing previous output directory: {}".format(previous_dir))
+
+    return remove_previous_dirs(target_dir)
+
+
+def translate_newlines(content: str = None):
+    """
+    Translate '\\r\\n' and '\\r' line breaks to '\\n', as done when reading a file in text mode with universal newlines
+
+    Args:
+        content (str): input content
+
+    Returns:
+        str: content with '\\n' line breaks only
+    """
+
+    if "\r" not in content:
+        return content
+
+    return content.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def wait_for_cleanup() -> None:
+    """
+    Wait for the deletion of the previous output directories started by create_staging_dir and swap_dir, so that no
+    previous version is left on disk once a command is completed
+
+    Returns:
+        None
+    """
+
+    while CLEANUP_THREADS:
+        CLEANUP_THREADS.pop().join()
@@ -0,0 +1,193 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from lxml import etree
+
+from .anafora import correct_span, extract_anafora_entities, extract_anafora_relations, get_corrected_txt_content, \
+    get_offset_map, map_entity_spans, plan_anafora_documents
+from .graph import RelationGraph
+from .utils import translate_newlines
+
+
+def validate_anafora_dir(input_anafora_path: str = None,
+                         input_thyme_path: str = None,
+                         preproc_file_path: str = None,
+                         precedence: list = None,
+                         n_jobs: int = 1) -> dict:
+    """
+    Run the anafora-to-brat conversion checks on a THYME corpus part without writing anything to disk.
+    All violations are collected instead of stopping at the first one.
+
+    Args:
+        input_anafora_path (str): annotation path (anafora format)
+        input_thyme_path (str): corpus path (text format)
+        preproc_file_path (str): preprocessing filepath (json format)
+        precedence (list): annotation file kinds by decreasing priority (see DEFAULT_PRECEDENCE)
+        n_jobs (int): number of worker processes
+
+    Returns:
+        dict: validation report with checked and skipped documents and the list of violations
+    """
+
+    # Loading json content
+    preproc_payload = json.load(open(os.path.abspath(preproc_file_path), "r", encoding="UTF-8"))
+
+    work_items, _ = plan_anafora_documents(input_anafora_path, precedence)
+
+    tasks = [
+        (document_id, source_anafora_file, os.path.join(os.path.abspath(input_thyme_path), document_id))
+        for document_id, source_anafora_file in work_items
+    ]
+
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(
+                validate_document,
+                *zip(*tasks),
+                [preproc_payload] * len(tasks),
+                chunksize=max(1, len(tasks) // (n_jobs * 4))
+            ))
+    else:
+        results = [validate_document(*task, preproc_payload) for task in tasks]
+
+    report = {
+        "checked": list(),
+        "skipped": list(),
+        "violations": list()
+    }
+
+    for (document_id, _, _), (is_skipped, violations) in zip(tasks, results):
+        if is_skipped:
+            report["skipped"].append(document_id)
+        else:
+            report["checked"].append(document_id)
+
+        report["violations"].extend(violations)
+
+    return report
+
+
+def validate_document(document_id: str = None,
+                      source_anafora_file: str = None,
+                      source_txt_file: str = None,
+                      preproc_payload: dict = None) -> (bool, list):
+    """
+    Run the anafora-to-brat conversion checks on a THYME corpus document: progress value, adjudication leftovers,
+    entity spans (bounds and line breaks after correction), relation arguments and temporal consistency of the
+    relations (see RelationGraph).
+
+    Args:
+        document_id (str): document ID
+        source_anafora_file (str): document annotation filepath (anafora format)
+        source_txt_file (str): document filepath (text format)
+        preproc_payload (dict): preprocessing file content
+
+    Returns:
+        (bool, list): 'True' if the document is skipped because its annotation is in progress, and violations
+    """
+
+    violations = list()
+
+    def add_violation(check, message):
+        violations.append({
+            "document": document_id,
+            "file": os.path.basename(source_anafora_file),
+            "check": check,
+            "message": message
+        })
+
+    # Parsing xml file once for all checks
+    try:
+        root = etree.parse(source_anafora_file).getroot()
+    except etree.XMLSyntaxError as e:
+        add_violation("xml", "Invalid xml file: {}".format(e))
+        return False, violations
+
+    # Checking annotation progress
+    progress = root.find("./info/progress")
+    progress_value = progress.text if progress is not None else None
+
+    if progress_value == "in-progress":
+        return True, violations
+
+    if progress_value != "completed":
+        add_violation("progress", "Invalid progress value: {}".format(progress_value))
+
+    # Checking adjudication leftovers
+    adjudication = root.find("./adjudication")
+    if adjudication is not None and len(adjudication) > 0:
+        add_violation("adjudication", "The file is marked as 'completed' but contains adjudication annotations")
+
+    # Checking entity spans against the corrected document content
+    try:
+        entities = extract_anafora_entities(root)
+    except Exception as e:
+        add_violation("entity", "Malformed entity: {}".format(e))
+        entities = None
+
+    if entities is not None:
+
+        # Moving entity spans to the corrected text if corrections changed its length
+        offset_map = get_offset_map(document_id, preproc_payload)
+        if not offset_map.is_identity():
+            map_entity_spans(entities, "span", offset_map.spans_to_corrected)
+
+        try:
+            content = translate_newlines(get_corrected_txt_content(source_txt_file, preproc_payload))
+        except (OSError, UnicodeDecodeError) as e:
+            add_violation("text", "Unable to read text file: {}".format(e))
+            content = None
+
+        for entity in entities if content is not None else []:
+            for begin, end in sorted(entity["span"]):
+                if begin < 0 or end > len(content) or begin > end:
+                    add_violation("span", "Span {},{} of entity {} is out of the document bounds ({})".format(
+                        begin, end, entity["id"], len(content)
+                    ))
+                    continue
+
+                begin, end, _ = correct_span(begin, end, content)
+                if "\n" in content[begin:end]:
+                    add_violation("span", "There is a sentence break in the middle of entity {}: {}".format(
+                        entity["id"], repr(content[begin:end])
+                    ))
+
+    # Checking relation arguments
+    try:
+        relations = extract_anafora_relations(root)
+    except Exception as e:
+        add_violation("relation", "Malformed relation: {}".format(e))
+        relations = list()
+
+    entity_ids = {entity["id"] for entity in entities} if entities is not None else None
+
+    for relation in relations:
+        for prop_name in ["Source", "Target", "Type"]:
+            if relation["properties"].get(prop_name) is None:
+                add_violation("relation", "Relation {} has no {} property".format(relation["id"], prop_name))
+
+        if entity_ids is None:
+            continue
+
+        for prop_name in ["Source", "Target"]:
+            entity_id = relation["properties"].get(prop_name)
+            if entity_id is not None and entity_id not in entity_ids:
+                add_violation("relation", "{} entity {} of relation {} does not exist".format(
+                    prop_name, entity_id, relation["id"]
+                ))
+
+    # Checking temporal consistency, relations contradicting the closure of the previous ones are reported
+    graph = RelationGraph()
+
+    for relation in relations:
+        source, relation_type, target = (relation["properties"].get(key) for key in ["Source", "Type", "Target"])
+        if source is None or relation_type is None or target is None:
+            continue
+
+        if not graph.add_relation(source, relation_type, target, kind=relation["type"]):
+            add_violation("temporal", "Relation {} ({} {} {}) contradicts the previous relations: {}".format(
+                relation["id"], source, relation_type, target, graph.contradictions[-1][3]
+            ))
+
+    return False, violations
@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import time
+
+from .anafora import convert_anafora_document, is_in_progress, plan_anafora_documents
+from .brat import get_ann_vocabulary, merge_vocabularies, write_confs
+
+
+def get_anafora_file_states(input_anafora_path: str = None,
+                            precedence: list = None) -> dict:
+    """
+    Fetch the annotation file selected for each document of a directory, with its modification time and size
+
+    Args:
+        input_anafora_path (str): annotation path (anafora format)
+        precedence (list): annotation file kinds by decreasing priority (see DEFAULT_PRECEDENCE)
+
+    Returns:
+        dict: (anafora filepath, modification time, size) by document ID
+    """
+
+    file_states = dict()
+
+    work_items, _ = plan_anafora_documents(input_anafora_path, precedence)
+
+    for document_id, filepath in work_items:
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            # The file was removed between listing and stat, it will be handled at the next scan
+            continue
+
+        file_states[document_id] = (filepath, stat.st_mtime_ns, stat.st_size)
+
+    return file_states
+
+
+def remove_brat_document(document_id: str = None,
+                         output_brat_path: str = None) -> None:
+    """
+    Remove the brat files (txt and ann) of a document
+
+    Args:
+        document_id (str): document ID
+        output_brat_path (str): brat directory path
+
+    Returns:
+        None
+    """
+
+    for extension in ["ann", "txt"]:
+        filepath = os.path.join(os.path.abspath(output_brat_path), "{}.{}".format(document_id, extension))
+        if os.path.isfile(filepath):
+            os.remove(filepath)
+
+
+def watch_anafora_dir(input_anafora_path: str = None,
+                      input_thyme_path: str = None,
+                      output_brat_path: str = None,
+                      preproc_file_path: str = None,
+                      precedence: list = None,
+                      interval: float = 0.5,
+                      max_iterations: int = None) -> None:
+    """
+    Watch a THYME corpus part and convert documents to brat format as soon as their annotation is completed.
+    Only documents whose anafora file changed since the last scan are converted. Brat configuration files are
+    rewritten only when the vocabulary of the directory changes.
+
+    Args:
+        input_anafora_path (str): annotation path (anafora format)
+        input_thyme_path (str): corpus path (text format)
+        output_brat_path (str): output path where brat files will be created
+        preproc_file_path (str): preprocessing filepath (json format)
+        precedence (list): annotation file kinds by decreasing priority (see DEFAULT_PRECEDENCE)
+        interval (float): delay between two directory scans (seconds)
+        max_iterations (int): number of scans before returning, watch forever if None
+
+    Returns:
+        None
+    """
+
+    # Loading json content
+    preproc_payload = json.load(open(os.path.abspath(preproc_file_path), "r", encoding="UTF-8"))
+
+    known_states = dict()
+    failed_states = dict()
+    vocabularies = dict()
+    current_vocabulary = None
+
+    iteration = 0
+
+    while max_iterations is None or iteration < max_iterations:
+
+        file_states = get_anafora_file_states(input_anafora_path, precedence)
+
+        # Removing brat documents whose anafora file disappeared
+        for document_id in set(known_states) - set(file_states):
+            logging.info("Removing document {}. Reason: annotation file removed.".format(document_id))
+
+            remove_brat_document(document_id, output_brat_path)
+            vocabularies.pop(document_id, None)
+            del known_states[document_id]
+
+        for document_id in set(failed_states) - set(file_states):
+            del failed_states[document_id]
+
+        # Converting new and modified documents, or documents whose selected annotation file changed. The state of a
+        # document is recorded once it is handled, failing documents are converted again at the next scan.
+        for document_id, state in sorted(file_states.items()):
+            if known_states.get(document_id) == state:
+                continue
+
+            source_anafora_file = state[0]
+            filename = os.path.basename(source_anafora_file)
+
+            try:
+                # Removing documents that went back to 'in-progress'
+                if is_in_progress(source_anafora_file):
+                    if document_id in vocabularies:
+                        logging.info("Removing document {}. Reason: annotation in progress.".format(document_id))
+                        remove_brat_document(document_id, output_brat_path)
+                        del vocabularies[document_id]
+                    else:
+                        logging.info("Skipping file {}. Reason: annotation in progress.".format(filename))
+
+                    known_states[document_id] = state
+                    failed_states.pop(document_id, None)
+                    continue
+
+                nb = convert_anafora_document(
+                    source_anafora_file,
+                    os.path.join(os.path.abspath(input_thyme_path), document_id),
+                    output_brat_path,
+                    preproc_payload
+                )
+
+            except Exception as e:
+                # The file may be saved while we are reading it. Its previous brat output is removed, so that it does
+                # not stay in the directory as if it were up to date, and the failure is logged once per file state.
+                if failed_states.get(document_id) != state:
+                    logging.info("Skipping file {}. Reason: {}".format(filename, e))
+                    failed_states[document_id] = state
+
+                remove_brat_document(document_id, output_brat_path)
+                vocabularies.pop(document_id, None)
+                known_states.pop(document_id, None)
+                continue
+
+            vocabularies[document_id] = get_ann_vocabulary(
+                os.path.join(os.path.abspath(output_brat_path), "{}.ann".format(document_id))
+            )
+
+            known_states[document_id] = state
+            failed_states.pop(document_id, None)
+
+            logging.info("Converted document {} (corrected entities: {})".format(document_id, nb))
+
+        # Rewriting brat configuration files if the vocabulary changed
+        vocabulary = (set(), dict(), set())
+        for document_vocabulary in vocabularies.values():
+            merge_vocabularies(vocabulary, document_vocabulary)
+
+        if vocabulary != current_vocabulary:
+            write_confs(vocabulary[0], vocabulary[1], vocabulary[2], os.path.abspath(output_brat_path))
+            current_vocabulary = vocabulary
+
+        iteration += 1
+
+        if max_iterations is None or iteration < max_iterations:
+            time.sleep(interval)